@@ -3,6 +3,7 @@ import redis
 import logging
 from logging.handlers import RotatingFileHandler
 from flask import Flask, jsonify, current_app
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_pymongo import PyMongo
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -10,6 +11,8 @@ from flask_bcrypt import Bcrypt
 from flasgger import Swagger
 from config import Config
 from .celery_utils import create_celery_app
+from .utils import get_redis
+from .serialization import ORJSONProvider
 
 
 # Initialize extensions globally, but without app context yet
@@ -26,8 +29,8 @@ def check_if_token_in_blocklist(jwt_header, jwt_payload):
     """
     jti = jwt_payload["jti"]
     try:
-        # Use Flask's current_app context proxy to access config safely
-        redis_conn = redis.from_url(current_app.config['BROKER_URL'])
+        # Shared client (connection pool) instead of a new connection per request
+        redis_conn = get_redis()
         token_is_blocked = redis_conn.get(f"jti:{jti}")
         return token_is_blocked is not None
     except Exception as e:
@@ -36,17 +39,97 @@ def check_if_token_in_blocklist(jwt_header, jwt_payload):
         return False
 # --- END FIX 1 ---
 
+def create_indexes(app):
+    """Create the MongoDB indexes the app relies on. Failures are logged, never fatal."""
+    from .services.sync_service import TOMBSTONE_TTL_DAYS
+    try:
+        mongo.db.users.create_index("email", unique=True)
+        # One verified account per WhatsApp number; resolves inbound senders
+        mongo.db.users.create_index(
+            "whatsapp_e164",
+            unique=True,
+            partialFilterExpression={"whatsapp_verified": True, "whatsapp_e164": {"$exists": True}}
+        )
+        mongo.db.transactions.create_index("user_id")
+        mongo.db.transactions.create_index("date")
+        # WhatsApp message deduplication
+        mongo.db.whatsapp_messages.create_index("message_sid", unique=True)
+        mongo.db.whatsapp_messages.create_index([("created_at", 1)], expireAfterSeconds=86400)  # Auto-delete after 24h
+        # WhatsApp budget alerts
+        mongo.db.whatsapp_alerts.create_index([("user_id", 1), ("category", 1), ("created_at", 1)])
+        mongo.db.whatsapp_alerts.create_index("created_at", expireAfterSeconds=2 * 86400)  # Dedupe records only matter for a day
+        # Per-user date ranges (summaries, listings sorted by date)
+        mongo.db.transactions.create_index([("user_id", 1), ("date", -1)])
+        # Per-category spend (budgets, alerts)
+        mongo.db.transactions.create_index([("user_id", 1), ("category", 1), ("date", 1)])
+        # Short per-user references used by WhatsApp /delete and /edit
+        mongo.db.transactions.create_index(
+            [("user_id", 1), ("short_ref", 1)],
+            unique=True,
+            partialFilterExpression={"short_ref": {"$exists": True}}
+        )
+        # Delta sync (/api/transactions/changes): changes in (updated_at, _id) order
+        mongo.db.transactions.create_index([("user_id", 1), ("updated_at", 1), ("_id", 1)])
+        mongo.db.budgets.create_index([("user_id", 1), ("updated_at", 1), ("_id", 1)])
+        mongo.db.transaction_tombstones.create_index([("user_id", 1), ("updated_at", 1), ("_id", 1)])
+        mongo.db.transaction_tombstones.create_index("deleted_at", expireAfterSeconds=TOMBSTONE_TTL_DAYS * 86400)
+        # Near-duplicate lookup at insert time: same hash within a short date window
+        mongo.db.transactions.create_index(
+            [("dup_hash", 1), ("date", 1)],
+            partialFilterExpression={"dup_hash": {"$exists": True}}
+        )
+        # Running month spend per (user, category) for budget alerts, rebuilt daily
+        mongo.db.category_spend.create_index([("user_id", 1), ("category", 1), ("year", 1), ("month", 1)], unique=True)
+        mongo.db.category_spend.create_index("expires_at", expireAfterSeconds=0)
+        # Recent amounts per (user, category) for anomaly scoring
+        mongo.db.category_stats.create_index([("user_id", 1), ("category", 1)], unique=True)
+        # Recurring transaction series: per-user lookup, reminders due tomorrow, stale series expiry
+        mongo.db.recurring_items.create_index([("user_id", 1), ("key", 1)], unique=True)
+        mongo.db.recurring_items.create_index([("active", 1), ("next_expected", 1)])
+        mongo.db.recurring_items.create_index("expires_at", expireAfterSeconds=0)
+        # Outbound WhatsApp delivery tracking (keyed by Twilio SID)
+        mongo.db.whatsapp_outbound.create_index([("created_at", 1)], expireAfterSeconds=7 * 86400)  # Auto-delete after 7 days
+    except Exception as e:
+        app.logger.error(f"Error creating MongoDB indexes: {e}")
+        # Depending on severity, you might want to raise the error
+        # or handle it gracefully if indexes failing isn't critical at startup.
+
+    # Unique indexes that fail while older data still has duplicates. Each is
+    # created on its own, so one failing never stops the others.
+    unique_indexes = [
+        # A WhatsApp message can never create two transactions (older data: `flask dedupe-message-sids`)
+        (mongo.db.transactions, "message_sid", {"sparse": True}),
+        # One budget per category and month, upserted on by create/bulk/roll-forward (`flask dedupe-budgets`)
+        (mongo.db.budgets, [("user_id", 1), ("year", 1), ("month", 1), ("category", 1)], {}),
+    ]
+    for collection, keys, options in unique_indexes:
+        try:
+            collection.create_index(keys, unique=True, **options)
+        except Exception as e:
+            app.logger.error(f"Error creating unique index on {collection.name}: {e}")
+
+
 def create_app():
     global celery
     
     app = Flask(__name__)
     app.config.from_object(Config)
+
+    # Trust X-Forwarded-For/-Proto from our own proxies so rate limits see the real
+    # client IP and Twilio signatures are checked against the public https URL
+    if app.config['TRUSTED_PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'], x_proto=app.config['TRUSTED_PROXY_COUNT']
+        )
     
     # Initialize extensions WITH the app context
     mongo.init_app(app)
     jwt.init_app(app)
     bcrypt.init_app(app)
     celery = create_celery_app(app)
+    # jsonify/success_response serialize ObjectId, datetime and Decimal via orjson.
+    # Set after mongo.init_app(), which installs its own (bson json_util) provider.
+    app.json = ORJSONProvider(app)
 
     # --- FIX 2: Register the blocklist loader AFTER jwt.init_app() ---
     jwt.token_in_blocklist_loader(check_if_token_in_blocklist)
@@ -59,6 +142,8 @@ def create_app():
         from .budgets.routes import budgets_bp 
         from .ai.routes import ai_bp
         from .whatsapp.routes import whatsapp_bp
+        from .admin.routes import admin_bp
+        from .dashboard.routes import dashboard_bp
         
         # Configure CORS for all blueprints
         allowed_origins = [
@@ -71,6 +156,7 @@ def create_app():
         CORS(budgets_bp, origins=allowed_origins, supports_credentials=True)
         CORS(ai_bp, origins=allowed_origins, supports_credentials=True)
         CORS(whatsapp_bp, origins=allowed_origins, supports_credentials=True)
+        CORS(dashboard_bp, origins=allowed_origins, supports_credentials=True)
         
         # Register blueprints
         app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -78,6 +164,8 @@ def create_app():
         app.register_blueprint(budgets_bp, url_prefix='/api/budgets')
         app.register_blueprint(ai_bp, url_prefix='/api/ai')
         app.register_blueprint(whatsapp_bp)
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+        app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
         
         # Swagger API Documentation
         swagger_config = {
@@ -127,21 +215,11 @@ def create_app():
         
         Swagger(app, config=swagger_config, template=swagger_template)
         
-        # Create database indexes
-        try:
-            mongo.db.users.create_index("email", unique=True)
-            mongo.db.transactions.create_index("user_id")
-            mongo.db.transactions.create_index("date")
-            mongo.db.budgets.create_index([("user_id", 1), ("month", 1), ("year", 1)])
-            # WhatsApp message deduplication
-            mongo.db.whatsapp_messages.create_index("message_sid", unique=True)
-            mongo.db.whatsapp_messages.create_index([("created_at", 1)], expireAfterSeconds=86400)  # Auto-delete after 24h
-            # WhatsApp budget alerts
-            mongo.db.whatsapp_alerts.create_index([("user_id", 1), ("category", 1), ("created_at", 1)])
-        except Exception as e:
-            app.logger.error(f"Error creating MongoDB indexes: {e}")
-            # Depending on severity, you might want to raise the error
-            # or handle it gracefully if indexes failing isn't critical at startup.
+        # CLI maintenance commands (e.g. `flask migrate-whatsapp-e164`)
+        from .commands import register_commands
+        register_commands(app)
+        
+        create_indexes(app)
 
         # Basic routes
         @app.route('/', methods=['GET'])
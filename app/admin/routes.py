@@ -0,0 +1,31 @@
+from flask import Blueprint, request
+
+from app.utils import success_response, error_response, cron_secret_required
+from app.services.whatsapp_delivery_service import get_delivery_stats
+from app.services.cache_service import get_cache_stats
+
+admin_bp = Blueprint('admin_bp', __name__)
+
+
+@admin_bp.route('/whatsapp/delivery-stats', methods=['GET'])
+@cron_secret_required
+def whatsapp_delivery_stats():
+    """
+    Delivery metrics for outbound WhatsApp messages: status counts, failures
+    by Twilio error code and send->delivered latency percentiles.
+    Query param `hours` sets the window (default 24, max 168).
+    """
+    hours = request.args.get('hours', 24, type=int)
+    if hours < 1 or hours > 168:
+        return error_response("hours must be between 1 and 168", 400)
+
+    return success_response(get_delivery_stats(hours))
+
+
+@admin_bp.route('/cache-stats', methods=['GET'])
+@cron_secret_required
+def cache_stats():
+    """
+    Hit/miss counters and hit rate of the per-user read cache, per endpoint.
+    """
+    return success_response(get_cache_stats())
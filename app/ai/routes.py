@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 from app import celery, mongo
 from app.utils import success_response, error_response
 from app.transactions.tasks import get_ai_summary_task
+from app.services.rate_limiter import rate_limit, key_by_user
 from bson import ObjectId
 
 ai_bp = Blueprint('ai_bp', __name__)
@@ -14,6 +15,8 @@ active_summary_tasks = {}  # {user_id: {"task_id": str, "started_at": datetime}}
 
 @ai_bp.route('/summary', methods=['POST'])
 @jwt_required()
+@rate_limit('ai_summary', limit=10, period=3600, key_func=key_by_user,
+            message="Too many AI summary requests. Please try again later.")
 def trigger_ai_summary():
     """
     Triggers the Celery task to generate an AI spending summary.
@@ -2,8 +2,8 @@ from flask import Blueprint, request, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
 from pydantic import ValidationError
 from datetime import datetime, timezone, timedelta
-import redis
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import re
 import random
 import string
@@ -11,8 +11,11 @@ from app import mongo, bcrypt
 from app.tasks.email_tasks import send_email_task
 from app.models.user import User
 from app.services.twilio_service import twilio_service
+from app.whatsapp.handlers import invalidate_sender_cache
+from app.services.rate_limiter import rate_limit, key_by_ip, key_by_user, key_by_email
+from app.services.cache_service import invalidate_user_cache, cached_per_user
 from .schemas import RegisterSchema, LoginSchema
-from app.utils import success_response, error_response, generate_reset_token, verify_reset_token
+from app.utils import success_response, error_response, generate_reset_token, verify_reset_token, get_redis
 
 auth_bp = Blueprint('auth_bp', __name__)
 
@@ -40,6 +43,8 @@ def validate_password_strength(password):
     return True, ""
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register', limit=5, period=3600, key_func=key_by_ip,
+            message="Too many registration attempts. Please try again later.")
 def register():
     try:
         data = RegisterSchema(**request.get_json())
@@ -64,16 +69,16 @@ def register():
     return success_response({"message": "User registered successfully."}, 201)
 
 @auth_bp.route('/login', methods=['POST'])
+# FIX #28: Real rate limiting, checked before any Mongo lookup or bcrypt work
+@rate_limit('login', limit=10, period=60, key_func=key_by_ip,
+            message="Too many login attempts. Please try again later.")
+@rate_limit('login', limit=5, period=300, key_func=key_by_email,
+            message="Too many login attempts. Please try again later.")
 def login():
     try:
         data = LoginSchema(**request.get_json())
     except ValidationError as e:
-        # ADDED: Check for rate limit error (FIX #28)
-        error_list = e.errors()
-        for err in error_list:
-            if "rate limit" in str(err).lower() or "too many" in str(err).lower():
-                return error_response("Too many login attempts. Please try again later.", 429)
-        return error_response(error_list, 400)
+        return error_response(e.errors(), 400)
 
     # FIX #25: Email case normalization (already done with .lower())
     email_normalized = data.email.lower()
@@ -106,7 +111,7 @@ def logout():
     time_to_live = round(exp_timestamp - now.timestamp())
 
     try:
-        redis_conn = redis.from_url(current_app.config['BROKER_URL'])
+        redis_conn = get_redis()
         
         if time_to_live > 0:
             redis_conn.setex(f"jti:{jti}", time_to_live, "blocked")
@@ -126,6 +131,10 @@ def refresh():
 
 
 @auth_bp.route('/forgot-password', methods=['POST'])
+@rate_limit('forgot_password', limit=5, period=3600, key_func=key_by_ip,
+            message="Too many password reset requests. Please try again later.")
+@rate_limit('forgot_password', limit=3, period=3600, key_func=key_by_email,
+            message="Too many password reset requests. Please try again later.")
 def forgot_password():
     """
     Sends a password reset email to the user.
@@ -233,6 +242,7 @@ def reset_password():
 
 @auth_bp.route('/profile', methods=['GET', 'POST'])
 @jwt_required()
+@cached_per_user('profile')
 def profile():
     current_user_id = get_jwt_identity()
     user_object_id = ObjectId(current_user_id)
@@ -254,13 +264,12 @@ def profile():
             return error_response("Income must be a valid number", 400)
             
         mongo.db.users.update_one({"_id": user_object_id}, {"$set": {"income": income}})
+        invalidate_user_cache(current_user_id)
         updated_user = mongo.db.users.find_one({"_id": user_object_id})
-        updated_user['_id'] = str(updated_user['_id'])
         return success_response(updated_user)
 
     user = mongo.db.users.find_one({"_id": user_object_id}, {"password": 0})
     if user:
-        user['_id'] = str(user['_id'])
         if 'income' not in user:
             user['income'] = 0
         return success_response(user)
@@ -270,6 +279,8 @@ def profile():
 
 @auth_bp.route('/send-whatsapp-code', methods=['POST'])
 @jwt_required()
+@rate_limit('whatsapp_code', limit=3, period=3600, key_func=key_by_user,
+            message="Too many verification codes requested. Please try again in 1 hour.")
 def send_whatsapp_code():
     """
     Send a WhatsApp verification code to the user's phone number.
@@ -279,25 +290,6 @@ def send_whatsapp_code():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
-    # Rate limiting: Check if user can request a new code
-    try:
-        redis_conn = redis.from_url(current_app.config['BROKER_URL'])
-        rate_limit_key = f"whatsapp_code_rate:{current_user_id}"
-        
-        # Check current request count
-        current_count = redis_conn.get(rate_limit_key)
-        if current_count and int(current_count) >= 3:
-            return error_response("Too many verification codes requested. Please try again in 1 hour.", 429)
-        
-        # Increment rate limit counter
-        pipe = redis_conn.pipeline()
-        pipe.incr(rate_limit_key)
-        pipe.expire(rate_limit_key, 3600)  # 1 hour expiry
-        pipe.execute()
-    except Exception as e:
-        current_app.logger.warning(f"Rate limit check failed: {e}")
-        # Continue without rate limiting if Redis fails
-    
     whatsapp_number = data.get('whatsapp_number')
     if not whatsapp_number:
         return error_response("WhatsApp number is required.", 400)
@@ -313,7 +305,7 @@ def send_whatsapp_code():
     
     # Check if this number is already linked to another user
     existing_user = mongo.db.users.find_one({
-        "whatsapp_number": whatsapp_number,
+        "whatsapp_e164": twilio_service.normalize_phone_number(whatsapp_number),
         "whatsapp_verified": True,
         "_id": {"$ne": ObjectId(current_user_id)}  # Exclude current user
     })
@@ -326,7 +318,7 @@ def send_whatsapp_code():
     
     # Store code in user document
     try:
-        mongo.db.users.update_one(
+        previous = mongo.db.users.find_one_and_update(
             {"_id": ObjectId(current_user_id)},
             {
                 "$set": {
@@ -335,8 +327,13 @@ def send_whatsapp_code():
                     "whatsapp_code_expires": expires_at + timedelta(minutes=10),
                     "whatsapp_verified": False
                 }
-            }
+            },
+            projection={"whatsapp_e164": 1}
         )
+        # The previously linked number (if any) no longer resolves to this user
+        if previous and previous.get("whatsapp_e164"):
+            invalidate_sender_cache(previous["whatsapp_e164"])
+        invalidate_user_cache(current_user_id)
     except Exception as e:
         current_app.logger.error(f"Error storing WhatsApp code: {e}")
         return error_response("Failed to send verification code.", 500)
@@ -394,14 +391,26 @@ def verify_whatsapp():
         if datetime.now(timezone.utc) > expires_at:
             return error_response("Verification code has expired. Please request a new one.", 400)
     
+    # Canonical E.164 number, used to resolve incoming WhatsApp messages
+    whatsapp_e164 = twilio_service.normalize_phone_number(user.get('whatsapp_number'))
+    if not whatsapp_e164:
+        return error_response("Invalid phone number format.", 400)
+    
     # Mark as verified and clear the code
-    mongo.db.users.update_one(
-        {"_id": ObjectId(current_user_id)},
-        {
-            "$set": {"whatsapp_verified": True},
-            "$unset": {"whatsapp_code": "", "whatsapp_code_expires": ""}
-        }
-    )
+    try:
+        mongo.db.users.update_one(
+            {"_id": ObjectId(current_user_id)},
+            {
+                "$set": {"whatsapp_verified": True, "whatsapp_e164": whatsapp_e164},
+                "$unset": {"whatsapp_code": "", "whatsapp_code_expires": ""}
+            }
+        )
+    except DuplicateKeyError:
+        # Unique partial index: the number was verified by another account meanwhile
+        return error_response("This WhatsApp number is already linked to another account.", 400)
+    
+    invalidate_sender_cache(whatsapp_e164)
+    invalidate_user_cache(current_user_id)
     
     return success_response({
         "message": "WhatsApp successfully linked to your account!",
@@ -1,15 +1,42 @@
+import json
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from datetime import datetime
 
 from app import mongo
-from app.utils import success_response, error_response
-from .schemas import BudgetSchema
+from app.utils import success_response, error_response, cron_secret_required
+from app.services.budget_service import recent_months, budget_overview_pipeline
+from app.services.forecast_service import get_spend_forecast
+from app.services.cache_service import invalidate_user_cache, cached_per_user, etag_per_user
+from .schemas import BudgetSchema, BulkBudgetSchema
+from .tasks import roll_forward_budgets_task, compute_budget_forecasts_task
 
 budgets_bp = Blueprint('budgets_bp', __name__)
 
+MAX_OVERVIEW_MONTHS = 24
+
+
+def validate_budget_period(month, year, now):
+    """Budgets may be created for the current month up to a year ahead. Returns an error message or None."""
+    # Allow current month and next month only
+    if year < now.year:
+        return "Cannot create budgets for past years"
+    
+    if year == now.year and month < now.month:
+        return "Cannot create budgets for past months"
+    
+    if year > now.year + 1:
+        return "Cannot create budgets more than 1 year in advance"
+    
+    if year == now.year + 1 and month > now.month:
+        return "Cannot create budgets more than 1 year in advance"
+    return None
+
+
 @budgets_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_budget():
@@ -31,56 +58,128 @@ def create_budget():
     data.limit = round(data.limit, 2)
 
     # FIX #10: Validate month/year not in past or too far in future
-    current_date = datetime.utcnow()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    # Allow current month and next month only
-    if data.year < current_year:
-        return error_response("Cannot create budgets for past years", 400)
-    
-    if data.year == current_year and data.month < current_month:
-        return error_response("Cannot create budgets for past months", 400)
-    
-    if data.year > current_year + 1:
-        return error_response("Cannot create budgets more than 1 year in advance", 400)
-    
-    if data.year == current_year + 1 and data.month > current_month:
-        return error_response("Cannot create budgets more than 1 year in advance", 400)
-
-    # Check if a budget for this category/month/year already exists
-    existing_budget = mongo.db.budgets.find_one({
-        "user_id": user_id,
-        "category": data.category,
-        "month": data.month,
-        "year": data.year
-    })
-
-    if existing_budget:
+    now = datetime.utcnow()
+    period_error = validate_budget_period(data.month, data.year, now)
+    if period_error:
+        return error_response(period_error, 400)
+
+    # Upsert on the unique (user_id, category, month, year) index: unlike a
+    # find_one + insert_one, two concurrent requests can't both create it
+    try:
+        result = mongo.db.budgets.update_one(
+            {"user_id": user_id, "category": data.category, "month": data.month, "year": data.year},
+            {"$setOnInsert": {"limit": data.limit, "created_at": now, "updated_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        result = None
+
+    if result is None or result.upserted_id is None:
         return error_response(f"A budget for {data.category} in {data.month}/{data.year} already exists.", 409)
 
-    budget_doc = {
-        "user_id": user_id,
-        "category": data.category,
-        "limit": data.limit,
-        "month": data.month,
-        "year": data.year,
-        "created_at": datetime.utcnow()
-    }
-    
-    result = mongo.db.budgets.insert_one(budget_doc)
+    invalidate_user_cache(user_id)
     
     # Return the newly created document
-    new_budget = mongo.db.budgets.find_one({"_id": result.inserted_id})
-    new_budget['_id'] = str(new_budget['_id'])
-    new_budget['user_id'] = str(new_budget['user_id'])
+    new_budget = mongo.db.budgets.find_one({"_id": result.upserted_id})
     
     return success_response(new_budget, 201)
 
 
+@budgets_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def create_budgets_bulk():
+    """
+    Create several budgets (e.g. every category for a month) with one bulk_write.
+    Budgets that already exist are skipped, or get the new limit with
+    "replace": true. Each item is reported as created, updated or exists.
+    """
+    current_user_id = get_jwt_identity()
+    user_id = ObjectId(current_user_id)
+
+    try:
+        data = BulkBudgetSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e:
+        return error_response(json.loads(e.json()), 400)
+
+    now = datetime.utcnow()
+    for budget in data.budgets:
+        period_error = validate_budget_period(budget.month, budget.year, now)
+        if period_error:
+            return error_response(f"{budget.category} {budget.month}/{budget.year}: {period_error}", 400)
+
+    operations = []
+    for budget in data.budgets:
+        update = {"$setOnInsert": {"created_at": now, "updated_at": now}}
+        if data.replace:
+            update["$set"] = {"limit": round(budget.limit, 2), "updated_at": now}
+            del update["$setOnInsert"]["updated_at"]
+        else:
+            update["$setOnInsert"]["limit"] = round(budget.limit, 2)
+        operations.append(UpdateOne(
+            {"user_id": user_id, "category": budget.category, "month": budget.month, "year": budget.year},
+            update,
+            upsert=True
+        ))
+
+    try:
+        upserted = mongo.db.budgets.bulk_write(operations, ordered=False).upserted_ids
+    except BulkWriteError as e:
+        # Lost a race with a concurrent create of the same budget: it exists now
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        upserted = {item["index"]: item["_id"] for item in e.details["upserted"]}
+
+    existing_status = "updated" if data.replace else "exists"
+    results = [
+        {
+            "category": budget.category,
+            "month": budget.month,
+            "year": budget.year,
+            "status": "created" if index in upserted else existing_status
+        }
+        for index, budget in enumerate(data.budgets)
+    ]
+
+    if upserted or data.replace:
+        invalidate_user_cache(user_id)
+
+    return success_response({"created": len(upserted), "results": results}, 201 if upserted else 200)
+
+
+@budgets_bp.route('/cron/roll-forward', methods=['POST'])
+@cron_secret_required
+def roll_forward_budgets():
+    """
+    Cron endpoint copying last month's budgets into this month for every user
+    who hasn't set one (run on the 1st of each month). Optional JSON body
+    {"year": 2025, "month": 3} sets the target month. Only queues the job.
+    """
+    body = request.get_json(silent=True) or {}
+    year, month = body.get('year'), body.get('month')
+    if month is not None and (not isinstance(month, int) or not 1 <= month <= 12):
+        return error_response("month must be between 1 and 12", 400)
+    if year is not None and not isinstance(year, int):
+        return error_response("year must be an integer", 400)
+
+    task = roll_forward_budgets_task.delay(year, month)
+    return success_response({"message": "Budget roll-forward queued", "task_id": task.id}, 202)
+
+
+@budgets_bp.route('/cron/forecasts', methods=['POST'])
+@cron_secret_required
+def refresh_budget_forecasts():
+    """
+    Cron endpoint refreshing month-end forecast models for all users with
+    budgets (run nightly). Only queues the job.
+    """
+    task = compute_budget_forecasts_task.delay()
+    return success_response({"message": "Budget forecasts queued", "task_id": task.id}, 202)
+
 
 @budgets_bp.route('/', methods=['GET'])
 @jwt_required()
+@etag_per_user
+@cached_per_user('budgets')
 def get_budgets_with_spending():
     """
     Fetches all budgets for the current month and enriches them with the
@@ -143,9 +242,57 @@ def get_budgets_with_spending():
 
     result = list(mongo.db.budgets.aggregate(pipeline))
 
-    # Convert BSON types to strings for JSON response
-    for budget in result:
-        budget['_id'] = str(budget['_id'])
-        budget['user_id'] = str(budget['user_id'])
+    # 5. Month-end projection per budget (weekday spend pattern + recurring charges)
+    if result:
+        forecast = get_spend_forecast(user_id, {b['category']: b['current_spend'] for b in result}, now)
+        for budget in result:
+            projected = forecast[budget['category']]
+            budget['projected_spend'] = projected['projected']
+            budget['recurring_pending'] = projected['recurring_pending']
+            budget['projected_percent'] = round(projected['projected'] / budget['limit'] * 100, 1) if budget['limit'] else None
+
+    return success_response(result)
+
+
+@budgets_bp.route('/overview', methods=['GET'])
+@jwt_required()
+@etag_per_user
+@cached_per_user('budget_overview')
+def get_budget_overview():
+    """
+    Budget vs actual spend per category for the last `months` months
+    (default 12, max 24), including the current one, from a single aggregation.
+    Categories without a budget have "limit": null.
+    """
+    current_user_id = get_jwt_identity()
+    count = request.args.get('months', 12, type=int)
+    if count < 1 or count > MAX_OVERVIEW_MONTHS:
+        return error_response(f"months must be between 1 and {MAX_OVERVIEW_MONTHS}", 400)
+
+    months = recent_months(datetime.utcnow(), count)
+    rows = mongo.db.transactions.aggregate(budget_overview_pipeline(ObjectId(current_user_id), months))
+
+    overview = {
+        (year, month): {"year": year, "month": month, "total_budget": 0, "total_spend": 0, "categories": []}
+        for year, month in months
+    }
+    for row in rows:
+        entry = overview.get((row["_id"]["year"], row["_id"]["month"]))
+        if entry is None:
+            continue
+        limit = row["limit"]
+        entry["categories"].append({
+            "category": row["_id"]["category"],
+            "limit": limit,
+            "spend": row["spend"],
+            "count": row["count"],
+            "percent_used": round(row["spend"] / limit * 100, 1) if limit else None
+        })
+        entry["total_budget"] += limit or 0
+        entry["total_spend"] += row["spend"]
+
+    for entry in overview.values():
+        entry["categories"].sort(key=lambda c: c["category"])
+
+    return success_response({"months": list(overview.values())})
 
-    return success_response(result)
\ No newline at end of file
@@ -14,4 +14,20 @@ class BudgetSchema(BaseModel):
     def category_must_be_predefined(cls, v):
         if v not in PREDEFINED_CATEGORIES:
             raise ValueError(f"Category must be one of {PREDEFINED_CATEGORIES}")
-        return v
\ No newline at end of file
+        return v
+
+# Upper bound on budgets created by one bulk request (every category for a few months)
+MAX_BULK_BUDGETS = 60
+
+
+class BulkBudgetSchema(BaseModel):
+    budgets: list[BudgetSchema] = Field(..., min_length=1, max_length=MAX_BULK_BUDGETS)
+    # Overwrite the limit of budgets that already exist instead of skipping them
+    replace: bool = False
+
+    @field_validator('budgets')
+    def check_unique_periods(cls, budgets):
+        keys = [(b.category, b.month, b.year) for b in budgets]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Each category may appear only once per month.")
+        return budgets
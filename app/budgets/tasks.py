@@ -0,0 +1,104 @@
+from datetime import datetime
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app import celery, mongo
+from app.services.cache_service import invalidate_users_cache
+from app.services.budget_service import previous_month
+from app.services.forecast_service import compute_forecast_models, save_forecast_models, FORECAST_CHUNK_USERS
+
+ROLLOVER_CHUNK_SIZE = 1000
+
+
+def _flush_rollover(operations, user_ids):
+    """Write one chunk of upserts; returns the owners of the budgets created."""
+    try:
+        upserted = mongo.db.budgets.bulk_write(operations, ordered=False).upserted_ids
+    except BulkWriteError as e:
+        # A budget created concurrently by the user wins the unique index: nothing to copy
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        upserted = {item["index"]: item["_id"] for item in e.details["upserted"]}
+    return [user_ids[index] for index in upserted]
+
+
+@celery.task
+def roll_forward_budgets_task(year=None, month=None):
+    """
+    Copy every user's budgets from the month before (year, month) into
+    (year, month), default the current month, so they don't have to be
+    recreated each month. Categories that already have a budget in the target
+    month are left alone ($setOnInsert on the unique (user_id, category,
+    month, year) index), so the job can safely run more than once.
+    """
+    logger = current_app.logger
+    now = datetime.utcnow()
+    year, month = year or now.year, month or now.month
+    source_year, source_month = previous_month(year, month)
+
+    cursor = mongo.db.budgets.find(
+        {"year": source_year, "month": source_month},
+        {"user_id": 1, "category": 1, "limit": 1}
+    ).sort("_id", 1)
+
+    operations = []
+    operation_users = []
+    created_for = []
+    scanned = 0
+
+    for budget in cursor:
+        scanned += 1
+        operations.append(UpdateOne(
+            {"user_id": budget["user_id"], "category": budget["category"], "month": month, "year": year},
+            {"$setOnInsert": {
+                "limit": budget["limit"],
+                "rolled_from": budget["_id"],
+                "created_at": now,
+                "updated_at": now
+            }},
+            upsert=True
+        ))
+        operation_users.append(budget["user_id"])
+
+        if len(operations) >= ROLLOVER_CHUNK_SIZE:
+            created_for += _flush_rollover(operations, operation_users)
+            operations, operation_users = [], []
+
+    if operations:
+        created_for += _flush_rollover(operations, operation_users)
+
+    # One generation bump per user that got new budgets
+    updated_users = set(created_for)
+    invalidate_users_cache(updated_users)
+
+    logger.info(
+        f"BUDGET_ROLLOVER: {source_month}/{source_year} -> {month}/{year}: "
+        f"{len(created_for)} of {scanned} budgets created for {len(updated_users)} users."
+    )
+    return {"scanned": scanned, "created": len(created_for), "users_updated": len(updated_users), "month": month, "year": year}
+
+
+@celery.task
+def compute_budget_forecasts_task():
+    """
+    Nightly refresh of month-end forecast models for every user with a budget
+    this month. Users are processed FORECAST_CHUNK_USERS at a time: two
+    aggregations and one set of matrix operations per chunk, then one bulk
+    write, instead of a forecast per user.
+    """
+    logger = current_app.logger
+    now = datetime.utcnow()
+    user_ids = sorted(mongo.db.budgets.distinct("user_id", {"year": now.year, "month": now.month}))
+
+    for start in range(0, len(user_ids), FORECAST_CHUNK_USERS):
+        chunk = user_ids[start:start + FORECAST_CHUNK_USERS]
+        # Users with no spend history still get a (empty) model, so reads don't recompute it
+        models = {user_id: {} for user_id in chunk}
+        models.update(compute_forecast_models(chunk, now))
+        save_forecast_models(models, now)
+        # Projections in cached budget responses changed
+        invalidate_users_cache(chunk)
+
+    logger.info(f"BUDGET_FORECASTS: models refreshed for {len(user_ids)} users.")
+    return {"users": len(user_ids)}
+
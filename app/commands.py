@@ -0,0 +1,226 @@
+import click
+from datetime import datetime
+from pymongo import UpdateOne
+from app import mongo
+from app.services.twilio_service import twilio_service
+from app.services.transaction_service import allocate_short_refs
+from app.services.cache_service import invalidate_user_cache, invalidate_users_cache
+from app.services.sync_service import record_tombstones
+from app.services.budget_alert_service import invalidate_category_spend
+from app.transactions.tasks import detect_recurring_task
+from app.services.anomaly_service import rolling_scores, is_anomaly, anomaly_details, ANOMALY_HISTORY_SIZE
+
+
+def register_commands(app):
+    """Register maintenance/migration commands on the Flask CLI (`flask <command>`)."""
+
+    @app.cli.command('migrate-whatsapp-e164')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def migrate_whatsapp_e164(batch_size):
+        """Backfill the canonical E.164 whatsapp_e164 field for existing users."""
+        cursor = mongo.db.users.find(
+            {"whatsapp_number": {"$exists": True, "$ne": ""}, "whatsapp_e164": {"$exists": False}},
+            {"whatsapp_number": 1, "whatsapp_verified": 1}
+        )
+
+        seen_verified = set()
+        operations = []
+        updated = 0
+        skipped = 0
+
+        for user in cursor:
+            e164 = twilio_service.normalize_phone_number(user['whatsapp_number'])
+            if not e164:
+                click.echo(f"Skipping user {user['_id']}: invalid number {user['whatsapp_number']!r}")
+                skipped += 1
+                continue
+
+            # Only one verified account may own a number (unique partial index)
+            if user.get('whatsapp_verified'):
+                if e164 in seen_verified:
+                    click.echo(f"Skipping user {user['_id']}: {e164} is already verified by another user")
+                    skipped += 1
+                    continue
+                seen_verified.add(e164)
+
+            operations.append(UpdateOne({"_id": user['_id']}, {"$set": {"whatsapp_e164": e164}}))
+            if len(operations) >= batch_size:
+                updated += mongo.db.users.bulk_write(operations, ordered=False).modified_count
+                operations = []
+
+        if operations:
+            updated += mongo.db.users.bulk_write(operations, ordered=False).modified_count
+
+        click.echo(f"whatsapp_e164 backfilled for {updated} users ({skipped} skipped).")
+
+    @app.cli.command('backfill-short-refs')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def backfill_short_refs(batch_size):
+        """Assign per-user short references to transactions created before they existed."""
+        user_ids = mongo.db.transactions.distinct("user_id", {"short_ref": {"$exists": False}})
+        updated = 0
+
+        for user_id in user_ids:
+            transaction_ids = [
+                t['_id'] for t in mongo.db.transactions.find(
+                    {"user_id": user_id, "short_ref": {"$exists": False}}, {"_id": 1}
+                ).sort("date", 1)
+            ]
+            if not transaction_ids:
+                continue
+
+            # Reserve one block of numbers so new transactions can't collide
+            now = datetime.utcnow()
+            first_ref = allocate_short_refs(user_id, len(transaction_ids))
+            operations = [
+                UpdateOne({"_id": transaction_id}, {"$set": {"short_ref": first_ref + offset, "updated_at": now}})
+                for offset, transaction_id in enumerate(transaction_ids)
+            ]
+            for start in range(0, len(operations), batch_size):
+                updated += mongo.db.transactions.bulk_write(operations[start:start + batch_size], ordered=False).modified_count
+            invalidate_user_cache(user_id)
+
+        click.echo(f"short_ref backfilled for {updated} transactions of {len(user_ids)} users.")
+
+    @app.cli.command('backfill-updated-at')
+    def backfill_updated_at():
+        """Set updated_at on transactions and budgets written before delta sync existed."""
+        # Oldest known write time, so the documents are picked up by a first sync
+        transactions = mongo.db.transactions.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": {"$ifNull": ["$date", "$$NOW"]}}}]
+        )
+        budgets = mongo.db.budgets.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": {"$ifNull": ["$created_at", "$$NOW"]}}}]
+        )
+        click.echo(f"updated_at backfilled for {transactions.modified_count} transactions and {budgets.modified_count} budgets.")
+
+    @app.cli.command('dedupe-budgets')
+    def dedupe_budgets():
+        """Remove duplicate budgets (same user, category and month) so the unique index can be built."""
+        duplicates = mongo.db.budgets.aggregate([
+            {"$sort": {"created_at": -1, "_id": -1}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "category": "$category", "month": "$month", "year": "$year"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+
+        removed = 0
+        users = set()
+        for group in duplicates:
+            # Keep the most recently created budget, the user's latest intent
+            removed += mongo.db.budgets.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+            users.add(group["_id"]["user_id"])
+
+        for user_id in users:
+            invalidate_user_cache(user_id)
+        click.echo(f"Removed {removed} duplicate budgets of {len(users)} users.")
+
+    @app.cli.command('dedupe-message-sids')
+    def dedupe_message_sids():
+        """Remove transactions recorded twice from one WhatsApp message so the unique message_sid index can be built."""
+        duplicates = mongo.db.transactions.aggregate([
+            {"$match": {"message_sid": {"$exists": True}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": "$message_sid",
+                "user_id": {"$first": "$user_id"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+
+        removed = 0
+        users = set()
+        for group in duplicates:
+            # Keep the first transaction the message created
+            extra_ids = group["ids"][1:]
+            removed += mongo.db.transactions.delete_many({"_id": {"$in": extra_ids}}).deleted_count
+            record_tombstones(group["user_id"], extra_ids)
+            invalidate_category_spend(group["user_id"])
+            users.add(group["user_id"])
+
+        invalidate_users_cache(users)
+        click.echo(f"Removed {removed} duplicate WhatsApp transactions of {len(users)} users.")
+
+    @app.cli.command('backfill-anomaly-stats')
+    @click.option('--batch-size', default=1000, show_default=True, help='Writes per bulk write')
+    def backfill_anomaly_stats(batch_size):
+        """
+        Build category_stats from existing transactions and flag past outliers.
+        Users are streamed one at a time and their transactions replayed in date
+        order: each amount is scored only against the amounts before it, with the
+        same rule as insert_transaction, so backfilled flags match inline ones.
+        """
+        totals = {"groups": 0, "flagged": 0, "users": 0}
+        now = datetime.utcnow()
+        stats_operations = []
+        flag_operations = []
+        changed_users = set()
+
+        def flush():
+            if stats_operations:
+                mongo.db.category_stats.bulk_write(stats_operations, ordered=False)
+            if flag_operations:
+                mongo.db.transactions.bulk_write(flag_operations, ordered=False)
+            invalidate_users_cache(changed_users)
+            stats_operations.clear()
+            flag_operations.clear()
+            changed_users.clear()
+
+        for user in mongo.db.users.find({}, {"_id": 1}).sort("_id", 1):
+            by_category = {}
+            for transaction in mongo.db.transactions.find(
+                {"user_id": user["_id"], "status": "completed", "amount": {"$gt": 0}},
+                {"amount": 1, "category": 1, "anomaly": 1}
+            ).sort([("date", 1), ("_id", 1)]):
+                by_category.setdefault(transaction.get("category"), []).append(transaction)
+            if not by_category:
+                continue
+
+            for category, transactions in by_category.items():
+                amounts = [transaction["amount"] for transaction in transactions]
+                scores, medians, lengths = rolling_scores(amounts)
+                flagged = is_anomaly(scores, lengths)
+
+                for index, transaction in enumerate(transactions):
+                    if flagged[index]:
+                        update = {"$set": {"anomaly": anomaly_details(scores[index], medians[index]), "updated_at": now}}
+                    elif transaction.get("anomaly"):
+                        update = {"$unset": {"anomaly": ""}, "$set": {"updated_at": now}}
+                    else:
+                        continue
+                    flag_operations.append(UpdateOne({"_id": transaction["_id"]}, update))
+                    changed_users.add(user["_id"])
+                totals["flagged"] += int(flagged.sum())
+
+                stats_operations.append(UpdateOne(
+                    {"user_id": user["_id"], "category": category},
+                    {"$set": {"amounts": amounts[-ANOMALY_HISTORY_SIZE:], "count": len(amounts), "updated_at": now}},
+                    upsert=True
+                ))
+                totals["groups"] += 1
+
+            totals["users"] += 1
+            if len(stats_operations) + len(flag_operations) >= batch_size:
+                flush()
+        flush()
+
+        click.echo(
+            f"category_stats built for {totals['groups']} (user, category) groups of {totals['users']} users; "
+            f"{totals['flagged']} transactions flagged."
+        )
+
+    @app.cli.command('detect-recurring')
+    def detect_recurring():
+        """Queue recurring transaction detection for every user (first run reads their full history)."""
+        user_ids = mongo.db.transactions.distinct("user_id")
+        for user_id in user_ids:
+            detect_recurring_task.delay(str(user_id))
+        click.echo(f"Recurring detection queued for {len(user_ids)} users.")
+
@@ -0,0 +1,71 @@
+from flask import Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson import ObjectId
+from datetime import datetime
+
+from app import mongo
+from app.utils import success_response, get_month_range
+from app.services.cache_service import cached_per_user, etag_per_user
+from app.services.transaction_service import LIST_DEFAULT_FIELDS
+from app.transactions.schemas import PREDEFINED_CATEGORIES
+
+dashboard_bp = Blueprint('dashboard_bp', __name__)
+
+RECENT_TRANSACTIONS_LIMIT = 5
+
+
+def month_spend_pipeline(user_id, month_start, month_end):
+    """
+    The month's spend per category. The $match is on (user_id, date), so the
+    index bounds it to this month however old the account is.
+    """
+    return [
+        {"$match": {"user_id": user_id, "date": {"$gte": month_start, "$lt": month_end}, "status": "completed"}},
+        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        {"$sort": {"total": -1}}
+    ]
+
+
+def build_dashboard(user_id, now):
+    month_start, month_end = get_month_range(now.year, now.month)
+
+    by_category = list(mongo.db.transactions.aggregate(month_spend_pipeline(user_id, month_start, month_end)))
+    spend_by_category = {row["_id"]: row["total"] for row in by_category}
+
+    # Newest first straight off the (user_id, date) index: reads only RECENT_TRANSACTIONS_LIMIT documents
+    recent = list(mongo.db.transactions.find(
+        {"user_id": user_id},
+        {field: 1 for field in LIST_DEFAULT_FIELDS}
+    ).sort("date", -1).limit(RECENT_TRANSACTIONS_LIMIT))
+
+    # Budgets take their spend from the per-category totals instead of a $lookup per budget
+    budgets = list(mongo.db.budgets.find({"user_id": user_id, "month": now.month, "year": now.year}))
+    for budget in budgets:
+        budget['current_spend'] = spend_by_category.get(budget['category'], 0)
+
+    return {
+        "month": {"year": now.year, "month": now.month},
+        "current_month_spend": sum(row["total"] for row in by_category),
+        "transaction_count": sum(row["count"] for row in by_category),
+        "spend_by_category": [
+            {"category": row["_id"], "total": row["total"], "count": row["count"]}
+            for row in by_category
+        ],
+        "budgets": budgets,
+        "recent_transactions": recent,
+        "categories": sorted(PREDEFINED_CATEGORIES)
+    }
+
+
+@dashboard_bp.route('/', methods=['GET'])
+@jwt_required()
+@etag_per_user
+@cached_per_user('dashboard')
+def get_dashboard():
+    """
+    Everything the dashboard needs for first paint in one request: month spend,
+    spend per category, budgets with spend, recent transactions and categories.
+    Cached per user; any write to the user's transactions or budgets invalidates it.
+    """
+    current_user_id = get_jwt_identity()
+    return success_response(build_dashboard(ObjectId(current_user_id), datetime.utcnow()))
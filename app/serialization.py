@@ -0,0 +1,45 @@
+from decimal import Decimal
+import orjson
+from bson import ObjectId, Decimal128
+from flask.json.provider import JSONProvider
+
+# MongoDB returns naive datetimes that are in UTC: serialize them as
+# "2024-01-31T10:00:00+00:00", same as `date.replace(tzinfo=timezone.utc).isoformat()`
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Types orjson doesn't handle natively (datetime, UUID, dataclasses are native)."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serialize API data, including raw MongoDB documents, to JSON bytes."""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson, so `jsonify` (and therefore
+    success_response/error_response) can take MongoDB documents as they are:
+    no per-document str(_id) / isoformat() conversion in the routes.
+    """
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,118 @@
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from pymongo import ReturnDocument
+from app import mongo
+
+# Recent amounts kept per (user, category) in category_stats
+ANOMALY_HISTORY_SIZE = 50
+
+# Below this many earlier transactions in the category nothing is flagged
+ANOMALY_MIN_HISTORY = 8
+
+# Robust z-score above which an amount is flagged (Iglewicz & Hoaglin's 3.5)
+ANOMALY_Z_THRESHOLD = 3.5
+
+# MAD * 1.4826 estimates the standard deviation of normal data; 0.6745 = 1 / 1.4826
+MAD_SCALE = 0.6745
+
+# When most amounts in a category are identical (a 499 subscription) the MAD
+# is 0; a spread of at least this share of the median (and ₹1) keeps scores finite
+MIN_SPREAD_RATIO = 0.05
+
+
+def robust_z_scores(history, values):
+    """
+    Robust z-scores of `values` against `history`, row by row.
+
+    Args:
+        history: (n, k) array of earlier amounts, NaN-padded for shorter histories
+        values: (n, m) array of amounts to score
+
+    Returns:
+        tuple: (z_scores (n, m), medians (n,))
+    """
+    medians = np.nanmedian(history, axis=1)
+    mad = np.nanmedian(np.abs(history - medians[:, None]), axis=1)
+    spread = np.maximum(mad, np.maximum(np.abs(medians) * MIN_SPREAD_RATIO, 1.0))
+    return MAD_SCALE * (values - medians[:, None]) / spread[:, None], medians
+
+
+def is_anomaly(scores, history_lengths):
+    """
+    The flagging rule, shared by insert-time scoring and the backfill: enough
+    earlier amounts, and a robust z-score above the threshold. Works elementwise on arrays.
+    """
+    return (np.asarray(history_lengths) >= ANOMALY_MIN_HISTORY) & (np.asarray(scores) > ANOMALY_Z_THRESHOLD)
+
+
+def rolling_scores(amounts):
+    """
+    Replay a category's amounts in date order: each one is scored against the
+    ANOMALY_HISTORY_SIZE amounts before it, as record_and_score would have
+    when it was inserted.
+
+    Returns:
+        tuple: (z_scores, medians, history_lengths), one entry per amount
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    padded = np.concatenate([np.full(ANOMALY_HISTORY_SIZE, np.nan), amounts])
+    # Row i holds the amounts before amounts[i], NaN-padded at the start
+    history = np.lib.stride_tricks.sliding_window_view(padded, ANOMALY_HISTORY_SIZE)[:len(amounts)]
+    lengths = np.minimum(np.arange(len(amounts)), ANOMALY_HISTORY_SIZE)
+
+    scores = np.full(len(amounts), np.nan)
+    medians = np.full(len(amounts), np.nan)
+    scored = lengths > 0
+    if scored.any():
+        row_scores, medians[scored] = robust_z_scores(history[scored], amounts[scored, None])
+        scores[scored] = row_scores[:, 0]
+    return scores, medians, lengths
+
+
+def anomaly_details(score, median):
+    return {"score": round(float(score), 2), "typical_amount": round(float(median), 2)}
+
+
+def record_and_score(user_id, category, amount):
+    """
+    Add a new transaction's amount to the user's category statistics and score
+    it against the amounts before it, in one round trip (the stats document is
+    returned as it was before the $push).
+
+    Only unusually high amounts are flagged: returns {"score", "typical_amount"}
+    for an anomaly, otherwise None.
+    """
+    stats = mongo.db.category_stats.find_one_and_update(
+        {"user_id": user_id, "category": category},
+        {
+            "$push": {"amounts": {"$each": [amount], "$slice": -ANOMALY_HISTORY_SIZE}},
+            "$inc": {"count": 1},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        projection={"amounts": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    history = (stats or {}).get("amounts", [])
+    if len(history) < ANOMALY_MIN_HISTORY:
+        return None
+
+    scores, medians = robust_z_scores(np.array([history], dtype=float), np.array([[amount]], dtype=float))
+    if not is_anomaly(scores[0, 0], len(history)):
+        return None
+    return anomaly_details(scores[0, 0], medians[0])
+
+
+def check_transaction_anomaly(transaction):
+    """
+    record_and_score for a completed transaction document. Failures are logged
+    and ignored: anomaly flags must never block recording an expense.
+    """
+    if transaction.get("status") != "completed" or not transaction.get("amount"):
+        return None
+    try:
+        return record_and_score(transaction["user_id"], transaction.get("category"), transaction["amount"])
+    except Exception as e:
+        current_app.logger.warning(f"Anomaly check failed for user {transaction['user_id']}: {e}")
+        return None
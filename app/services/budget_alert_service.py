@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app
+from pymongo.errors import DuplicateKeyError
+from app import mongo
+from app.utils import get_redis, get_month_range
+
+# Alert thresholds, as percentages of the budget limit (highest first)
+ALERT_THRESHOLDS = (100, 80)
+ALERT_KEY = "wa:alert:{user_id}:{category}:{threshold}:{day}"
+
+# Running month totals (category_spend) are rebuilt by aggregation at least
+# this often (TTL index on expires_at), which bounds drift from racing writes
+CATEGORY_SPEND_TTL = timedelta(days=1)
+
+
+def crossed_threshold(previous_spent, current_spent, limit):
+    """
+    The highest threshold crossed by going from `previous_spent` to
+    `current_spent`, or None. A threshold already passed before this
+    transaction is not crossed again.
+    """
+    if limit <= 0:
+        return None
+    for threshold in ALERT_THRESHOLDS:
+        boundary = limit * threshold / 100
+        if previous_spent < boundary <= current_spent:
+            return threshold
+    return None
+
+
+def _category_spend_key(user_id, category, date):
+    return {"user_id": ObjectId(user_id), "category": category, "year": date.year, "month": date.month}
+
+
+def record_category_spend(transaction):
+    """
+    Add a completed transaction to its category's running month total with
+    one $inc, the way category_stats is kept. A total that isn't kept yet is
+    left alone: it is built from the transactions on the next read.
+    """
+    if transaction.get("status") != "completed" or not transaction.get("amount"):
+        return
+    try:
+        mongo.db.category_spend.update_one(
+            _category_spend_key(transaction["user_id"], transaction.get("category"), transaction["date"]),
+            {"$inc": {"total": transaction["amount"]}}
+        )
+    except Exception as e:
+        current_app.logger.warning(f"Category spend update failed for user {transaction['user_id']}: {e}")
+
+
+def invalidate_category_spend(user_id):
+    """Drop a user's running totals after a delete or edit; the next read re-aggregates them."""
+    mongo.db.category_spend.delete_many({"user_id": ObjectId(user_id)})
+
+
+def _aggregate_category_spend(user_id, category, now):
+    """The month's spend in a category from the transactions themselves, kept as the running total."""
+    start, end = get_month_range(now.year, now.month)
+    result = list(mongo.db.transactions.aggregate([
+        {"$match": {
+            "user_id": ObjectId(user_id),
+            "category": category,
+            "status": "completed",
+            "date": {"$gte": start, "$lt": end}
+        }},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]))
+    total = result[0]["total"] if result else 0
+
+    try:
+        mongo.db.category_spend.update_one(
+            _category_spend_key(user_id, category, now),
+            {"$setOnInsert": {"total": total, "expires_at": now + CATEGORY_SPEND_TTL}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Built concurrently by another read
+    return total
+
+
+def _get_budget_and_spend(user_id, category, now):
+    """
+    One round trip: returns {"limit", "spent"} for the user's budget on this
+    category this month, or None if the user has alerts off or no budget.
+    Starting from the user's _id makes the common "alerts off" case an
+    immediate empty result. The spend is the running total; only when it
+    isn't kept yet are the month's transactions aggregated.
+    """
+    user_object_id = ObjectId(user_id)
+
+    pipeline = [
+        {"$match": {"_id": user_object_id, "whatsapp_alerts": True}},
+        {"$project": {"_id": 1}},
+        {
+            "$lookup": {
+                "from": "budgets",
+                "pipeline": [
+                    {"$match": {"user_id": user_object_id, "category": category, "month": now.month, "year": now.year}},
+                    {"$project": {"limit": 1}}
+                ],
+                "as": "budget"
+            }
+        },
+        {"$unwind": "$budget"},
+        {
+            "$lookup": {
+                "from": "category_spend",
+                "pipeline": [
+                    {"$match": _category_spend_key(user_id, category, now)},
+                    {"$project": {"total": 1}}
+                ],
+                "as": "spend"
+            }
+        },
+        {"$project": {"_id": 0, "limit": "$budget.limit", "spend": "$spend.total"}}
+    ]
+
+    result = list(mongo.db.users.aggregate(pipeline))
+    if not result:
+        return None
+    spend = result[0]["spend"]
+    return {
+        "limit": result[0].get("limit"),
+        "spent": spend[0] if spend else _aggregate_category_spend(user_id, category, now)
+    }
+
+
+def _claim_alert(user_id, category, threshold, now):
+    """
+    Dedupe: one alert per (user, category, threshold, day).
+    Uses an expiring Redis key, falling back to a unique whatsapp_alerts document.
+    """
+    day = now.strftime('%Y%m%d')
+    key = ALERT_KEY.format(user_id=user_id, category=category, threshold=threshold, day=day)
+    end_of_day = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    ttl = max(1, int((end_of_day - now).total_seconds()))
+
+    try:
+        return bool(get_redis().set(key, 1, nx=True, ex=ttl))
+    except Exception as e:
+        current_app.logger.warning(f"Redis alert dedup failed, using MongoDB: {e}")
+
+    try:
+        mongo.db.whatsapp_alerts.insert_one({
+            "_id": key,
+            "user_id": ObjectId(user_id),
+            "category": category,
+            "threshold": threshold,
+            "created_at": now
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def evaluate_budget_alert(user_id, category, amount, now=None):
+    """
+    Decide whether the transaction just added (already included in the
+    month's spend) pushed the category budget over 80% or 100%.
+    Returns the alert message, or None.
+    """
+    now = now or datetime.utcnow()
+
+    budget = _get_budget_and_spend(user_id, category, now)
+    if not budget:
+        return None
+
+    limit = budget.get('limit') or 0
+    current_spent = budget['spent']
+    threshold = crossed_threshold(current_spent - amount, current_spent, limit)
+    if not threshold or not _claim_alert(user_id, category, threshold, now):
+        return None
+
+    percentage = (current_spent / limit) * 100
+    if threshold == 100:
+        return (f"⚠️ *Budget Alert!* \n\n"
+                f"🔴 You've spent ₹{current_spent:.2f} / ₹{limit:.2f} ({percentage:.0f}%) "
+                f"on {category}\n\n"
+                f"💡 Tip: You've gone over your budget for this month.")
+
+    return (f"⚠️ *Budget Alert!* \n\n"
+            f"🟡 You've spent ₹{current_spent:.2f} / ₹{limit:.2f} ({percentage:.0f}%) "
+            f"on {category}\n\n"
+            f"💡 Tip: You're approaching your budget limit!")
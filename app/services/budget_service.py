@@ -0,0 +1,44 @@
+from app.utils import get_month_range
+
+
+def previous_month(year, month):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def recent_months(now, count):
+    """The last `count` (year, month) pairs up to and including now's month, oldest first."""
+    months = [(now.year, now.month)]
+    while len(months) < count:
+        months.append(previous_month(*months[-1]))
+    return months[::-1]
+
+
+def budget_overview_pipeline(user_id, months):
+    """
+    Spend per (year, month, category) over `months`, merged with the budgets of
+    those months in the same pass: one ranged scan of the (user_id, date) index
+    plus one indexed budgets lookup via $unionWith, instead of a $lookup per budget.
+    """
+    range_start, _ = get_month_range(*months[0])
+    _, range_end = get_month_range(*months[-1])
+    return [
+        {"$match": {"user_id": user_id, "date": {"$gte": range_start, "$lt": range_end}, "status": "completed"}},
+        {"$group": {
+            "_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}, "category": "$category"},
+            "spend": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }},
+        {"$unionWith": {
+            "coll": "budgets",
+            "pipeline": [
+                {"$match": {"user_id": user_id, "$or": [{"year": year, "month": month} for year, month in months]}},
+                {"$project": {"_id": {"year": "$year", "month": "$month", "category": "$category"}, "limit": 1}}
+            ]
+        }},
+        {"$group": {
+            "_id": "$_id",
+            "spend": {"$sum": "$spend"},
+            "count": {"$sum": "$count"},
+            "limit": {"$max": "$limit"}
+        }}
+    ]
@@ -0,0 +1,207 @@
+import hashlib
+import redis
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request, make_response, g
+from flask_jwt_extended import get_jwt_identity
+from app.utils import get_redis
+from app.services.single_flight import single_flight
+
+# Per-user data generation. Every write to a user's transactions, budgets or
+# profile bumps it, so cached reads from older generations are never served
+# again and simply expire. The counter itself never expires: ETags handed to
+# clients are derived from it and must not repeat after a reset.
+USER_GENERATION_KEY = "cache:gen:{user_id}"
+
+# Cached response body of one read endpoint for one (user, generation, params)
+USER_CACHE_KEY = "cache:{name}:{user_id}:{generation}:{params}"
+
+# Result shared by single-flight with concurrent identical misses (short TTL,
+# unlike the cache entry it is also written for oversized bodies)
+SINGLE_FLIGHT_RESULT_KEY = "sf:result:{key}"
+
+# Hit/miss counters per endpoint (Redis hash)
+CACHE_METRICS_KEY = "cache:metrics"
+
+
+def get_user_generation(user_id):
+    """
+    Current data generation of a user (0 if never written).
+    Looked up once per request, so the ETag check and the read cache share it.
+    """
+    generations = g.setdefault('user_generations', {})
+    if user_id not in generations:
+        generations[user_id] = int(get_redis().get(USER_GENERATION_KEY.format(user_id=str(user_id))) or 0)
+    return generations[user_id]
+
+
+def invalidate_user_cache(user_id):
+    """
+    Bump the user's data generation, invalidating every cached read of the user.
+    Call after any write to the user's transactions, budgets or profile
+    (web, WhatsApp or Celery tasks).
+    """
+    try:
+        get_redis().incr(USER_GENERATION_KEY.format(user_id=str(user_id)))
+        g.pop('user_generations', None)
+    except Exception as e:
+        current_app.logger.warning(f"Cache invalidation failed for user {user_id}: {e}")
+
+
+def invalidate_users_cache(user_ids):
+    """invalidate_user_cache for many users (batch jobs), in one Redis round trip."""
+    if not user_ids:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(USER_GENERATION_KEY.format(user_id=str(user_id)))
+        pipe.execute()
+        g.pop('user_generations', None)
+    except Exception as e:
+        current_app.logger.warning(f"Cache invalidation failed for {len(user_ids)} users: {e}")
+
+
+def record_cache_metric(name, outcome, redis_conn=None):
+    try:
+        (redis_conn or get_redis()).hincrby(CACHE_METRICS_KEY, f"{name}:{outcome}", 1)
+    except Exception:
+        pass
+
+
+def get_cache_stats():
+    """
+    Per cached endpoint: hits, misses (MongoDB queries run), requests coalesced
+    onto another worker's query, and the share of requests that needed no query.
+    """
+    stats = {}
+    for field, value in get_redis().hgetall(CACHE_METRICS_KEY).items():
+        name, outcome = field.decode().rsplit(":", 1)
+        stats.setdefault(name, {"hit": 0, "miss": 0, "coalesced": 0, "wait_timeout": 0, "oversize": 0})[outcome] = int(value)
+
+    for counters in stats.values():
+        saved = counters["hit"] + counters["coalesced"]
+        requests = saved + counters["miss"]
+        counters["queries_saved"] = saved
+        counters["hit_rate"] = round(counters["hit"] / requests, 4) if requests else None
+        counters["saved_rate"] = round(saved / requests, 4) if requests else None
+    return stats
+
+
+def _params_digest(now):
+    """Query string plus the current month, since month-to-date reads change when it rolls over."""
+    raw = f"{now.year}-{now.month}|{request.path}|{request.query_string.decode()}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def cached_per_user(name, ttl=None):
+    """
+    Read-through cache for GET endpoints returning per-user JSON.
+    Successful responses are stored under (user, generation, params) for `ttl`
+    seconds (USER_CACHE_TTL by default); bodies over USER_CACHE_MAX_ENTRY_BYTES
+    are not cached. Must be used below @jwt_required().
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or not current_app.config.get('USER_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+
+            user_id = get_jwt_identity()
+            try:
+                redis_conn = get_redis()
+                key = USER_CACHE_KEY.format(
+                    name=name,
+                    user_id=user_id,
+                    generation=get_user_generation(user_id),
+                    params=_params_digest(datetime.utcnow())
+                )
+                body = redis_conn.get(key)
+            except Exception as e:
+                # Fail open: serve from MongoDB if Redis is unavailable
+                current_app.logger.warning(f"Cache lookup failed for {name}: {e}")
+                return view(*args, **kwargs)
+
+            if body is not None:
+                record_cache_metric(name, "hit", redis_conn)
+                response = current_app.response_class(body, mimetype='application/json')
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            # Concurrent misses for the same key (several tabs or devices refreshing
+            # together) share one computation through single-flight
+            leader_response = None
+
+            def compute():
+                nonlocal leader_response
+                leader_response = make_response(view(*args, **kwargs))
+                if leader_response.status_code != 200:
+                    return None
+
+                body = leader_response.get_data()
+                record_cache_metric(name, "miss", redis_conn)
+                if len(body) > current_app.config.get('USER_CACHE_MAX_ENTRY_BYTES', 256 * 1024):
+                    record_cache_metric(name, "oversize", redis_conn)
+                else:
+                    redis_conn.set(key, body, ex=ttl or current_app.config.get('USER_CACHE_TTL', 300))
+                return body
+
+            try:
+                body = single_flight(
+                    SINGLE_FLIGHT_RESULT_KEY.format(key=key),
+                    compute,
+                    current_app.config.get('SINGLE_FLIGHT_RESULT_TTL', 5),
+                    redis_conn,
+                    on_coalesced=lambda: record_cache_metric(name, "coalesced", redis_conn),
+                    on_timeout=lambda: record_cache_metric(name, "wait_timeout", redis_conn)
+                )
+            except redis.RedisError as e:
+                current_app.logger.warning(f"Single-flight failed for {name}: {e}")
+                if leader_response is None:
+                    return view(*args, **kwargs)
+
+            if leader_response is not None:
+                leader_response.headers['X-Cache'] = 'MISS'
+                return leader_response
+
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['X-Cache'] = 'COALESCED'
+            return response
+        return wrapper
+    return decorator
+
+
+def etag_per_user(view):
+    """
+    Conditional GET for per-user JSON reads.
+    The ETag is derived from (user, generation, month, path+query), so a
+    matching If-None-Match is answered with 304 after one Redis lookup, without
+    running the view or sending a body. Must be used below @jwt_required().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        user_id = get_jwt_identity()
+        try:
+            generation = get_user_generation(user_id)
+        except Exception as e:
+            current_app.logger.warning(f"ETag generation lookup failed: {e}")
+            return view(*args, **kwargs)
+
+        etag = hashlib.sha1(f"{user_id}|{generation}|{_params_digest(datetime.utcnow())}".encode()).hexdigest()[:20]
+
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        # Browsers may keep the response but must revalidate it on every use
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Authorization')
+        return response
+    return wrapper
@@ -0,0 +1,195 @@
+import calendar
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne
+from app import mongo
+from app.utils import get_month_range
+from app.services.recurring_service import get_active_recurring, expected_occurrences
+
+# Daily spend history behind a forecast: 12 full weeks, so every weekday has 12 samples
+FORECAST_LOOKBACK_DAYS = 84
+
+# Weekday rates are shrunk towards the user's overall daily rate as if it had
+# been observed this many extra days, so one big Saturday doesn't make every
+# Saturday expensive
+DOW_PRIOR_DAYS = 4
+
+# Stored models older than this are recomputed on read (the nightly job refreshes them)
+FORECAST_MAX_AGE = timedelta(hours=36)
+
+# Users per vectorized chunk of the nightly job
+FORECAST_CHUNK_USERS = 500
+
+
+def _day_start(now):
+    return datetime(now.year, now.month, now.day)
+
+
+def _daily_spend_pipeline(user_ids, window_start, window_end):
+    return [
+        {"$match": {"user_id": {"$in": user_ids}, "status": "completed", "date": {"$gte": window_start, "$lt": window_end}}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "category": "$category",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
+            },
+            "total": {"$sum": "$amount"}
+        }}
+    ]
+
+
+def compute_forecast_models(user_ids, now):
+    """
+    Forecast models for many users at once.
+
+    Every (user, category) becomes one row of an (n, FORECAST_LOOKBACK_DAYS)
+    daily spend matrix; weekday rates for all rows come out of two matrix
+    products, with no per-user Python loop. Charges of detected recurring
+    series (recurring_items) are taken out of the daily series: they are
+    forecast on their own expected dates instead.
+
+    Returns:
+        dict: {user_id: {category: {"dow_rates": [7 floats, Monday first]}}}
+    """
+    window_end = _day_start(now)
+    window_start = window_end - timedelta(days=FORECAST_LOOKBACK_DAYS)
+
+    daily = list(mongo.db.transactions.aggregate(
+        _daily_spend_pipeline(user_ids, window_start, window_end), allowDiskUse=True
+    ))
+    series = sorted({(d["_id"]["user_id"], d["_id"]["category"]) for d in daily}, key=str)
+    if not series:
+        return {}
+    row_of = {key: row for row, key in enumerate(series)}
+
+    spend = np.zeros((len(series), FORECAST_LOOKBACK_DAYS))
+    rows = [row_of[(d["_id"]["user_id"], d["_id"]["category"])] for d in daily]
+    days = [(datetime.strptime(d["_id"]["day"], "%Y-%m-%d") - window_start).days for d in daily]
+    np.add.at(spend, (rows, days), [d["total"] for d in daily])
+
+    # Take recurring charges out of the daily series
+    rec_rows, rec_days, rec_amounts = [], [], []
+    for item in get_active_recurring(user_ids, now):
+        row = row_of.get((item["user_id"], item["category"]))
+        if row is None:
+            continue
+        for date in item["occurrences"]:
+            day = (date - window_start).days
+            if 0 <= day < FORECAST_LOOKBACK_DAYS:
+                rec_rows.append(row)
+                rec_days.append(day)
+                rec_amounts.append(item["amount"])
+    np.subtract.at(spend, (rec_rows, rec_days), rec_amounts)
+    np.clip(spend, 0, None, out=spend)
+
+    # Days before the user signed up are unknown, not zero spend
+    created = {
+        user["_id"]: user.get("created_at")
+        for user in mongo.db.users.find({"_id": {"$in": user_ids}}, {"created_at": 1})
+    }
+    first_day = np.array([
+        min(max((created[user_id] - window_start).days, 0), FORECAST_LOOKBACK_DAYS - 1)
+        if created.get(user_id) else 0
+        for user_id, _ in series
+    ])
+    observed = np.arange(FORECAST_LOOKBACK_DAYS)[None, :] >= first_day[:, None]
+
+    weekdays = (window_start.weekday() + np.arange(FORECAST_LOOKBACK_DAYS)) % 7
+    weekday_onehot = np.eye(7)[weekdays]
+
+    observed_spend = spend * observed
+    weekday_sums = observed_spend @ weekday_onehot
+    weekday_days = observed.astype(float) @ weekday_onehot
+    daily_rate = observed_spend.sum(axis=1) / np.maximum(observed.sum(axis=1), 1)
+    dow_rates = (weekday_sums + DOW_PRIOR_DAYS * daily_rate[:, None]) / (weekday_days + DOW_PRIOR_DAYS)
+
+    models = {}
+    for row, (user_id, category) in enumerate(series):
+        models.setdefault(user_id, {})[category] = {"dow_rates": np.round(dow_rates[row], 2).tolist()}
+    return models
+
+
+def save_forecast_models(models, now):
+    """Store one forecast model document per user (budget_forecasts, keyed by user id)."""
+    if not models:
+        return
+    # Categories are a list: their names are user data and can't safely be field names
+    mongo.db.budget_forecasts.bulk_write([
+        ReplaceOne(
+            {"_id": user_id},
+            {
+                "year": now.year,
+                "month": now.month,
+                "computed_at": now,
+                "categories": [{"category": category, **model} for category, model in categories.items()]
+            },
+            upsert=True
+        )
+        for user_id, categories in models.items()
+    ], ordered=False)
+
+
+def remaining_weekday_counts(now):
+    """How many of each weekday (Monday first) are left in the month after today."""
+    days_in_month = calendar.monthrange(now.year, now.month)[1]
+    remaining = np.arange(now.day + 1, days_in_month + 1)
+    first_weekday = datetime(now.year, now.month, 1).weekday()
+    return np.bincount((first_weekday + remaining - 1) % 7, minlength=7)
+
+
+def project_month_end(categories, spent_by_category, now, recurring=()):
+    """
+    Month-end projection per category: spend so far, plus the weekday rates
+    over the days left, plus the charges of `recurring` series still expected
+    this month.
+
+    Returns:
+        dict: {category: {"spent", "projected", "recurring_pending"}}
+    """
+    remaining = remaining_weekday_counts(now)
+    _, month_end = get_month_range(now.year, now.month)
+
+    pending_by_category = {}
+    for item in recurring:
+        pending = item["amount"] * expected_occurrences(item, month_end)
+        pending_by_category[item["category"]] = pending_by_category.get(item["category"], 0) + pending
+
+    projections = {}
+    for category in set(categories) | set(spent_by_category) | set(pending_by_category):
+        model = categories.get(category, {})
+        spent = spent_by_category.get(category, 0)
+        variable = float(np.dot(model.get("dow_rates", np.zeros(7)), remaining))
+        recurring_pending = pending_by_category.get(category, 0)
+        projections[category] = {
+            "spent": round(spent, 2),
+            "projected": round(spent + variable + recurring_pending, 2),
+            "recurring_pending": round(recurring_pending, 2)
+        }
+    return projections
+
+
+def get_spend_forecast(user_id, spent_by_category, now=None):
+    """
+    Month-end projections for one user from the stored model (refreshed nightly
+    by compute_budget_forecasts_task), computing it on the spot if it is missing
+    or stale, and the user's recurring series, which the detector keeps current.
+    `spent_by_category` is this month's live spend.
+    """
+    now = now or datetime.utcnow()
+    user_id = ObjectId(user_id)
+
+    model = mongo.db.budget_forecasts.find_one({"_id": user_id})
+    if (
+        not model
+        or (model["year"], model["month"]) != (now.year, now.month)
+        or now - model["computed_at"] > FORECAST_MAX_AGE
+    ):
+        models = compute_forecast_models([user_id], now)
+        save_forecast_models(models or {user_id: {}}, now)
+        categories = models.get(user_id, {})
+    else:
+        categories = {item["category"]: item for item in model["categories"]}
+
+    return project_month_end(categories, spent_by_category, now, get_active_recurring([user_id], now))
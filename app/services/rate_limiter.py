@@ -0,0 +1,139 @@
+import math
+from functools import wraps
+from flask import request, current_app
+from flask_jwt_extended import get_jwt_identity
+from app.utils import error_response, get_redis
+
+
+# GCRA (generic cell rate algorithm) in a single round trip.
+# Only one key per identity is stored: the "theoretical arrival time" (TAT)
+# in milliseconds. Each check is O(1) in time and memory, no matter how
+# much traffic the identity sends.
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local emission_interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', key))
+if not tat or tat < now then
+    tat = now
+end
+
+local new_tat = tat + emission_interval
+local allow_at = new_tat - emission_interval * burst
+
+if allow_at > now then
+    return {0, allow_at - now}
+end
+
+redis.call('SET', key, new_tat, 'PX', new_tat - now)
+return {1, 0}
+"""
+
+
+class RateLimiter:
+    def _get_script(self):
+        script = current_app.extensions.get('rate_limit_script')
+        if script is None:
+            script = get_redis().register_script(GCRA_SCRIPT)
+            current_app.extensions['rate_limit_script'] = script
+        return script
+
+    def hit(self, key, limit, period):
+        """
+        Register one request for `key` and decide whether it is allowed.
+
+        Args:
+            key: Redis key identifying the caller (e.g. 'rl:login:ip:1.2.3.4')
+            limit: Number of requests allowed per period (also the burst size)
+            period: Period length in seconds
+
+        Returns:
+            tuple: (allowed, retry_after_seconds)
+        """
+        if not current_app.config.get('RATELIMIT_ENABLED', True):
+            return True, 0
+
+        emission_interval = math.ceil(period * 1000 / limit)
+
+        try:
+            allowed, retry_after_ms = self._get_script()(keys=[key], args=[emission_interval, limit])
+            return bool(allowed), int(retry_after_ms) / 1000
+        except Exception as e:
+            # Fail open (same as the JWT blocklist) if Redis is unavailable
+            current_app.logger.warning(f"Rate limit check failed for {key}: {e}")
+            return True, 0
+
+
+rate_limiter = RateLimiter()
+
+
+def key_by_ip():
+    """Client IP. Behind a proxy, set TRUSTED_PROXY_COUNT so this is the real client."""
+    return f"ip:{request.remote_addr}" if request.remote_addr else None
+
+
+def key_by_user():
+    """JWT identity. Must be used below @jwt_required()."""
+    user_id = get_jwt_identity()
+    return f"user:{user_id}" if user_id else None
+
+
+def key_by_email():
+    """Email from the JSON body, so one account can't be brute forced from many IPs."""
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return f"email:{email.strip().lower()}"
+
+
+def key_by_phone():
+    """Sender number of a Twilio webhook. Only trustworthy once its X-Twilio-Signature is verified."""
+    from_number = request.form.get('From', '')
+    return f"phone:{from_number.replace('whatsapp:', '')}" if from_number else None
+
+
+def check_rate_limit(scope, identity, limit, period, message=None):
+    """
+    Inline form of @rate_limit, for limits that only apply to one branch of a view.
+    Returns a 429 error response if the identity is over the limit, otherwise None.
+    """
+    allowed, retry_after = rate_limiter.hit(f"rl:{scope}:{identity}", limit, period)
+    if allowed:
+        return None
+
+    current_app.logger.warning(f"Rate limit '{scope}' exceeded by {identity}")
+    response, status_code = error_response(message or "Too many requests. Please try again later.", 429)
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response, status_code
+
+
+def rate_limit(scope, limit, period, key_func=key_by_ip, message=None, limited_response=None):
+    """
+    Decorator rejecting requests over `limit` per `period` seconds for the
+    identity returned by `key_func`, before the view does any real work.
+
+    Args:
+        scope: Name of the limit, part of the Redis key (e.g. 'login')
+        limit: Requests allowed per period
+        period: Period length in seconds
+        key_func: Returns the caller identity, or None to skip the check
+        message: Error message for the 429 response
+        limited_response: Optional callable returning the response to use
+                          instead of a 429 (e.g. for webhooks)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            identity = key_func()
+            if identity:
+                limited = check_rate_limit(scope, identity, limit, period, message)
+                if limited:
+                    return limited_response() if limited_response else limited
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
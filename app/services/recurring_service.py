@@ -0,0 +1,203 @@
+import math
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from app import mongo
+from app.services.sync_service import changed_since, to_ms, ZERO_ID, SYNC_SAFETY_WINDOW
+from app.services.transaction_service import normalize_description
+
+# Known periods: name -> (interval in days, tolerance in days)
+RECURRING_PERIODS = {
+    "weekly": (7, 1),
+    "biweekly": (14, 2),
+    "monthly": (30.4, 3.5),
+    "quarterly": (91.3, 7),
+    "yearly": (365.25, 10),
+}
+
+# Occurrences needed before a series counts as recurring, and kept per series
+RECURRING_MIN_OCCURRENCES = 3
+RECURRING_MAX_OCCURRENCES = 12
+
+# Share of intervals that must fall within the period's tolerance
+RECURRING_MIN_REGULARITY = 0.75
+
+# Amounts within about 10% of each other share a band ("299 recharge" and "309 recharge")
+AMOUNT_BAND_RATIO = 1.1
+
+# A series not seen for this long is dropped (TTL index on expires_at); longer than a year
+RECURRING_SERIES_TTL = timedelta(days=400)
+
+# Transactions read per page by the incremental detector
+RECURRING_PAGE_SIZE = 500
+
+
+def amount_band(amount):
+    return round(math.log(amount) / math.log(AMOUNT_BAND_RATIO))
+
+
+def series_key(description, amount):
+    """Key grouping occurrences of one recurring charge, or None if the description has no words."""
+    normalized = normalize_description(description)
+    if not normalized or not amount or amount <= 0:
+        return None
+    return f"{normalized}|{amount_band(amount)}"
+
+
+def classify_interval(dates):
+    """
+    Period of a series of charge dates.
+
+    Returns:
+        tuple: (period_name, interval_days), or None if the dates aren't regular
+    """
+    if len(dates) < RECURRING_MIN_OCCURRENCES:
+        return None
+    dates = sorted(dates)
+    intervals = np.diff([(d - dates[0]).total_seconds() for d in dates]) / 86400
+    median = float(np.median(intervals))
+
+    for period, (days, tolerance) in RECURRING_PERIODS.items():
+        if abs(median - days) <= tolerance:
+            regular = np.mean(np.abs(intervals - days) <= tolerance)
+            if regular >= RECURRING_MIN_REGULARITY:
+                return period, round(median, 1)
+            return None
+    return None
+
+
+def build_series_update(existing, occurrences, now):
+    """
+    Merge new occurrences into a stored series and re-detect its period.
+    `occurrences` are transaction documents (with _id, date, amount, category,
+    description); ones already in the series are ignored.
+    """
+    dates = list(existing.get("occurrences", []))
+    transaction_ids = list(existing.get("transaction_ids", []))
+    latest = None
+
+    for transaction in sorted(occurrences, key=lambda t: t["date"]):
+        if transaction["_id"] in transaction_ids:
+            continue
+        dates.append(transaction["date"])
+        transaction_ids.append(transaction["_id"])
+        latest = transaction
+
+    order = sorted(range(len(dates)), key=lambda i: dates[i])[-RECURRING_MAX_OCCURRENCES:]
+    dates = [dates[i] for i in order]
+    transaction_ids = [transaction_ids[i] for i in order]
+    latest = latest or existing
+
+    update = {
+        "occurrences": dates,
+        "transaction_ids": transaction_ids,
+        "description": latest.get("description"),
+        "category": latest.get("category"),
+        "amount": latest.get("amount"),
+        "last_seen": dates[-1],
+        "expires_at": dates[-1] + RECURRING_SERIES_TTL,
+        "updated_at": now,
+        "period": None,
+        "interval_days": None,
+        "next_expected": None,
+        "active": False,
+    }
+
+    detected = classify_interval(dates)
+    if detected:
+        period, interval_days = detected
+        next_expected = dates[-1] + timedelta(days=interval_days)
+        update.update({
+            "period": period,
+            "interval_days": interval_days,
+            "next_expected": next_expected,
+            # Lapsed subscriptions stop being expected after one and a half missed periods
+            "active": now < next_expected + timedelta(days=interval_days / 2),
+        })
+    return update
+
+
+def detect_recurring_for_user(user_id, now=None):
+    """
+    Incremental recurring detection for one user: reads only transactions
+    written since the user's watermark (the (updated_at, _id) index used by
+    delta sync), merges them into their series in recurring_items and moves
+    the watermark forward.
+
+    Returns:
+        int: number of recurring series (active now or before) that changed
+    """
+    now = now or datetime.utcnow()
+    user_id = ObjectId(user_id)
+    state = mongo.db.recurring_state.find_one({"_id": user_id}) or {}
+    position = state.get("watermark", [0, ZERO_ID])
+    safe_position = [to_ms(now - SYNC_SAFETY_WINDOW), ZERO_ID]
+
+    new_occurrences = {}
+    projection = {"amount": 1, "category": 1, "description": 1, "date": 1, "status": 1, "updated_at": 1}
+    while True:
+        transactions, more = changed_since(mongo.db.transactions, user_id, position, RECURRING_PAGE_SIZE, projection)
+        for transaction in transactions:
+            if transaction.get("status") != "completed":
+                continue
+            key = series_key(transaction.get("description"), transaction.get("amount"))
+            if key:
+                new_occurrences.setdefault(key, []).append(transaction)
+        if not more:
+            # Same rule as delta sync: stay behind late commits, re-reads are deduplicated by _id
+            position = max(position, safe_position)
+            break
+        position = [to_ms(transactions[-1]["updated_at"]), str(transactions[-1]["_id"])]
+
+    changed = 0
+    if new_occurrences:
+        existing = {
+            series["key"]: series
+            for series in mongo.db.recurring_items.find({"user_id": user_id, "key": {"$in": list(new_occurrences)}})
+        }
+        operations = []
+        for key, occurrences in new_occurrences.items():
+            update = build_series_update(existing.get(key, {}), occurrences, now)
+            changed += bool(update["active"] or existing.get(key, {}).get("active"))
+            operations.append(UpdateOne(
+                {"user_id": user_id, "key": key},
+                {"$set": update, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            ))
+        mongo.db.recurring_items.bulk_write(operations, ordered=False)
+
+    mongo.db.recurring_state.update_one(
+        {"_id": user_id},
+        {"$set": {"watermark": position, "updated_at": now}},
+        upsert=True
+    )
+    return changed
+
+
+def get_active_recurring(user_ids, now=None):
+    """Active recurring series of the given users, not lapsed as of `now`."""
+    now = now or datetime.utcnow()
+    items = mongo.db.recurring_items.find(
+        {"user_id": {"$in": user_ids}, "active": True},
+        {"key": 0, "transaction_ids": 0}
+    )
+    return [
+        item for item in items
+        if now < item["next_expected"] + timedelta(days=item["interval_days"] / 2)
+    ]
+
+
+def expected_occurrences(item, until):
+    """
+    Charges of a recurring series still expected before `until`: the next
+    expected one (counted even if slightly overdue, as it hasn't been seen
+    yet), then one per interval.
+    """
+    count = 0
+    expected = item["next_expected"]
+    step = timedelta(days=item["interval_days"])
+    while expected < until:
+        count += 1
+        expected += step
+    return count
@@ -0,0 +1,74 @@
+import time
+import uuid
+from flask import current_app
+from app.utils import get_redis
+
+# Held by the one worker computing a result; others wait for the result key
+SINGLE_FLIGHT_LOCK_KEY = "sf:lock:{key}"
+
+# Delete the lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def release_lock(redis_conn, lock_key, token):
+    redis_conn.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+
+def single_flight(result_key, compute, ttl, redis_conn=None, on_coalesced=None, on_timeout=None):
+    """
+    Run `compute` at most once across all workers for concurrent identical requests.
+
+    The first caller takes a Redis lock, runs compute() and stores its result
+    (bytes) under `result_key` for `ttl` seconds. Concurrent callers poll
+    `result_key` instead of repeating the work. If the leader fails, or
+    compute() returns None (nothing to share), a waiting caller takes over. After
+    SINGLE_FLIGHT_WAIT_TIMEOUT, a caller stops waiting and computes the result itself.
+
+    Returns:
+        bytes | None: the result of compute() or the one shared by the leader
+    """
+    redis_conn = redis_conn or get_redis()
+    config = current_app.config
+    lock_key = SINGLE_FLIGHT_LOCK_KEY.format(key=result_key)
+    lock_ttl = config.get('SINGLE_FLIGHT_LOCK_TTL', 30)
+    poll_interval = config.get('SINGLE_FLIGHT_POLL_INTERVAL', 0.05)
+    deadline = time.monotonic() + config.get('SINGLE_FLIGHT_WAIT_TIMEOUT', 10)
+    token = uuid.uuid4().hex
+
+    while True:
+        if redis_conn.set(lock_key, token, nx=True, ex=lock_ttl):
+            break
+
+        result = redis_conn.get(result_key)
+        if result is not None:
+            if on_coalesced:
+                on_coalesced()
+            return result
+
+        if time.monotonic() >= deadline:
+            # The leader is too slow: don't let every follower time out behind it
+            if on_timeout:
+                on_timeout()
+            return compute()
+
+        time.sleep(poll_interval)
+
+    try:
+        # The previous leader may have finished between our read and the lock
+        result = redis_conn.get(result_key)
+        if result is not None:
+            if on_coalesced:
+                on_coalesced()
+            return result
+
+        result = compute()
+        if result is not None:
+            redis_conn.set(result_key, result, ex=ttl)
+        return result
+    finally:
+        release_lock(redis_conn, lock_key, token)
@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from app import mongo
+from app.services.transaction_service import LIST_DEFAULT_FIELDS
+
+# Deleted transactions are remembered this long; older sync tokens need a full resync
+TOMBSTONE_TTL_DAYS = 30
+
+# Writes from other app servers may commit with a slightly older updated_at than
+# what we have already seen, so the token never moves closer to "now" than this.
+# Changes inside the window are sent again on the next sync (clients upsert by _id).
+SYNC_SAFETY_WINDOW = timedelta(seconds=10)
+
+SYNC_PAGE_LIMIT = 200
+ZERO_ID = "0" * 24
+
+# Collections tracked by a sync token: token key -> collection name
+SYNC_COLLECTIONS = {
+    "tx": "transactions",
+    "del": "transaction_tombstones",
+    "bud": "budgets",
+}
+
+TRANSACTION_SYNC_PROJECTION = {field: 1 for field in LIST_DEFAULT_FIELDS + ("updated_at",)}
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class ExpiredSyncToken(ValueError):
+    pass
+
+
+def record_tombstones(user_id, transaction_ids, now=None):
+    """Remember deleted transactions so /changes can report them."""
+    if not transaction_ids:
+        return
+    now = now or datetime.utcnow()
+    mongo.db.transaction_tombstones.bulk_write([
+        UpdateOne(
+            {"_id": transaction_id},
+            {"$set": {"user_id": ObjectId(user_id), "deleted_at": now, "updated_at": now}},
+            upsert=True
+        )
+        for transaction_id in transaction_ids
+    ], ordered=False)
+
+
+def to_ms(value):
+    return int((value - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def _from_ms(ms):
+    return datetime(1970, 1, 1) + timedelta(milliseconds=ms)
+
+
+def encode_sync_token(positions, has_more=False):
+    data = {"v": 1, **positions}
+    if has_more:
+        data["more"] = 1
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_token(token):
+    """
+    Positions per collection: {"tx": [updated_at_ms, last_id], ...}.
+    No token means a first sync, starting from the beginning.
+    Only the tombstone position can expire, once deletions after it may have
+    been forgotten. Transaction and budget positions are the updated_at of
+    old rows during a first sync, and a `has_more` continuation never expires.
+    """
+    if not token:
+        return {key: [0, ZERO_ID] for key in SYNC_COLLECTIONS}
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        positions = {key: [int(data[key][0]), str(ObjectId(data[key][1]))] for key in SYNC_COLLECTIONS}
+    except (ValueError, KeyError, TypeError, IndexError, InvalidId):
+        raise InvalidSyncToken("Invalid sync token")
+
+    if data.get("more"):
+        return positions
+    if _from_ms(positions["del"][0]) < datetime.utcnow() - timedelta(days=TOMBSTONE_TTL_DAYS):
+        raise ExpiredSyncToken("Sync token expired, a full resync is required")
+    return positions
+
+
+def changed_since(collection, user_id, position, limit, projection=None):
+    """One page of documents after `position`, in (updated_at, _id) order."""
+    updated_at = _from_ms(position[0])
+    query = {
+        "user_id": user_id,
+        "$or": [
+            {"updated_at": {"$gt": updated_at}},
+            {"updated_at": updated_at, "_id": {"$gt": ObjectId(position[1])}}
+        ]
+    }
+    docs = list(
+        collection.find(query, projection).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1)
+    )
+    return docs[:limit], len(docs) > limit
+
+
+def get_changes(user_id, token, limit=SYNC_PAGE_LIMIT, now=None):
+    """
+    Transactions, deleted transaction IDs and budgets changed since `token`,
+    with the token for the next call. While `has_more` is true the client
+    should call again right away with `next_token`.
+    """
+    user_id = ObjectId(user_id)
+    positions = decode_sync_token(token)
+    safe_position = [to_ms((now or datetime.utcnow()) - SYNC_SAFETY_WINDOW), ZERO_ID]
+
+    projections = {"tx": TRANSACTION_SYNC_PROJECTION, "del": {"_id": 1, "updated_at": 1}, "bud": None}
+    changes = {}
+    next_positions = {}
+    has_more = False
+
+    for key, collection_name in SYNC_COLLECTIONS.items():
+        docs, more = changed_since(mongo.db[collection_name], user_id, positions[key], limit, projections[key])
+        changes[key] = docs
+        has_more = has_more or more
+
+        if more:
+            next_positions[key] = [to_ms(docs[-1]["updated_at"]), str(docs[-1]["_id"])]
+        else:
+            # Everything up to now has been seen: continue from the safety window
+            # (never backwards), so late commits inside it are picked up next time
+            next_positions[key] = max(positions[key], safe_position)
+
+    return {
+        "transactions": changes["tx"],
+        "deleted": [str(doc["_id"]) for doc in changes["del"]],
+        "budgets": changes["bud"],
+        "next_token": encode_sync_token(next_positions, has_more),
+        "has_more": has_more
+    }
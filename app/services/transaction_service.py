@@ -0,0 +1,206 @@
+import hashlib
+import re
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument
+from app import mongo
+from app.services.anomaly_service import check_transaction_anomaly
+from app.services.budget_alert_service import record_category_spend
+
+# Upper bound on transactions addressed by one WhatsApp /delete or /edit
+MAX_REFS_PER_COMMAND = 20
+
+OBJECT_ID_PATTERN = re.compile(r'^[0-9a-fA-F]{24}$')
+
+# Fields clients may select with ?fields= (_id is always returned)
+TRANSACTION_FIELDS = frozenset({
+    "amount", "category", "description", "date", "status", "source", "short_ref",
+    "raw_text", "failure_reason", "error_details", "anomaly", "duplicate_of"
+})
+# Default projections: lists only need what a row shows, details add why AI processing failed
+LIST_DEFAULT_FIELDS = (
+    "amount", "category", "description", "date", "status", "source", "short_ref", "anomaly", "duplicate_of"
+)
+DETAIL_DEFAULT_FIELDS = LIST_DEFAULT_FIELDS + ("raw_text", "failure_reason")
+
+# What happens to a near-duplicate transaction (config DUPLICATE_POLICY)
+DUPLICATE_POLICIES = ("mark", "warn", "reject")
+
+MONTH_WORDS = {
+    "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "january", "february", "march", "april", "june", "july", "august", "september",
+    "october", "november", "december", "month", "monthly"
+}
+
+_NON_LETTERS = re.compile(r'[^a-z]+')
+
+
+class DuplicateTransaction(ValueError):
+    """Raised by insert_transaction under the 'reject' policy; `existing` is the earlier transaction."""
+
+    def __init__(self, existing):
+        super().__init__(f"Duplicate of transaction {existing['_id']}")
+        self.existing = existing
+
+
+def normalize_description(description):
+    """
+    Lowercased words of a description without digits, punctuation or month
+    names: "Netflix - Oct 2024" and "netflix nov" both become "netflix".
+    """
+    words = _NON_LETTERS.sub(' ', (description or '').lower()).split()
+    return ' '.join(word for word in words if word not in MONTH_WORDS)
+
+
+def duplicate_hash(transaction):
+    """
+    Hash shared by near-duplicates of a transaction: same user, amount and
+    normalized description. AI transactions still being processed have neither
+    yet, so their hash is of the submitted text (a double tap sends it twice).
+    """
+    if transaction.get("status") == "processing":
+        parts = ["text", ' '.join((transaction.get("raw_text") or '').lower().split())]
+    else:
+        description = transaction.get("description") or ''
+        parts = [
+            f"{float(transaction.get('amount') or 0):.2f}",
+            normalize_description(description) or description.strip().lower()
+        ]
+    return hashlib.sha1('|'.join([str(transaction["user_id"]), *parts]).encode()).hexdigest()
+
+
+def duplicate_policy():
+    policy = current_app.config.get('DUPLICATE_POLICY', 'warn')
+    return policy if policy in DUPLICATE_POLICIES else 'warn'
+
+
+def find_duplicate(transaction):
+    """
+    Earliest transaction recorded before `transaction` with the same dup_hash
+    dated within DUPLICATE_WINDOW_SECONDS of it, or None. A bounded range scan
+    on the (dup_hash, date) index, however long the user's history is. Only
+    earlier ones count, so of two racing copies just the later is flagged.
+    """
+    window = timedelta(seconds=current_app.config.get('DUPLICATE_WINDOW_SECONDS', 1800))
+    query = {
+        "dup_hash": transaction["dup_hash"],
+        "date": {"$gte": transaction["date"] - window, "$lte": transaction["date"] + window},
+        "status": {"$ne": "failed"}
+    }
+    if transaction.get("_id"):
+        query["_id"] = {"$lt": transaction["_id"]}
+    return mongo.db.transactions.find_one(
+        query,
+        {"amount": 1, "description": 1, "date": 1, "short_ref": 1},
+        sort=[("date", 1)]
+    )
+
+
+def allocate_short_refs(user_id, count=1):
+    """
+    Reserve `count` consecutive short references for a user's transactions.
+    Short refs are small per-user sequence numbers ("#42") that can be typed
+    in WhatsApp instead of a 24 character ObjectId.
+    Returns the first reserved number.
+    """
+    user = mongo.db.users.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$inc": {"transaction_seq": count}},
+        projection={"transaction_seq": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return user["transaction_seq"] - count + 1
+
+
+def insert_transaction(transaction_doc, allow_duplicate=False):
+    """
+    Insert a transaction, assigning its per-user short reference and flagging
+    an unusually high amount for its category (sets `anomaly` on the document).
+    A near-duplicate of a recent transaction gets `duplicate_of`, or raises
+    DuplicateTransaction under the 'reject' policy unless `allow_duplicate`.
+    The override is stored as `duplicate_allowed`, so the check an AI
+    transaction repeats once it is parsed honours it too.
+    Every code path creating transactions should go through here.
+    """
+    transaction_doc["dup_hash"] = duplicate_hash(transaction_doc)
+    if allow_duplicate:
+        transaction_doc["duplicate_allowed"] = True
+    duplicate = find_duplicate(transaction_doc)
+    if duplicate:
+        if duplicate_policy() == "reject" and not allow_duplicate:
+            raise DuplicateTransaction(duplicate)
+        transaction_doc["duplicate_of"] = duplicate["_id"]
+
+    transaction_doc["short_ref"] = allocate_short_refs(transaction_doc["user_id"])
+    transaction_doc.setdefault("updated_at", datetime.utcnow())
+    result = mongo.db.transactions.insert_one(transaction_doc)
+    record_category_spend(transaction_doc)
+
+    # Scored after the insert, so a rejected duplicate never enters the category statistics
+    anomaly = check_transaction_anomaly(transaction_doc)
+    if anomaly:
+        # A new updated_at, so delta sync clients that already fetched the insert see the flag
+        updated_at = datetime.utcnow()
+        mongo.db.transactions.update_one(
+            {"_id": result.inserted_id},
+            {"$set": {"anomaly": anomaly, "updated_at": updated_at}}
+        )
+        transaction_doc.update({"anomaly": anomaly, "updated_at": updated_at})
+    return result
+
+def parse_transaction_refs(tokens):
+    """
+    Split user supplied references ("12", "#12", "12,15" or a full ObjectId)
+    into short refs and ObjectIds.
+
+    Returns:
+        tuple: (short_refs, object_ids, invalid_tokens)
+    """
+    short_refs = []
+    object_ids = []
+    invalid = []
+
+    for token in tokens:
+        for ref in filter(None, token.split(',')):
+            ref = ref.strip().lstrip('#')
+            if ref.isdigit():
+                short_refs.append(int(ref))
+            elif OBJECT_ID_PATTERN.match(ref):
+                object_ids.append(ObjectId(ref))
+            else:
+                invalid.append(ref)
+
+    return short_refs, object_ids, invalid
+
+
+def find_transactions_by_refs(user_id, short_refs, object_ids, projection=None):
+    """
+    Resolve short refs and/or ObjectIds to the user's transactions with one
+    query on the unique (user_id, short_ref) index and _id.
+    """
+    clauses = []
+    if short_refs:
+        clauses.append({"short_ref": {"$in": short_refs}})
+    if object_ids:
+        clauses.append({"_id": {"$in": object_ids}})
+    if not clauses:
+        return []
+
+    return list(mongo.db.transactions.find(
+        {"user_id": ObjectId(user_id), "$or": clauses},
+        projection
+    ))
+
+
+def transaction_projection(fields_param, default_fields):
+    """
+    MongoDB projection for a `fields=amount,category,date` query parameter,
+    or for `default_fields` if it is absent.
+
+    Returns:
+        tuple: (projection, unknown_fields)
+    """
+    fields = [f.strip() for f in (fields_param or "").split(",") if f.strip()] or list(default_fields)
+    unknown = [f for f in fields if f not in TRANSACTION_FIELDS]
+    return {f: 1 for f in fields if f in TRANSACTION_FIELDS}, unknown
@@ -5,7 +5,10 @@ import base64
 import urllib.parse
 from flask import current_app
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+from app.services.whatsapp_delivery_service import record_outbound_message
 
 
 class TwilioService:
@@ -14,6 +17,7 @@ class TwilioService:
         self.auth_token = None
         self.phone_number = None
         self._loaded = False
+        self._session = None
 
     def _ensure_loaded(self):
         if not self._loaded:
@@ -25,6 +29,38 @@ class TwilioService:
             if not all([self.account_sid, self.auth_token, self.phone_number]):
                 current_app.logger.warning("Twilio credentials not configured")
 
+    def _get_session(self):
+        """
+        Persistent HTTP session for the Twilio API.
+        Keeps connections alive between messages (no TLS handshake per send).
+        Sending a message is not idempotent, so only requests Twilio certainly
+        didn't accept are retried: connection errors, and 429/503 responses
+        carrying Retry-After. A read timeout or another 5xx may come after the
+        message was queued, and retrying it could deliver it twice.
+        Created lazily so each Celery/Gunicorn worker process gets its own pool.
+        """
+        if self._session is None:
+            retry = Retry(
+                total=3,
+                connect=3,
+                read=0,
+                other=0,
+                backoff_factor=0.5,
+                # No status_forcelist: with respect_retry_after_header, urllib3 then
+                # retries only 413/429/503 responses that include Retry-After
+                status_forcelist=None,
+                allowed_methods=frozenset(["POST"]),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=20, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)  # Local fake Twilio API (load tests)
+            session.auth = HTTPBasicAuth(self.account_sid, self.auth_token)
+            self._session = session
+        return self._session
+
     def verify_twilio_signature(self, url, params, signature):
         """
         Verify that the request came from Twilio.
@@ -65,13 +101,14 @@ class TwilioService:
             current_app.logger.error(f"Error verifying Twilio signature: {e}")
             return False
 
-    def send_whatsapp_message(self, to_number, message):
+    def send_whatsapp_message(self, to_number, message, attempt=1):
         """
         Send a WhatsApp message via Twilio API.
         
         Args:
             to_number: WhatsApp number in format 'whatsapp:+1234567890'
             message: The message body to send
+            attempt: Send attempt number (retries of failed messages)
             
         Returns:
             dict: Twilio response with message SID or None on failure
@@ -82,25 +119,33 @@ class TwilioService:
             current_app.logger.error("Twilio not configured")
             return None
 
-        url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        base_url = current_app.config.get('TWILIO_API_BASE_URL', 'https://api.twilio.com').rstrip('/')
+        url = f"{base_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json"
         
         data = {
             "From": f"whatsapp:{self.phone_number}",
             "To": to_number,
             "Body": message
         }
+        status_callback_url = current_app.config.get('TWILIO_STATUS_CALLBACK_URL')
+        if status_callback_url:
+            data["StatusCallback"] = status_callback_url
 
         try:
-            response = requests.post(
+            response = self._get_session().post(
                 url,
-                auth=HTTPBasicAuth(self.account_sid, self.auth_token),
                 data=data,
-                timeout=30
+                timeout=current_app.config.get('TWILIO_TIMEOUT', (3.05, 10))
             )
             
             if response.status_code == 201:
                 current_app.logger.info(f"WhatsApp message sent to {to_number}")
-                return response.json()
+                result = response.json()
+                try:
+                    record_outbound_message(result.get("sid"), to_number, message, result.get("status", "queued"), attempt)
+                except Exception as e:
+                    current_app.logger.warning(f"Could not record outbound WhatsApp message: {e}")
+                return result
             else:
                 current_app.logger.error(f"Twilio error: {response.status_code} - {response.text}")
                 return None
@@ -142,6 +187,27 @@ class TwilioService:
         # Format with country code (+91 for India)
         return f"whatsapp:+91{clean_number}"
 
+    def normalize_phone_number(self, phone_number):
+        """
+        Canonical E.164 form of an Indian mobile number, as stored in
+        users.whatsapp_e164. Accepts '7058099532', '+917058099532',
+        '917058099532' or 'whatsapp:+917058099532'.
+        Returns None if the number isn't a valid Indian mobile.
+        """
+        if not phone_number:
+            return None
+        
+        digits = ''.join(c for c in phone_number.replace('whatsapp:', '') if c.isdigit())
+        
+        # Strip the country code if present
+        if len(digits) == 12 and digits.startswith('91'):
+            digits = digits[2:]
+        
+        if len(digits) != 10 or digits[0] not in '6789':
+            return None
+        
+        return f"+91{digits}"
+
     def validate_phone_number(self, phone_number):
         """
         Validate if phone number is a valid Indian mobile number.
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app import mongo
+
+# Twilio message statuses, in the order they can happen.
+# Callbacks may arrive out of order, so a record only ever moves forward.
+STATUS_RANK = {
+    "accepted": 0,
+    "queued": 0,
+    "sending": 1,
+    "sent": 2,
+    "delivered": 3,
+    "undelivered": 3,
+    "failed": 3,
+    "read": 4,
+}
+FAILED_STATUSES = ["failed", "undelivered"]
+
+# Twilio error codes worth retrying (queue overflow, unreachable, unknown, rate limit).
+# Others (e.g. 63016, outside the 24h session window) will fail again.
+RETRYABLE_ERROR_CODES = {"30001", "30003", "30008", "63018"}
+MAX_SEND_ATTEMPTS = 3
+
+
+def record_outbound_message(sid, to_number, body, status, attempt=1):
+    """Store a message we just handed to Twilio, keyed by its SID."""
+    now = datetime.utcnow()
+    mongo.db.whatsapp_outbound.update_one(
+        {"_id": sid},
+        {
+            "$set": {"to": to_number, "body": body, "attempt": attempt},
+            "$max": {"status_rank": STATUS_RANK.get(status, 0)},
+            # A fast status callback may have created the record already
+            "$setOnInsert": {"status": status, "created_at": now, "updated_at": now}
+        },
+        upsert=True
+    )
+
+
+def record_status_callback(sid, status, error_code=None):
+    """
+    Apply a Twilio status callback with a single upsert.
+    The status only advances (sent -> delivered -> read), and the first time
+    each status is seen is kept as `<status>_at` for latency measurement.
+    """
+    now = datetime.utcnow()
+    rank = STATUS_RANK.get(status, 0)
+    current_rank = {"$ifNull": ["$status_rank", -1]}
+
+    update = {
+        "status": {"$cond": [{"$gt": [rank, current_rank]}, status, "$status"]},
+        "status_rank": {"$max": [rank, current_rank]},
+        f"{status}_at": {"$ifNull": [f"${status}_at", now]},
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now
+    }
+    if error_code:
+        update["error_code"] = str(error_code)
+
+    mongo.db.whatsapp_outbound.update_one({"_id": sid}, [{"$set": update}], upsert=True)
+
+
+def claim_failed_message_for_retry(sid, error_code):
+    """
+    Atomically claim a failed message for one retry.
+    Returns the message document if it should be re-sent, otherwise None.
+    """
+    if str(error_code) not in RETRYABLE_ERROR_CODES:
+        return None
+
+    return mongo.db.whatsapp_outbound.find_one_and_update(
+        {
+            "_id": sid,
+            "status": {"$in": FAILED_STATUSES},
+            "attempt": {"$lt": MAX_SEND_ATTEMPTS},
+            "body": {"$exists": True},
+            "retried": {"$ne": True}
+        },
+        {"$set": {"retried": True}},
+        projection={"to": 1, "body": 1, "attempt": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get_delivery_stats(hours=24):
+    """
+    Delivery metrics for messages sent in the last `hours`:
+    counts per status, failures per error code and send->delivered latency percentiles.
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {
+            "$facet": {
+                "by_status": [
+                    {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+                ],
+                "failures": [
+                    {"$match": {"status": {"$in": FAILED_STATUSES}}},
+                    {"$group": {"_id": "$error_code", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}}
+                ],
+                "latencies": [
+                    {"$match": {"delivered_at": {"$exists": True}}},
+                    {"$project": {"_id": 0, "ms": {"$subtract": ["$delivered_at", "$created_at"]}}},
+                    {"$sort": {"ms": 1}},
+                    {"$group": {"_id": None, "values": {"$push": "$ms"}}}
+                ]
+            }
+        }
+    ]
+
+    result = list(mongo.db.whatsapp_outbound.aggregate(pipeline))[0]
+    latencies = result["latencies"][0]["values"] if result["latencies"] else []
+    by_status = {row["_id"]: row["count"] for row in result["by_status"]}
+
+    return {
+        "window_hours": hours,
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "failed": sum(by_status.get(status, 0) for status in FAILED_STATUSES),
+        "failures_by_error_code": {str(row["_id"]): row["count"] for row in result["failures"]},
+        "delivery_latency_ms": {
+            "count": len(latencies),
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None
+        }
+    }
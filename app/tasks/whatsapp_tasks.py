@@ -0,0 +1,31 @@
+from flask import current_app
+from app import celery
+from app.services.twilio_service import twilio_service
+from app.services.rate_limiter import rate_limiter
+
+def acquire_send_slot():
+    """
+    Take one slot of our sender number's Twilio throughput budget.
+    The limiter is shared by every worker, so all sends together stay at
+    TWILIO_MESSAGES_PER_SECOND. Returns (allowed, retry_after_seconds).
+    """
+    sender = current_app.config.get('TWILIO_PHONE_NUMBER') or 'default'
+    return rate_limiter.hit(
+        f"rl:twilio_send:{sender}",
+        current_app.config.get('TWILIO_MESSAGES_PER_SECOND', 20),
+        1
+    )
+
+@celery.task(bind=True, max_retries=None)
+def send_whatsapp_task(self, to_number, message, attempt=1):
+    """
+    Outbound WhatsApp send queue.
+    A shared GCRA limiter keyed by our Twilio number paces sends across all
+    workers to TWILIO_MESSAGES_PER_SECOND; over the limit the task is re-queued
+    for exactly as long as the limiter asks instead of blocking a worker.
+    """
+    allowed, retry_after = acquire_send_slot()
+    if not allowed:
+        raise self.retry(countdown=retry_after)
+
+    return twilio_service.send_whatsapp_message(to_number, message, attempt=attempt)
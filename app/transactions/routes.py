@@ -1,21 +1,64 @@
+import hashlib
 import json
 import re
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from bson.errors import InvalidId
 from pydantic import ValidationError
 from datetime import timezone, datetime
+from pymongo import UpdateOne
 from app import mongo
 from app.models.transaction import Transaction
-from .schemas import AddTransactionSchema, PREDEFINED_CATEGORIES
-from .tasks import process_ai_transaction
+from .schemas import AddTransactionSchema, BatchIdsSchema, BatchUpdateSchema, PREDEFINED_CATEGORIES
+from .tasks import process_ai_transaction, schedule_recurring_detection
+from app.services.rate_limiter import check_rate_limit
+from app.services.transaction_service import (
+    insert_transaction, DuplicateTransaction, OBJECT_ID_PATTERN, transaction_projection, TRANSACTION_FIELDS, LIST_DEFAULT_FIELDS, DETAIL_DEFAULT_FIELDS
+)
+from app.services.cache_service import invalidate_user_cache, cached_per_user, etag_per_user
 from app.utils import success_response, error_response
+from app.serialization import dumps_bytes
+from app.services.sync_service import record_tombstones, get_changes, InvalidSyncToken, ExpiredSyncToken
+from app.services.recurring_service import get_active_recurring
+from app.services.budget_alert_service import invalidate_category_spend
 
 transactions_bp = Blueprint('transactions_bp', __name__)
 
 ai_processing_transactions = {}
 
+
+def _projection_or_error(default_fields):
+    """Projection for the request's ?fields=, or a 400 response listing the allowed fields."""
+    projection, unknown = transaction_projection(request.args.get('fields'), default_fields)
+    if unknown:
+        return None, error_response(
+            f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(sorted(TRANSACTION_FIELDS))}", 400
+        )
+    return projection, None
+
+
+def _batch_object_ids(ids):
+    """
+    Map requested IDs to ObjectIds, keeping request order and dropping repeats.
+    Malformed IDs map to None so they can be reported per item.
+    """
+    object_ids = {}
+    for transaction_id in ids:
+        object_ids.setdefault(transaction_id, ObjectId(transaction_id) if OBJECT_ID_PATTERN.match(transaction_id) else None)
+    return object_ids
+
+
+def _find_batch(user_id, object_ids, projection):
+    """The user's transactions among `object_ids` in one $in query, keyed by _id."""
+    valid_ids = [oid for oid in object_ids.values() if oid is not None]
+    if not valid_ids:
+        return {}
+    return {
+        t["_id"]: t
+        for t in mongo.db.transactions.find({"_id": {"$in": valid_ids}, "user_id": ObjectId(user_id)}, projection)
+    }
+
 @transactions_bp.route('/', methods=['POST'])
 @jwt_required()
 def add_transactions():
@@ -37,6 +80,11 @@ def add_transactions():
         data.amount = round(data.amount, 2)
 
     if data.mode == 'ai':
+        # Each AI transaction costs a Gemini call, so cap them per user
+        limited = check_rate_limit('ai_transaction', f"user:{current_user_id}", limit=30, period=60,
+                                   message="Too many AI transactions. Please wait a moment.")
+        if limited:
+            return limited
         if not data.text or len(data.text.strip()) == 0:
             return error_response("AI description cannot be empty", 400)
         if len(data.text) > 200:
@@ -57,16 +105,24 @@ def add_transactions():
             text=data.text
         )
 
-    result = mongo.db.transactions.insert_one(transaction_doc)
+    try:
+        result = insert_transaction(transaction_doc, allow_duplicate=data.allow_duplicate)
+    except DuplicateTransaction as e:
+        return error_response({
+            "message": "Looks like a duplicate of a recent transaction. Resend with allow_duplicate to record it anyway.",
+            "duplicate_of": e.existing
+        }, 409)
     inserted_id = result.inserted_id
+    invalidate_user_cache(current_user_id)
 
     if data.mode == 'ai':
         ai_processing_transactions[str(inserted_id)] = datetime.now(timezone.utc)
         process_ai_transaction.delay(str(inserted_id))
+    else:
+        schedule_recurring_detection(current_user_id)
 
     final_doc = mongo.db.transactions.find_one({"_id": inserted_id})
-    final_doc['_id'] = str(final_doc['_id'])
-    final_doc['user_id'] = str(final_doc['user_id'])
+    # Sent as a naive ISO date (no "+00:00") since before the orjson provider; keep the wire format
     final_doc['date'] = final_doc['date'].isoformat()
     
     status_code = 201 if data.mode == 'manual' else 202
@@ -75,6 +131,7 @@ def add_transactions():
     
 @transactions_bp.route('/', methods=['GET'])
 @jwt_required()
+@etag_per_user
 def get_transactions():
     current_user_id = get_jwt_identity()
     
@@ -85,6 +142,10 @@ def get_transactions():
     sort_by = request.args.get('sort_by', 'date')
     sort_order = request.args.get('sort_order', 'desc')
 
+    projection, error = _projection_or_error(LIST_DEFAULT_FIELDS)
+    if error:
+        return error
+
     query = {"user_id": ObjectId(current_user_id)}
 
     if search_query:
@@ -117,14 +178,7 @@ def get_transactions():
     limit = min(limit, 100)
 
     total_count = mongo.db.transactions.count_documents(query)
-    transactions_cursor = mongo.db.transactions.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
-    
-    transactions_list = []
-    for transaction in transactions_cursor:
-        transaction['_id'] = str(transaction['_id'])
-        transaction['user_id'] = str(transaction['user_id'])
-        transaction['date'] = transaction['date'].replace(tzinfo=timezone.utc).isoformat()
-        transactions_list.append(transaction)
+    transactions_list = list(mongo.db.transactions.find(query, projection).sort(sort_field, sort_direction).skip(skip).limit(limit))
         
     return success_response({
         "transactions": transactions_list,
@@ -136,19 +190,174 @@ def get_transactions():
         }
     })
 
+@transactions_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_transaction_changes():
+    """
+    Delta sync: transactions, deleted transaction IDs and budgets changed since
+    `since` (the `next_token` of the previous call; omit it for a first sync).
+    Keep calling with `next_token` while `has_more` is true. A 410 means the
+    token is older than the deletion history and the client must resync fully.
+    No ETag: the sync token, not the user's data version, decides the answer.
+    """
+    current_user_id = get_jwt_identity()
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 500)
+
+    try:
+        changes = get_changes(current_user_id, request.args.get('since'), limit)
+    except InvalidSyncToken as e:
+        return error_response(str(e), 400)
+    except ExpiredSyncToken as e:
+        return error_response(str(e), 410)
+
+    return success_response(changes)
+
+
+
+@transactions_bp.route('/batch', methods=['GET'])
+@jwt_required()
+@etag_per_user
+def get_transactions_batch():
+    """Several transactions by ID (?ids=a,b,c) in one query; unknown IDs are listed in not_found."""
+    current_user_id = get_jwt_identity()
+    projection, error = _projection_or_error(LIST_DEFAULT_FIELDS)
+    if error:
+        return error
+
+    try:
+        data = BatchIdsSchema(ids=[i.strip() for i in request.args.get('ids', '').split(',') if i.strip()])
+    except ValidationError as e:
+        return error_response(json.loads(e.json()), 400)
+
+    object_ids = _batch_object_ids(data.ids)
+    found = _find_batch(current_user_id, object_ids, projection)
+
+    return success_response({
+        "transactions": [found[oid] for oid in object_ids.values() if oid in found],
+        "not_found": [raw for raw, oid in object_ids.items() if oid not in found]
+    })
+
+
+@transactions_bp.route('/batch/delete', methods=['POST'])
+@jwt_required()
+def delete_transactions_batch():
+    """
+    Delete several transactions: one $in lookup, one delete_many, one tombstone
+    write and one cache invalidation. Each ID gets its own result: deleted,
+    not_found, invalid_id or processing (AI still running, same rule as DELETE /<id>).
+    """
+    current_user_id = get_jwt_identity()
+    try:
+        data = BatchIdsSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e:
+        return error_response(json.loads(e.json()), 400)
+
+    object_ids = _batch_object_ids(data.ids)
+    found = _find_batch(current_user_id, object_ids, {"status": 1})
+    deletable = [oid for oid, t in found.items() if t.get("status") != "processing"]
+
+    if deletable:
+        mongo.db.transactions.delete_many({
+            "_id": {"$in": deletable},
+            "user_id": ObjectId(current_user_id),
+            "status": {"$ne": "processing"}
+        })
+        record_tombstones(current_user_id, deletable)
+        invalidate_category_spend(current_user_id)
+        invalidate_user_cache(current_user_id)
+
+    results = []
+    for raw, oid in object_ids.items():
+        if oid is None:
+            status = "invalid_id"
+        elif oid not in found:
+            status = "not_found"
+        elif found[oid].get("status") == "processing":
+            status = "processing"
+        else:
+            status = "deleted"
+        results.append({"id": raw, "status": status})
+
+    return success_response({"deleted": len(deletable), "results": results})
+
+
+@transactions_bp.route('/batch/update', methods=['POST'])
+@jwt_required()
+def update_transactions_batch():
+    """
+    Update amount, category and/or description of several transactions with one
+    $in lookup and one bulk_write. Each item gets its own result: updated,
+    not_found, invalid_id or processing (AI results would overwrite the edit).
+    """
+    current_user_id = get_jwt_identity()
+    try:
+        data = BatchUpdateSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e:
+        return error_response(json.loads(e.json()), 400)
+
+    object_ids = _batch_object_ids([item.id for item in data.updates])
+    found = _find_batch(current_user_id, object_ids, {"status": 1})
+    now = datetime.utcnow()
+
+    results = []
+    operations = []
+    for item in data.updates:
+        oid = object_ids[item.id]
+        if oid is None:
+            results.append({"id": item.id, "status": "invalid_id"})
+        elif oid not in found:
+            results.append({"id": item.id, "status": "not_found"})
+        elif found[oid].get("status") == "processing":
+            results.append({"id": item.id, "status": "processing"})
+        else:
+            changes = item.model_dump(exclude={"id"}, exclude_none=True)
+            operations.append(UpdateOne(
+                {"_id": oid, "user_id": ObjectId(current_user_id), "status": {"$ne": "processing"}},
+                {"$set": {**changes, "updated_at": now}}
+            ))
+            results.append({"id": item.id, "status": "updated"})
+
+    if operations:
+        mongo.db.transactions.bulk_write(operations, ordered=False)
+        invalidate_category_spend(current_user_id)
+        invalidate_user_cache(current_user_id)
+
+    return success_response({"updated": len(operations), "results": results})
+
+
+@transactions_bp.route('/recurring', methods=['GET'])
+@jwt_required()
+@etag_per_user
+@cached_per_user('recurring')
+def get_recurring_transactions():
+    """
+    Recurring charges detected in the user's transactions (subscriptions, rent,
+    recharges): period, typical amount and when the next one is expected.
+    """
+    current_user_id = get_jwt_identity()
+    items = sorted(get_active_recurring([ObjectId(current_user_id)]), key=lambda item: item["next_expected"])
+    return success_response([
+        {field: item.get(field) for field in (
+            "_id", "description", "category", "amount", "period", "interval_days", "last_seen", "next_expected"
+        )}
+        for item in items
+    ])
+
+
 @transactions_bp.route('/<string:transaction_id>', methods=['GET'])
 @jwt_required()
+@etag_per_user
 def get_transaction(transaction_id):
     current_user_id = get_jwt_identity()
+    projection, error = _projection_or_error(DETAIL_DEFAULT_FIELDS)
+    if error:
+        return error
     try:
         transaction = mongo.db.transactions.find_one({
             "_id": ObjectId(transaction_id),
             "user_id": ObjectId(current_user_id)
-        })
+        }, projection)
         if transaction:
-            transaction['_id'] = str(transaction['_id'])
-            transaction['user_id'] = str(transaction['user_id'])
-            transaction['date'] = transaction['date'].replace(tzinfo=timezone.utc).isoformat()
             return success_response(transaction)
         else:
             return error_response("Transaction not found", 404)
@@ -180,6 +389,9 @@ def delete_transaction(transaction_id):
         
         if result:
             ai_processing_transactions.pop(transaction_id, None)
+            record_tombstones(current_user_id, [result["_id"]])
+            invalidate_category_spend(current_user_id)
+            invalidate_user_cache(current_user_id)
             return success_response({"message": "Transaction deleted successfully"})
         else:
             return error_response("Transaction not found", 404)
@@ -190,6 +402,8 @@ def delete_transaction(transaction_id):
     
 @transactions_bp.route('/summary', methods=['GET'])
 @jwt_required()
+@etag_per_user
+@cached_per_user('transaction_summary')
 def get_transaction_summary():
     current_user_id = get_jwt_identity()
     user_object_id = ObjectId(current_user_id)
@@ -247,9 +461,10 @@ def get_transaction_status(transaction_id):
                 if elapsed > 30:
                     mongo.db.transactions.update_one(
                         {"_id": ObjectId(transaction_id)},
-                        {"$set": {"status": "failed", "error": "AI processing timeout"}}
+                        {"$set": {"status": "failed", "error": "AI processing timeout", "updated_at": datetime.utcnow()}}
                     )
                     ai_processing_transactions.pop(transaction_id, None)
+                    invalidate_user_cache(current_user_id)
                     status = "failed"
             
             return success_response({"status": status})
@@ -262,6 +477,8 @@ def get_transaction_status(transaction_id):
 
 @transactions_bp.route('/history', methods=['GET'])
 @jwt_required()
+@etag_per_user
+@cached_per_user('transaction_history')
 def get_transaction_history():
     current_user_id = get_jwt_identity()
     user_object_id = ObjectId(current_user_id)
@@ -332,13 +549,21 @@ def get_transaction_history():
     
     result = list(mongo.db.transactions.aggregate(pipeline))
     
-    for day_group in result:
-        for transaction in day_group["transactions"]:
-            transaction["date"] = transaction["date"].replace(tzinfo=timezone.utc).isoformat()
-    
     return success_response(result)
 
     
+# The category list only changes with a deploy: serialize it once, with a strong ETag
+CATEGORIES_BODY = dumps_bytes({"status": "success", "data": sorted(PREDEFINED_CATEGORIES)})
+CATEGORIES_ETAG = hashlib.sha1(CATEGORIES_BODY).hexdigest()[:20]
+CATEGORIES_MAX_AGE = 86400
+
+
 @transactions_bp.route('/categories', methods=['GET'])
 def get_categories():
-    return success_response(list(PREDEFINED_CATEGORIES))
\ No newline at end of file
+    if request.if_none_match.contains(CATEGORIES_ETAG):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(CATEGORIES_BODY, mimetype='application/json')
+    response.set_etag(CATEGORIES_ETAG)
+    response.headers['Cache-Control'] = f'public, max-age={CATEGORIES_MAX_AGE}'
+    return response
\ No newline at end of file
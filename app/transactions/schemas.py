@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, model_validator, field_validator
 from typing import Literal
 
+# Upper bound on transactions addressed by one batch request
+MAX_BATCH_SIZE = 100
+
 PREDEFINED_CATEGORIES = {
     "Food & Dining", "Transportation", "Utilities", "Housing", "Shopping",
     "Entertainment", "Health & Wellness", "Groceries", "Bills & Fees",
@@ -15,6 +18,8 @@ class AddTransactionSchema(BaseModel):
     category: str | None = None
     # FIX #3: Description Length (Schema)
     description: str | None = Field(None, max_length=200)
+    # Record it even if it looks like a duplicate of a recent transaction
+    allow_duplicate: bool = False
 
     @model_validator(mode='after')
     def check_fields_for_mode(self):
@@ -27,4 +32,37 @@ class AddTransactionSchema(BaseModel):
             if self.category not in PREDEFINED_CATEGORIES:
                 raise ValueError(f'Invalid category. Must be one of {", ".join(PREDEFINED_CATEGORIES)}')
         
-        return self
\ No newline at end of file
+        return self
+
+
+class BatchIdsSchema(BaseModel):
+    ids: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class BatchUpdateItem(BaseModel):
+    id: str
+    amount: float | None = Field(None, gt=0, le=10000000)
+    category: str | None = None
+    description: str | None = Field(None, min_length=1, max_length=200)
+
+    @model_validator(mode='after')
+    def check_fields(self):
+        if self.amount is None and self.category is None and self.description is None:
+            raise ValueError('At least one of amount, category or description is required.')
+        if self.category is not None and self.category not in PREDEFINED_CATEGORIES:
+            raise ValueError(f'Invalid category. Must be one of {", ".join(PREDEFINED_CATEGORIES)}')
+        if self.amount is not None:
+            self.amount = round(self.amount, 2)
+        return self
+
+
+class BatchUpdateSchema(BaseModel):
+    updates: list[BatchUpdateItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+    @field_validator('updates')
+    @classmethod
+    def check_unique_ids(cls, updates):
+        ids = [item.id for item in updates]
+        if len(set(ids)) != len(ids):
+            raise ValueError('Each transaction may appear only once per batch.')
+        return updates
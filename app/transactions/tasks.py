@@ -3,8 +3,31 @@ from app import celery
 from app import mongo
 from bson import ObjectId
 from app.services.gemini_service import parse_expense_test, generate_spending_summary
+from app.services.cache_service import invalidate_user_cache
+from app.services.anomaly_service import check_transaction_anomaly
+from app.services.budget_alert_service import record_category_spend
+from app.services.transaction_service import duplicate_hash, find_duplicate, duplicate_policy
+from app.services.recurring_service import detect_recurring_for_user
+from app.utils import get_redis
 from datetime import datetime, timedelta, timezone
 
+# Set while a recurring detection run is queued for a user
+RECURRING_DEBOUNCE_KEY = "recurring:queued:{user_id}"
+RECURRING_DEBOUNCE_SECONDS = 60
+
+
+def schedule_recurring_detection(user_id):
+    """
+    Queue detect_recurring_task for a user after a new transaction. Runs are
+    debounced: a burst of expenses within RECURRING_DEBOUNCE_SECONDS shares
+    one run, which then reads all of them at once.
+    """
+    try:
+        if get_redis().set(RECURRING_DEBOUNCE_KEY.format(user_id=user_id), 1, nx=True, ex=RECURRING_DEBOUNCE_SECONDS):
+            detect_recurring_task.apply_async((str(user_id),), countdown=RECURRING_DEBOUNCE_SECONDS)
+    except Exception as e:
+        current_app.logger.warning(f"Could not schedule recurring detection for user {user_id}: {e}")
+
 @celery.task
 def process_ai_transaction(transaction_id: str):
     """
@@ -12,6 +35,7 @@ def process_ai_transaction(transaction_id: str):
     Logs the outcome of the operation.
     """
     logger = current_app.logger
+    transaction = None
 
     try:
         transaction = mongo.db.transactions.find_one({"_id": ObjectId(transaction_id)})
@@ -35,6 +59,7 @@ def process_ai_transaction(transaction_id: str):
                 {"_id": ObjectId(transaction_id)},
                 {"$set": {
                     "status": "failed",
+                    "updated_at": datetime.utcnow(),
                     "failure_reason": "AI parsing failed",
                     "error_details": error_message[:500]
                 }}
@@ -47,6 +72,7 @@ def process_ai_transaction(transaction_id: str):
                 {"_id": ObjectId(transaction_id)},
                 {"$set": {
                     "status": "failed",
+                    "updated_at": datetime.utcnow(),
                     "failure_reason": error_msg,
                     "error_details": f"Input text: {raw_text[:100]}..."
                 }}
@@ -58,12 +84,33 @@ def process_ai_transaction(transaction_id: str):
             "amount": parsed_data.get("amount"),
             "category": parsed_data.get("category"),
             "description": parsed_data.get("description"),
-            "status": "completed"
+            "status": "completed",
+            "updated_at": datetime.utcnow()
         }
+        # Now that amount and description are known, look for the same expense logged another way
+        update_fields["dup_hash"] = duplicate_hash({**transaction, **update_fields})
+        duplicate = find_duplicate({**transaction, **update_fields})
+        if duplicate:
+            update_fields["duplicate_of"] = duplicate["_id"]
+            if duplicate_policy() == "reject" and not transaction.get("duplicate_allowed"):
+                update_fields.update({
+                    "status": "failed",
+                    "failure_reason": "Duplicate of a recent transaction",
+                    "error_details": f"Same amount and description as transaction {duplicate['_id']}"
+                })
+                mongo.db.transactions.update_one({"_id": ObjectId(transaction_id)}, {"$set": update_fields})
+                logger.info(f"AI_TASK_DUPLICATE: Transaction {transaction_id} duplicates {duplicate['_id']}.")
+                return
+
+        anomaly = check_transaction_anomaly({**transaction, **update_fields})
+        if anomaly:
+            update_fields["anomaly"] = anomaly
         mongo.db.transactions.update_one(
             {"_id": ObjectId(transaction_id)},
             {"$set": update_fields}
         )
+        record_category_spend({**transaction, **update_fields})
+        schedule_recurring_detection(transaction["user_id"])
         logger.info(f"AI_TASK_SUCCESS: Successfully processed transaction {transaction_id}.")
 
     except Exception as e:
@@ -73,10 +120,29 @@ def process_ai_transaction(transaction_id: str):
             {"_id": ObjectId(transaction_id)},
             {"$set": {
                 "status": "failed",
+                "updated_at": datetime.utcnow(),
                 "failure_reason": "Unexpected server error",
                 "error_details": error_message[:500]
             }}
         )
+    finally:
+        # Every outcome changes the transaction, so the user's cached reads are stale
+        if transaction:
+            invalidate_user_cache(transaction["user_id"])
+
+
+
+@celery.task
+def detect_recurring_task(user_id: str):
+    """
+    Incremental recurring transaction detection for one user (see
+    detect_recurring_for_user): only transactions written since the last run are read.
+    """
+    # New transactions from now on need another run
+    get_redis().delete(RECURRING_DEBOUNCE_KEY.format(user_id=user_id))
+    if detect_recurring_for_user(user_id):
+        invalidate_user_cache(user_id)
+
         
 @celery.task
 def get_ai_summary_task(user_id_str: str):
@@ -1,4 +1,8 @@
-from flask import jsonify, current_app
+import hmac
+import redis
+from datetime import datetime
+from functools import wraps
+from flask import jsonify, current_app, request
 from itsdangerous import URLSafeTimedSerializer
 
 def success_response(data, status_code=200):
@@ -21,6 +25,40 @@ def error_response(message, status_code):
     }
     return jsonify(response), status_code
 
+def get_redis():
+    """
+    Returns a Redis client for the app's broker URL.
+    The client (and its connection pool) is created once per app and reused,
+    instead of opening a new connection on every request.
+    """
+    client = current_app.extensions.get('redis_client')
+    if client is None:
+        client = redis.from_url(current_app.config['BROKER_URL'])
+        current_app.extensions['redis_client'] = client
+    return client
+
+def get_month_range(year, month):
+    """
+    Start (inclusive) and end (exclusive) of a calendar month, as naive UTC datetimes.
+    """
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+def cron_secret_required(view):
+    """
+    Protects cron and internal endpoints with the X-Cron-Secret header.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cron_secret = request.headers.get('X-Cron-Secret', '')
+        expected_secret = current_app.config.get('CRON_SECRET', '')
+
+        if expected_secret and not hmac.compare_digest(cron_secret, expected_secret):
+            return {"error": "Unauthorized"}, 401
+        return view(*args, **kwargs)
+    return wrapper
+
 def generate_reset_token(email):
     """
     Generates a secure, time-limited token for password reset.
@@ -44,4 +82,4 @@ def verify_reset_token(token, expiration=3600):
         email = serializer.loads(token, salt='password-reset-salt', max_age=expiration)
         return email
     except Exception:
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,725 @@
+from flask import current_app
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from app import mongo
+from app.utils import get_redis, get_month_range
+from app.services.twilio_service import twilio_service
+from app.services.gemini_service import parse_expense_test
+from app.services.budget_alert_service import evaluate_budget_alert, invalidate_category_spend
+from app.services.forecast_service import get_spend_forecast
+from app.services.cache_service import invalidate_user_cache
+from app.services.sync_service import record_tombstones
+from app.services.transaction_service import (
+    insert_transaction, parse_transaction_refs, find_transactions_by_refs, MAX_REFS_PER_COMMAND,
+    DuplicateTransaction, duplicate_policy
+)
+from app.tasks.whatsapp_tasks import send_whatsapp_task
+from app.transactions.tasks import schedule_recurring_detection
+
+# Cached sender -> user id mapping
+SENDER_CACHE_KEY = "wa:sender:{e164}"
+SENDER_CACHE_TTL = 300
+SENDER_CACHE_MISS_TTL = 60
+
+CATEGORIES = [
+    "Food & Dining", "Transportation", "Shopping", "Entertainment",
+    "Bills & Utilities", "Health & Fitness", "Travel", "Education",
+    "Groceries", "Personal Care", "Home", "Other"
+]
+
+
+def parse_expense_message(message):
+    """
+    Parse expense message using Gemini AI.
+    Examples: "500 coffee", "coffee for 500 rs", "lunch 150 rupees"
+    """
+    message = message.strip()
+    
+    # Use Gemini AI for all parsing - it's smarter and more accurate
+    try:
+        result = parse_expense_test(message)
+        if result:
+            return {
+                "amount": result.get("amount", 0),
+                "description": result.get("description", message),
+                "category": result.get("category", "Other"),
+                "source": "gemini"
+            }
+        else:
+            # Gemini returned null (couldn't parse)
+            return {
+                "error": "could_not_parse",
+                "message": "Couldn't understand the expense. Try format: '500 coffee' or 'coffee for 500 rupees'"
+            }
+    except Exception as e:
+        current_app.logger.error(f"Gemini parsing failed: {e}")
+        return {
+            "error": "api_error",
+            "message": "AI service temporarily unavailable. Please try again."
+        }
+
+
+def guess_category(description):
+    """Simple keyword-based category guessing."""
+    desc = description.lower()
+    
+    keywords = {
+        "Food & Dining": ["coffee", "tea", "lunch", "dinner", "breakfast", "food", "restaurant", "cafe", "pizza", "burger", "snack"],
+        "Transportation": ["uber", "ola", "taxi", "bus", "train", "metro", "petrol", "fuel", "auto", "car"],
+        "Shopping": ["amazon", "flipkart", "mall", "store", "shop", "clothes", "shoes"],
+        "Entertainment": ["movie", "netflix", "spotify", "game", "concert", "party"],
+        "Bills & Utilities": ["bill", "electricity", "water", "internet", "phone", "recharge"],
+        "Health & Fitness": ["gym", "medicine", "doctor", "hospital", "health"],
+        "Groceries": ["grocery", "vegetables", "fruits", "milk", "bread"],
+    }
+    
+    for category, words in keywords.items():
+        if any(word in desc for word in words):
+            return category
+    
+    return "Other"
+
+
+def resolve_whatsapp_user_id(whatsapp_number):
+    """Find the user id for a verified WhatsApp number.
+    
+    Numbers are matched on the canonical E.164 `whatsapp_e164` field (unique
+    partial index), and the result is cached briefly in Redis, so resolving
+    a sender costs one indexed lookup or none.
+    Returns the user id as a string, or None if the number isn't linked.
+    """
+    e164 = twilio_service.normalize_phone_number(whatsapp_number)
+    if not e164:
+        return None
+    
+    cache_key = SENDER_CACHE_KEY.format(e164=e164)
+    try:
+        cached = get_redis().get(cache_key)
+        if cached is not None:
+            return None if cached == b"-" else cached.decode()
+    except Exception as e:
+        current_app.logger.warning(f"Sender cache read failed: {e}")
+    
+    user = mongo.db.users.find_one(
+        {"whatsapp_e164": e164, "whatsapp_verified": True},
+        {"_id": 1}
+    )
+    user_id = str(user['_id']) if user else None
+    
+    try:
+        # Unknown numbers are cached for a shorter time ("-")
+        if user_id:
+            get_redis().setex(cache_key, SENDER_CACHE_TTL, user_id)
+        else:
+            get_redis().setex(cache_key, SENDER_CACHE_MISS_TTL, "-")
+    except Exception as e:
+        current_app.logger.warning(f"Sender cache write failed: {e}")
+    
+    return user_id
+
+
+def invalidate_sender_cache(whatsapp_number):
+    """Drop the cached sender->user mapping for a number (called when links change)."""
+    e164 = twilio_service.normalize_phone_number(whatsapp_number)
+    if not e164:
+        return
+    try:
+        get_redis().delete(SENDER_CACHE_KEY.format(e164=e164))
+    except Exception as e:
+        current_app.logger.warning(f"Sender cache invalidation failed: {e}")
+
+
+def format_transactions_list(transactions, limit=5):
+    """Format transactions for WhatsApp display."""
+    if not transactions:
+        return "📝 No transactions found."
+    
+    lines = ["📊 Your Recent Transactions:\n"]
+    
+    for i, t in enumerate(transactions[:limit], 1):
+        amount = t.get('amount', 0)
+        desc = t.get('description', 'No description')
+        cat = t.get('category', 'Other')
+        date = t.get('date')
+        # Short per-user reference, accepted by /delete and /edit
+        trans_id = t.get('short_ref') or str(t.get('_id', ''))[:8]
+        
+        if isinstance(date, datetime):
+            date_str = date.strftime('%d %b')
+        else:
+            date_str = 'N/A'
+        
+        lines.append(f"{i}. ₹{amount:.2f} - {desc}")
+        lines.append(f"   📁 {cat} | 📅 {date_str} | ID: {trans_id}\n")
+    
+    total = sum(t.get('amount', 0) for t in transactions[:limit])
+    lines.append(f"\n💰 Total (last {len(transactions[:limit])}): ₹{total:.2f}")
+    lines.append("\n💡 Use /delete <ID> to remove a transaction (e.g. /delete 12 15)")
+    
+    return "\n".join(lines)
+
+
+def format_budget_status(user_id):
+    """Format budget status for WhatsApp display."""
+    now = datetime.utcnow()
+    month = now.month
+    year = now.year
+    
+    budgets = list(mongo.db.budgets.find({
+        "user_id": ObjectId(user_id),
+        "month": month,
+        "year": year
+    }))
+    
+    if not budgets:
+        return "🎯 No budgets set for this month.\n\nSet budgets in the FinSight app to track your spending!"
+    
+    lines = ["🎯 Your Budget Status:\n"]
+    
+    total_budget = 0
+    total_spent = 0
+    spent_by_category = {}
+    
+    for budget in budgets:
+        cat = budget.get('category', 'Unknown')
+        limit = budget.get('limit', 0)
+        total_budget += limit
+        
+        # Get spending for this category
+        spending = list(mongo.db.transactions.aggregate([
+            {
+                "$match": {
+                    "user_id": ObjectId(user_id),
+                    "category": cat,
+                    "date": {
+                        "$gte": datetime(year, month, 1),
+                        "$lt": datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+                    }
+                }
+            },
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ]))
+        
+        spent = spending[0]['total'] if spending else 0
+        total_spent += spent
+        spent_by_category[cat] = spent
+    
+    forecast = get_spend_forecast(user_id, spent_by_category, now)
+    total_projected = 0
+    
+    for budget in budgets:
+        cat = budget.get('category', 'Unknown')
+        limit = budget.get('limit', 0)
+        spent = spent_by_category[cat]
+        projected = forecast[cat]['projected']
+        total_projected += projected
+        
+        percentage = (spent / limit * 100) if limit > 0 else 0
+        emoji = "🟢" if percentage < 75 else "🟡" if percentage < 100 else "🔴"
+        
+        lines.append(f"{emoji} {cat}: ₹{spent:.2f} / ₹{limit:.2f} ({percentage:.0f}%)")
+        if projected > limit > 0 and spent <= limit:
+            lines.append(f"   📈 On track for ₹{projected:.2f} by month end")
+    
+    lines.append(f"\n💰 Total: ₹{total_spent:.2f} / ₹{total_budget:.2f}")
+    lines.append(f"📈 Projected by month end: ₹{total_projected:.2f} / ₹{total_budget:.2f}")
+    
+    return "\n".join(lines)
+
+
+def get_month_spending(user_id, now):
+    """
+    This month's spend by category and last month's total in one aggregation.
+    Only completed transactions are counted, with the same month boundaries as
+    GET /api/transactions/summary, so the numbers always agree.
+    """
+    current_start, _ = get_month_range(now.year, now.month)
+    if now.month == 1:
+        last_start, _ = get_month_range(now.year - 1, 12)
+    else:
+        last_start, _ = get_month_range(now.year, now.month - 1)
+    
+    pipeline = [
+        {"$match": {
+            "user_id": ObjectId(user_id),
+            "status": "completed",
+            "date": {"$gte": last_start}
+        }},
+        {"$facet": {
+            "current_by_category": [
+                {"$match": {"date": {"$gte": current_start}}},
+                {"$group": {"_id": "$category", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$sort": {"total": -1}}
+            ],
+            "last_month": [
+                {"$match": {"date": {"$lt": current_start}}},
+                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+            ]
+        }}
+    ]
+    
+    result = list(mongo.db.transactions.aggregate(pipeline))[0]
+    categories = result["current_by_category"]
+    return {
+        "categories": categories,
+        "current_total": sum(c["total"] for c in categories),
+        "current_count": sum(c["count"] for c in categories),
+        "last_total": result["last_month"][0]["total"] if result["last_month"] else 0
+    }
+
+
+def format_summary(user_id):
+    """Format monthly summary for WhatsApp."""
+    now = datetime.utcnow()
+    spending = get_month_spending(user_id, now)
+    
+    if not spending["current_count"]:
+        return "📊 No transactions this month yet!"
+    
+    total = spending["current_total"]
+    
+    lines = [f"📊 {now.strftime('%B %Y')} Summary:\n"]
+    lines.append(f"💰 Total Spent: ₹{total:.2f}")
+    lines.append(f"📝 Total Transactions: {spending['current_count']}\n")
+    lines.append("📁 By Category:")
+    
+    for cat in spending["categories"]:
+        pct = (cat['total'] / total * 100) if total > 0 else 0
+        lines.append(f"   • {cat['_id'] or 'Other'}: ₹{cat['total']:.2f} ({pct:.0f}%)")
+    
+    return "\n".join(lines)
+
+
+def _describe_missing_refs(short_refs, object_ids, found, invalid):
+    """References from the command that didn't match any of the user's transactions."""
+    found_refs = {t.get('short_ref') for t in found}
+    found_ids = {t['_id'] for t in found}
+    missing = [str(r) for r in short_refs if r not in found_refs]
+    missing += [str(i) for i in object_ids if i not in found_ids]
+    return missing + invalid
+
+
+def handle_delete_command(user_id, message_body):
+    """Handle /delete <ID> [<ID> ...] command"""
+    parts = message_body.strip().split()
+    if len(parts) < 2:
+        return "❌ Usage: /delete <ID> [<ID> ...]\n\nUse /transactions to see IDs."
+    
+    short_refs, object_ids, invalid = parse_transaction_refs(parts[1:])
+    if len(short_refs) + len(object_ids) > MAX_REFS_PER_COMMAND:
+        return f"❌ You can delete up to {MAX_REFS_PER_COMMAND} transactions at once."
+    if not short_refs and not object_ids:
+        return "❌ Invalid transaction ID.\n\nUse /transactions to see valid IDs."
+    
+    # One indexed lookup for all references
+    transactions = find_transactions_by_refs(
+        user_id, short_refs, object_ids, {"amount": 1, "description": 1, "short_ref": 1}
+    )
+    missing = _describe_missing_refs(short_refs, object_ids, transactions, invalid)
+    
+    if not transactions:
+        return "❌ Transaction not found.\n\nUse /transactions to see valid IDs."
+    
+    # Delete the transactions
+    mongo.db.transactions.delete_many({
+        "_id": {"$in": [t['_id'] for t in transactions]},
+        "user_id": ObjectId(user_id)
+    })
+    record_tombstones(user_id, [t['_id'] for t in transactions])
+    invalidate_category_spend(user_id)
+    invalidate_user_cache(user_id)
+    
+    lines = [f"✅ Deleted: ₹{t.get('amount', 0):.2f} - {t.get('description', 'Unknown')}" for t in transactions]
+    if missing:
+        lines.append(f"\n❌ Not found: {', '.join(missing)}")
+    else:
+        lines.append("\nTransaction removed successfully." if len(transactions) == 1 else "\nTransactions removed successfully.")
+    
+    return "\n".join(lines)
+
+
+def handle_edit_command(user_id, message_body):
+    """Handle /edit <ID>[,<ID>...] amount/category/description <value> command"""
+    parts = message_body.strip().split()
+    if len(parts) < 4:
+        return "❌ Usage: /edit <ID> <field> <value>\n\nFields: amount, category, description\nExample: /edit 12 amount 500\nSeveral at once: /edit 12,15 category Food & Dining"
+    
+    field = parts[2].lower()
+    value = ' '.join(parts[3:])
+    
+    # Validate field
+    if field not in ['amount', 'category', 'description']:
+        return "❌ Invalid field. Use: amount, category, or description"
+    
+    short_refs, object_ids, invalid = parse_transaction_refs([parts[1]])
+    if len(short_refs) + len(object_ids) > MAX_REFS_PER_COMMAND:
+        return f"❌ You can edit up to {MAX_REFS_PER_COMMAND} transactions at once."
+    if not short_refs and not object_ids:
+        return "❌ Invalid transaction ID."
+    
+    # Build update
+    update = {}
+    if field == 'amount':
+        try:
+            new_amount = float(value)
+            if new_amount <= 0:
+                return "❌ Amount must be positive."
+            update['amount'] = new_amount
+        except ValueError:
+            return "❌ Invalid amount. Use a number."
+    elif field == 'category':
+        # Validate category
+        if value.title() not in CATEGORIES:
+            return f"❌ Invalid category. Use: {', '.join(CATEGORIES[:5])}..."
+        update['category'] = value.title()
+    elif field == 'description':
+        update['description'] = value
+    
+    update['updated_at'] = datetime.utcnow()
+    
+    # Find transactions (one indexed lookup)
+    transactions = find_transactions_by_refs(user_id, short_refs, object_ids, {"short_ref": 1})
+    if not transactions:
+        return "❌ Transaction not found."
+    missing = _describe_missing_refs(short_refs, object_ids, transactions, invalid)
+    
+    # Update
+    mongo.db.transactions.update_many(
+        {"_id": {"$in": [t['_id'] for t in transactions]}, "user_id": ObjectId(user_id)},
+        {"$set": update}
+    )
+    invalidate_category_spend(user_id)
+    invalidate_user_cache(user_id)
+    
+    reply = f"✅ Updated!\n\n{field.title()}: {value}"
+    if len(transactions) > 1:
+        reply += f"\nTransactions: {len(transactions)}"
+    if missing:
+        reply += f"\n\n❌ Not found: {', '.join(missing)}"
+    return reply
+
+
+def handle_weekly_command(user_id, message_body):
+    """Handle /weekly on/off command"""
+    parts = message_body.strip().split()
+    if len(parts) < 2:
+        # Show current status
+        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+        status = user.get('whatsapp_weekly', False)
+        return f"📊 Weekly Summary: {'✅ ON' if status else '❌ OFF'}\n\nUse /weekly on or /weekly off to change."
+    
+    action = parts[1].lower()
+    if action == 'on':
+        mongo.db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"whatsapp_weekly": True}}
+        )
+        invalidate_user_cache(user_id)
+        return "✅ Weekly summary enabled!\n\nYou'll receive a spending summary every Sunday."
+    elif action == 'off':
+        mongo.db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"whatsapp_weekly": False}}
+        )
+        invalidate_user_cache(user_id)
+        return "✅ Weekly summary disabled."
+    else:
+        return "❌ Use /weekly on or /weekly off"
+
+
+def handle_alert_command(user_id, message_body):
+    """Handle /alert on/off command"""
+    parts = message_body.strip().split()
+    if len(parts) < 2:
+        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+        status = user.get('whatsapp_alerts', False)
+        return f"🔔 Budget Alerts: {'✅ ON' if status else '❌ OFF'}\n\nUse /alert on or /alert off to change."
+    
+    action = parts[1].lower()
+    if action == 'on':
+        mongo.db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"whatsapp_alerts": True}}
+        )
+        invalidate_user_cache(user_id)
+        return "✅ Budget alerts enabled!\n\nYou'll be notified when you reach 80% of any budget."
+    elif action == 'off':
+        mongo.db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"whatsapp_alerts": False}}
+        )
+        invalidate_user_cache(user_id)
+        return "✅ Budget alerts disabled."
+    else:
+        return "❌ Use /alert on or /alert off"
+
+
+def handle_compare_command(user_id):
+    """Handle /compare command - compare to last month"""
+    now = datetime.utcnow()
+    
+    if now.month == 1:
+        last_month = 12
+        last_year = now.year - 1
+    else:
+        last_month = now.month - 1
+        last_year = now.year
+    
+    spending = get_month_spending(user_id, now)
+    current_total = spending["current_total"]
+    last_total = spending["last_total"]
+    
+    if last_total == 0:
+        return "📊 No spending data from last month to compare."
+    
+    diff = current_total - last_total
+    pct = (diff / last_total) * 100
+    
+    month_name = now.strftime('%B')
+    last_month_name = datetime(last_year, last_month, 1).strftime('%B')
+    
+    lines = [f"📊 {month_name} vs {last_month_name}:\n"]
+    lines.append(f"• This month: ₹{current_total:.2f}")
+    lines.append(f"• Last month: ₹{last_total:.2f}\n")
+    
+    if diff > 0:
+        lines.append(f"🔴 You spent ₹{diff:.2f} MORE ({pct:.1f}% increase)")
+    elif diff < 0:
+        lines.append(f"🟢 You spent ₹{abs(diff):.2f} LESS ({abs(pct):.1f}% decrease)")
+    else:
+        lines.append("🟡 Spending is same as last month")
+    
+    return "\n".join(lines)
+
+
+def handle_incoming_message(from_number, message_body, message_sid):
+    """
+    Process one inbound WhatsApp message: resolve the user, run the command
+    or parse the expense, and send the reply. Runs in the Celery worker.
+    """
+    # Extract WhatsApp number early for logging
+    whatsapp_number = from_number.replace('whatsapp:', '')
+    
+    # Issue #7: Validate message length
+    if len(message_body) > 1000:
+        current_app.logger.warning(f"Message too long from {whatsapp_number}: {len(message_body)} chars")
+        reply = "❌ Message too long. Please keep your message under 1000 characters."
+        twilio_service.send_whatsapp_message(from_number, reply)
+        return
+    
+    # Find user by WhatsApp
+    user_id = resolve_whatsapp_user_id(whatsapp_number)
+    
+    if not user_id:
+        current_app.logger.info(f"WhatsApp message from unknown number: {whatsapp_number}")
+        # User not linked
+        reply = "👋 Welcome to FinSight AI!\n\n"
+        reply += "Your WhatsApp is not linked to your account.\n"
+        reply += "Please open the FinSight app, go to Profile, and link your WhatsApp number."
+        
+        twilio_service.send_whatsapp_message(from_number, reply)
+        return
+    
+    message_lower = message_body.lower()
+    alert_reply = None
+    
+    # Log incoming command
+    current_app.logger.info(f"WhatsApp command from user {user_id}: {message_body}")
+    
+    # Command handling
+    if message_lower == '/start' or message_lower == '/guide':
+        reply = """Welcome to FinSight AI!
+
+Here's how to use WhatsApp bot:
+
+ADD EXPENSES:
+"coffee 50" - Quick add
+"lunch at cafe 200 rupees" - Natural language
+"uber ride 150" - Works great
+
+VIEW DATA:
+/transactions - Recent 5 expenses
+/budget - Budget status
+/summary - This month spending
+/compare - vs last month
+
+MANAGE:
+/delete <ID> - Remove expense (several: /delete 12 15)
+/edit <ID> amount 500 - Edit
+
+SETTINGS:
+/weekly on - Enable weekly summary
+/weekly off - Disable
+/alert on - Budget alerts (80% warning)
+/alert off - Disable
+
+Need help? Type /help for all commands"""
+        
+    elif message_lower == '/help':
+        reply = """FinSight Commands Guide
+
+ADD EXPENSES:
+"500 coffee" - Add Rs.500
+"lunch 200 rupees" - Natural language
+"uber for 150" - Transportation
+
+VIEW DATA:
+/transactions - Last 5 expenses
+/budget - Budget status
+/summary - Monthly spending
+/compare - vs last month
+
+MANAGE:
+/delete <ID> [<ID> ...] - Delete transactions
+/edit <ID> amount 500 - Edit amount
+/edit <ID> category Food - Edit category
+/edit 12,15 category Travel - Edit several
+
+SETTINGS:
+/weekly on - Enable weekly summary
+/weekly off - Disable
+/alert on - Budget alerts
+/alert off - Disable alerts
+
+/start - Show quick start guide"""
+        
+    elif message_lower == '/transactions':
+        transactions = list(mongo.db.transactions.find(
+            {"user_id": ObjectId(user_id)}
+        ).sort("date", -1).limit(5))
+        reply = format_transactions_list(transactions)
+        
+    elif message_lower == '/budget' or message_lower == '/budgets':
+        reply = format_budget_status(user_id)
+        
+    elif message_lower == '/summary':
+        reply = format_summary(user_id)
+        
+    elif message_lower.startswith('/delete'):
+        reply = handle_delete_command(user_id, message_body)
+        
+    elif message_lower.startswith('/edit'):
+        reply = handle_edit_command(user_id, message_body)
+        
+    elif message_lower.startswith('/weekly'):
+        reply = handle_weekly_command(user_id, message_body)
+        
+    elif message_lower.startswith('/alert'):
+        reply = handle_alert_command(user_id, message_body)
+        
+    elif message_lower == '/compare':
+        reply = handle_compare_command(user_id)
+        
+    else:
+        # Try to parse as expense
+        expense = parse_expense_message(message_body)
+        
+        # Issue #8: Handle parsing errors properly
+        if expense and "error" in expense:
+            reply = f"❌ {expense.get('message', 'Could not understand. Try: 500 coffee')}"
+            twilio_service.send_whatsapp_message(from_number, reply)
+            return
+        
+        if expense:
+            # Add transaction to database
+            transaction_doc = {
+                "user_id": ObjectId(user_id),
+                "amount": expense['amount'],
+                "category": expense['category'],
+                "description": expense['description'],
+                "date": datetime.utcnow(),
+                "status": "completed",
+                "source": "whatsapp",
+                "raw_text": message_body
+            }
+            if message_sid:
+                transaction_doc["message_sid"] = message_sid  # For idempotency
+            
+            try:
+                insert_transaction(transaction_doc)
+            except DuplicateKeyError:
+                # Unique sparse index on message_sid: this message was already recorded
+                current_app.logger.info(f"Duplicate WhatsApp transaction ignored: {message_sid}")
+                return
+            except DuplicateTransaction as e:
+                reply = f"⚠️ Looks like you already logged this: {describe_duplicate(e.existing)}\n\n"
+                reply += "Not added. Add a word to the description to log it again (e.g. '500 coffee again')."
+                twilio_service.send_whatsapp_message(from_number, reply)
+                return
+            invalidate_user_cache(user_id)
+            schedule_recurring_detection(user_id)
+            
+            # Log the transaction add
+            current_app.logger.info(f"WhatsApp transaction added for user {user_id}: ₹{expense['amount']} - {expense['description']}")
+            
+            # Check budget alerts (queued after the reply below)
+            alert_reply = evaluate_budget_alert(user_id, expense['category'], expense['amount'])
+            
+            reply = "Expense Added!\n\n"
+            reply += f"Amount: Rs.{expense['amount']:.2f}\n"
+            reply += f"Category: {expense['category']}\n"
+            reply += f"Description: {expense['description']}\n\n"
+            if transaction_doc.get('anomaly'):
+                reply += f"⚠️ Unusually high for {expense['category']} (you usually spend about Rs.{transaction_doc['anomaly']['typical_amount']:.2f})\n\n"
+            if transaction_doc.get('duplicate_of') and duplicate_policy() == 'warn':
+                reply += "⚠️ Possible duplicate of a recent expense. Use /transactions to check, /delete <ID> to remove.\n\n"
+            reply += f"(via {expense['source']})\n\n"
+            reply += "---Quick Tips---\n"
+            reply += "/transactions - View expenses\n"
+            reply += "/budget - Check budgets\n"
+            reply += "/start - Full guide"
+        else:
+            reply = "Sorry, couldn't understand.\n\n"
+            reply += "Try: '500 coffee'\n"
+            reply += "Type /help for all commands"
+    
+    # Send reply
+    twilio_service.send_whatsapp_message(from_number, reply)
+    
+    if alert_reply:
+        send_whatsapp_task.delay(from_number, alert_reply)
+
+
+def describe_duplicate(transaction):
+    """One line for an earlier transaction a new one duplicates: "Rs.500.00 - coffee at 14:05 UTC (ID: 12)"."""
+    line = f"Rs.{transaction.get('amount', 0):.2f} - {transaction.get('description', '')}"
+    if isinstance(transaction.get('date'), datetime):
+        line += f" at {transaction['date'].strftime('%H:%M')} UTC"
+    if transaction.get('short_ref'):
+        line += f" (ID: {transaction['short_ref']})"
+    return line
+
+
+def format_weekly_summary(week):
+    """
+    Format the weekly summary message from one user's weekly totals.
+    `week` is a row of the weekly aggregation: {"total", "count", "categories": [{"category", "total"}]}.
+    """
+    total = week.get('total', 0)
+    if not week.get('count'):
+        return None
+    
+    lines = ["📊 *Your Weekly Summary*\n"]
+    lines.append(f"💰 Total spent: ₹{total:.2f}")
+    lines.append(f"📝 Transactions: {week['count']}\n")
+    
+    # Top categories
+    sorted_cats = sorted(week.get('categories', []), key=lambda x: x['total'], reverse=True)[:3]
+    lines.append("🏆 Top categories:")
+    for cat in sorted_cats:
+        pct = (cat['total'] / total * 100) if total > 0 else 0
+        lines.append(f"   • {cat['category']}: ₹{cat['total']:.2f} ({pct:.0f}%)")
+    
+    lines.append("\n💡 Use /summary for full month details")
+    
+    return "\n".join(lines)
+
+
+def format_recurring_reminder(items):
+    """Reminder of recurring charges expected tomorrow (rows of recurring_items)."""
+    lines = ["🔁 *Coming up tomorrow*\n"]
+    for item in items:
+        lines.append(f"   • {item.get('description', 'Recurring charge')}: ₹{item.get('amount', 0):.2f} ({item.get('period')})")
+    lines.append("\n💡 Log it when it's charged, e.g. '499 netflix'. Use /alert off to stop reminders.")
+    return "\n".join(lines)
@@ -1,511 +1,76 @@
 from flask import Blueprint, request, current_app
 from bson import ObjectId
-from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import re
 import json
+import uuid
 from app import mongo
+from app.utils import get_redis, cron_secret_required
 from app.services.twilio_service import twilio_service
-from app.services.gemini_service import parse_expense_test
+from app.services.rate_limiter import check_rate_limit, key_by_phone
+from app.services.transaction_service import transaction_projection
+from app.services.whatsapp_delivery_service import (
+    STATUS_RANK, FAILED_STATUSES, record_status_callback, claim_failed_message_for_retry
+)
+from app.tasks.whatsapp_tasks import send_whatsapp_task
+from .handlers import handle_incoming_message
+from .tasks import (
+    process_whatsapp_inbox, send_weekly_summaries_task, send_recurring_reminders_task,
+    INBOX_KEY, INBOX_TTL, WEEKLY_JOB_KEY, WEEKLY_JOB_TTL
+)
 
 whatsapp_bp = Blueprint('whatsapp_bp', __name__)
 
-CATEGORIES = [
-    "Food & Dining", "Transportation", "Shopping", "Entertainment",
-    "Bills & Utilities", "Health & Fitness", "Travel", "Education",
-    "Groceries", "Personal Care", "Home", "Other"
-]
+# Inbound MessageSids seen in the last 24h (Twilio retries within minutes)
+MESSAGE_SID_KEY = "wa:msg:{sid}"
+MESSAGE_SID_TTL = 86400
 
+# Default fields of /transactions/recent
+WHATSAPP_RECENT_FIELDS = ("amount", "category", "description", "date")
 
-def parse_expense_message(message):
+def claim_message_sid(message_sid):
     """
-    Parse expense message using Gemini AI.
-    Examples: "500 coffee", "coffee for 500 rs", "lunch 150 rupees"
+    Atomically mark an inbound MessageSid as seen.
+    Returns True the first time a SID is claimed, False for Twilio retries.
+    One Redis SET NX EX round trip; falls back to the unique
+    whatsapp_messages.message_sid index if Redis is unavailable.
     """
-    message = message.strip()
-    
-    # Use Gemini AI for all parsing - it's smarter and more accurate
     try:
-        result = parse_expense_test(message)
-        if result:
-            return {
-                "amount": result.get("amount", 0),
-                "description": result.get("description", message),
-                "category": result.get("category", "Other"),
-                "source": "gemini"
-            }
-        else:
-            # Gemini returned null (couldn't parse)
-            return {
-                "error": "could_not_parse",
-                "message": "Couldn't understand the expense. Try format: '500 coffee' or 'coffee for 500 rupees'"
-            }
+        return bool(get_redis().set(MESSAGE_SID_KEY.format(sid=message_sid), 1, nx=True, ex=MESSAGE_SID_TTL))
     except Exception as e:
-        current_app.logger.error(f"Gemini parsing failed: {e}")
-        return {
-            "error": "api_error",
-            "message": "AI service temporarily unavailable. Please try again."
-        }
-
-
-def guess_category(description):
-    """Simple keyword-based category guessing."""
-    desc = description.lower()
-    
-    keywords = {
-        "Food & Dining": ["coffee", "tea", "lunch", "dinner", "breakfast", "food", "restaurant", "cafe", "pizza", "burger", "snack"],
-        "Transportation": ["uber", "ola", "taxi", "bus", "train", "metro", "petrol", "fuel", "auto", "car"],
-        "Shopping": ["amazon", "flipkart", "mall", "store", "shop", "clothes", "shoes"],
-        "Entertainment": ["movie", "netflix", "spotify", "game", "concert", "party"],
-        "Bills & Utilities": ["bill", "electricity", "water", "internet", "phone", "recharge"],
-        "Health & Fitness": ["gym", "medicine", "doctor", "hospital", "health"],
-        "Groceries": ["grocery", "vegetables", "fruits", "milk", "bread"],
-    }
-    
-    for category, words in keywords.items():
-        if any(word in desc for word in words):
-            return category
-    
-    return "Other"
-
-
-def get_user_by_whatsapp(whatsapp_number):
-    """Find user by verified WhatsApp number.
-    
-    Handles both formats:
-    - Stored in DB: 7058099532 (without +91)
-    - From WhatsApp: +917058099532 (with +91)
-    """
-    # Remove +91 or + from the number for comparison
-    clean_number = whatsapp_number.replace('+91', '').replace('+', '')
-    
-    # Try exact match first
-    user = mongo.db.users.find_one({
-        "whatsapp_number": clean_number,
-        "whatsapp_verified": True
-    })
-    
-    # If not found, try with +91 prefix
-    if not user:
-        user = mongo.db.users.find_one({
-            "whatsapp_number": '+91' + clean_number,
-            "whatsapp_verified": True
-        })
-    
-    return user
-
-
-def format_transactions_list(transactions, limit=5):
-    """Format transactions for WhatsApp display."""
-    if not transactions:
-        return "📝 No transactions found."
-    
-    lines = ["📊 Your Recent Transactions:\n"]
-    
-    for i, t in enumerate(transactions[:limit], 1):
-        amount = t.get('amount', 0)
-        desc = t.get('description', 'No description')
-        cat = t.get('category', 'Other')
-        date = t.get('date')
-        trans_id = str(t.get('_id', ''))[:8]  # First 8 chars of ID
-        
-        if isinstance(date, datetime):
-            date_str = date.strftime('%d %b')
-        else:
-            date_str = 'N/A'
-        
-        lines.append(f"{i}. ₹{amount:.2f} - {desc}")
-        lines.append(f"   📁 {cat} | 📅 {date_str} | ID: {trans_id}\n")
-    
-    total = sum(t.get('amount', 0) for t in transactions[:limit])
-    lines.append(f"\n💰 Total (last {len(transactions[:limit])}): ₹{total:.2f}")
-    lines.append("\n💡 Use /delete <ID> to remove a transaction")
-    
-    return "\n".join(lines)
-
-
-def format_budget_status(user_id):
-    """Format budget status for WhatsApp display."""
-    now = datetime.utcnow()
-    month = now.month
-    year = now.year
-    
-    budgets = list(mongo.db.budgets.find({
-        "user_id": ObjectId(user_id),
-        "month": month,
-        "year": year
-    }))
-    
-    if not budgets:
-        return "🎯 No budgets set for this month.\n\nSet budgets in the FinSight app to track your spending!"
-    
-    lines = ["🎯 Your Budget Status:\n"]
-    
-    total_budget = 0
-    total_spent = 0
-    
-    for budget in budgets:
-        cat = budget.get('category', 'Unknown')
-        limit = budget.get('limit', 0)
-        total_budget += limit
-        
-        # Get spending for this category
-        spending = list(mongo.db.transactions.aggregate([
-            {
-                "$match": {
-                    "user_id": ObjectId(user_id),
-                    "category": cat,
-                    "date": {
-                        "$gte": datetime(year, month, 1),
-                        "$lt": datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
-                    }
-                }
-            },
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]))
-        
-        spent = spending[0]['total'] if spending else 0
-        total_spent += spent
-        
-        percentage = (spent / limit * 100) if limit > 0 else 0
-        emoji = "🟢" if percentage < 75 else "🟡" if percentage < 100 else "🔴"
-        
-        lines.append(f"{emoji} {cat}: ₹{spent:.2f} / ₹{limit:.2f} ({percentage:.0f}%)")
-    
-    lines.append(f"\n💰 Total: ₹{total_spent:.2f} / ₹{total_budget:.2f}")
-    
-    return "\n".join(lines)
-
-
-def format_summary(user_id):
-    """Format monthly summary for WhatsApp."""
-    now = datetime.utcnow()
-    month = now.month
-    year = now.year
-    
-    # Get all transactions this month
-    transactions = list(mongo.db.transactions.find({
-        "user_id": ObjectId(user_id),
-        "date": {
-            "$gte": datetime(year, month, 1),
-            "$lt": datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
-        }
-    }).sort("date", -1))
+        current_app.logger.warning(f"Redis dedup failed for {message_sid}, using MongoDB: {e}")
     
-    if not transactions:
-        return "📊 No transactions this month yet!"
-    
-    total = sum(t.get('amount', 0) for t in transactions)
-    
-    # Category breakdown
-    categories = {}
-    for t in transactions:
-        cat = t.get('category', 'Other')
-        categories[cat] = categories.get(cat, 0) + t.get('amount', 0)
-    
-    lines = [f"📊 {now.strftime('%B %Y')} Summary:\n"]
-    lines.append(f"💰 Total Spent: ₹{total:.2f}")
-    lines.append(f"📝 Total Transactions: {len(transactions)}\n")
-    lines.append("📁 By Category:")
-    
-    for cat, amt in sorted(categories.items(), key=lambda x: x[1], reverse=True):
-        pct = (amt / total * 100) if total > 0 else 0
-        lines.append(f"   • {cat}: ₹{amt:.2f} ({pct:.0f}%)")
-    
-    return "\n".join(lines)
-
-
-def handle_delete_command(user_id, message_body):
-    """Handle /delete <ID> command"""
-    parts = message_body.strip().split()
-    if len(parts) < 2:
-        return "❌ Usage: /delete <transaction_id>\n\nUse /transactions to see IDs."
-    
-    trans_id = parts[1].strip()
-    
-    # Try to find the transaction
     try:
-        transaction = mongo.db.transactions.find_one({
-            "_id": ObjectId(trans_id),
-            "user_id": ObjectId(user_id)
-        })
-    except Exception:
-        return "❌ Invalid transaction ID.\n\nUse /transactions to see valid IDs."
-    
-    if not transaction:
-        return "❌ Transaction not found.\n\nUse /transactions to see valid IDs."
-    
-    amount = transaction.get('amount', 0)
-    desc = transaction.get('description', 'Unknown')
-    
-    # Delete the transaction
-    mongo.db.transactions.delete_one({"_id": ObjectId(trans_id)})
-    
-    return f"✅ Deleted: ₹{amount:.2f} - {desc}\n\nTransaction removed successfully."
-
-
-def handle_edit_command(user_id, message_body):
-    """Handle /edit <ID> amount/category/description <value> command"""
-    parts = message_body.strip().split()
-    if len(parts) < 4:
-        return "❌ Usage: /edit <ID> <field> <value>\n\nFields: amount, category, description\nExample: /edit abc123 amount 500"
-    
-    trans_id = parts[1].strip()
-    field = parts[2].lower()
-    value = ' '.join(parts[3:])
-    
-    # Validate field
-    if field not in ['amount', 'category', 'description']:
-        return "❌ Invalid field. Use: amount, category, or description"
-    
-    # Find transaction
-    try:
-        transaction = mongo.db.transactions.find_one({
-            "_id": ObjectId(trans_id),
-            "user_id": ObjectId(user_id)
-        })
-    except Exception:
-        return "❌ Invalid transaction ID."
-    
-    if not transaction:
-        return "❌ Transaction not found."
-    
-    # Build update
-    update = {}
-    if field == 'amount':
-        try:
-            new_amount = float(value)
-            if new_amount <= 0:
-                return "❌ Amount must be positive."
-            update['amount'] = new_amount
-        except ValueError:
-            return "❌ Invalid amount. Use a number."
-    elif field == 'category':
-        # Validate category
-        if value.title() not in CATEGORIES:
-            return f"❌ Invalid category. Use: {', '.join(CATEGORIES[:5])}..."
-        update['category'] = value.title()
-    elif field == 'description':
-        update['description'] = value
-    
-    # Update
-    mongo.db.transactions.update_one(
-        {"_id": ObjectId(trans_id)},
-        {"$set": update}
-    )
-    
-    return f"✅ Updated!\n\n{field.title()}: {value}"
-
-
-def handle_weekly_command(user_id, message_body):
-    """Handle /weekly on/off command"""
-    parts = message_body.strip().split()
-    if len(parts) < 2:
-        # Show current status
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-        status = user.get('whatsapp_weekly', False)
-        return f"📊 Weekly Summary: {'✅ ON' if status else '❌ OFF'}\n\nUse /weekly on or /weekly off to change."
-    
-    action = parts[1].lower()
-    if action == 'on':
-        mongo.db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"whatsapp_weekly": True}}
-        )
-        return "✅ Weekly summary enabled!\n\nYou'll receive a spending summary every Sunday."
-    elif action == 'off':
-        mongo.db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"whatsapp_weekly": False}}
-        )
-        return "✅ Weekly summary disabled."
-    else:
-        return "❌ Use /weekly on or /weekly off"
-
-
-def handle_alert_command(user_id, message_body):
-    """Handle /alert on/off command"""
-    parts = message_body.strip().split()
-    if len(parts) < 2:
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-        status = user.get('whatsapp_alerts', False)
-        return f"🔔 Budget Alerts: {'✅ ON' if status else '❌ OFF'}\n\nUse /alert on or /alert off to change."
-    
-    action = parts[1].lower()
-    if action == 'on':
-        mongo.db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"whatsapp_alerts": True}}
-        )
-        return "✅ Budget alerts enabled!\n\nYou'll be notified when you reach 80% of any budget."
-    elif action == 'off':
-        mongo.db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"whatsapp_alerts": False}}
-        )
-        return "✅ Budget alerts disabled."
-    else:
-        return "❌ Use /alert on or /alert off"
-
-
-def handle_compare_command(user_id):
-    """Handle /compare command - compare to last month"""
-    now = datetime.utcnow()
-    current_month = now.month
-    current_year = now.year
-    
-    # Get last month
-    if current_month == 1:
-        last_month = 12
-        last_year = current_year - 1
-    else:
-        last_month = current_month - 1
-        last_year = current_year
-    
-    # Current month spending
-    current_spending = list(mongo.db.transactions.aggregate([
-        {"$match": {
-            "user_id": ObjectId(user_id),
-            "date": {
-                "$gte": datetime(current_year, current_month, 1),
-                "$lt": datetime(current_year, current_month + 1, 1) if current_month < 12 else datetime(current_year + 1, 1, 1)
-            }
-        }},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]))
-    
-    current_total = current_spending[0]['total'] if current_spending else 0
-    
-    # Last month spending
-    last_spending = list(mongo.db.transactions.aggregate([
-        {"$match": {
-            "user_id": ObjectId(user_id),
-            "date": {
-                "$gte": datetime(last_year, last_month, 1),
-                "$lt": datetime(last_year, last_month + 1, 1) if last_month < 12 else datetime(last_year + 1, 1, 1)
-            }
-        }},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]))
-    
-    last_total = last_spending[0]['total'] if last_spending else 0
-    
-    if last_total == 0:
-        return "📊 No spending data from last month to compare."
-    
-    diff = current_total - last_total
-    pct = (diff / last_total) * 100
-    
-    month_name = now.strftime('%B')
-    last_month_name = datetime(last_year, last_month, 1).strftime('%B')
-    
-    lines = [f"📊 {month_name} vs {last_month_name}:\n"]
-    lines.append(f"• This month: ₹{current_total:.2f}")
-    lines.append(f"• Last month: ₹{last_total:.2f}\n")
-    
-    if diff > 0:
-        lines.append(f"🔴 You spent ₹{diff:.2f} MORE ({pct:.1f}% increase)")
-    elif diff < 0:
-        lines.append(f"🟢 You spent ₹{abs(diff):.2f} LESS ({abs(pct):.1f}% decrease)")
-    else:
-        lines.append("🟡 Spending is same as last month")
-    
-    return "\n".join(lines)
-
-
-def check_budget_alerts(user_id, category):
-    """Check if any budget exceeded 80% and send alert"""
-    # Check if user has alerts enabled
-    user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-    if not user or not user.get('whatsapp_alerts', False):
-        return None
-    
-    now = datetime.utcnow()
-    month = now.month
-    year = now.year
-    
-    # Get budget for this category
-    budget = mongo.db.budgets.find_one({
-        "user_id": ObjectId(user_id),
-        "category": category,
-        "month": month,
-        "year": year
-    })
-    
-    if not budget:
-        return None
-    
-    budget_limit = budget.get('limit', 0)
-    if budget_limit <= 0:
-        return None
-    
-    # Get current spending for this category
-    spending = list(mongo.db.transactions.aggregate([
-        {"$match": {
-            "user_id": ObjectId(user_id),
-            "category": category,
-            "date": {
-                "$gte": datetime(year, month, 1),
-                "$lt": datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
-            }
-        }},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]))
-    
-    current_spent = spending[0]['total'] if spending else 0
-    percentage = (current_spent / budget_limit) * 100
-    
-    # Check if crossed 80% threshold (and haven't already alerted today)
-    if percentage >= 80:
-        # Check if we already sent alert today
-        today_start = datetime(year, month, now.day)
-        existing_alert = mongo.db.whatsapp_alerts.find_one({
-            "user_id": ObjectId(user_id),
-            "category": category,
-            "created_at": {"$gte": today_start}
-        })
-        
-        if existing_alert:
-            return None  # Already alerted today
-        
-        # Store alert
-        mongo.db.whatsapp_alerts.insert_one({
-            "user_id": ObjectId(user_id),
-            "category": category,
+        mongo.db.whatsapp_messages.insert_one({
+            "message_sid": message_sid,
             "created_at": datetime.utcnow()
         })
-        
-        emoji = "🟡" if percentage < 100 else "🔴"
-        return (f"⚠️ *Budget Alert!* \n\n"
-                f"{emoji} You've spent ₹{current_spent:.2f} / ₹{budget_limit:.2f} ({percentage:.0f}%) "
-                f"on {category}\n\n"
-                f"💡 Tip: You're approaching your budget limit!")
-    
-    return None
+        return True
+    except DuplicateKeyError:
+        return False
 
 
 @whatsapp_bp.route('/webhook/whatsapp', methods=['POST'])
 def whatsapp_webhook():
     """
     Twilio WhatsApp webhook - receives incoming messages.
+    Only validates, deduplicates and enqueues the message; parsing, database
+    writes and replies happen in the Celery worker so Twilio gets its 200 fast.
     """
     try:
-        # Verify Twilio signature for security
+        # Verify the Twilio signature before trusting anything in the form
+        # (behind a TLS proxy, set TRUSTED_PROXY_COUNT so request.url is the https URL Twilio signed)
         signature = request.headers.get('X-Twilio-Signature', '')
-        url = request.url_root.rstrip('/') + '/webhook/whatsapp'
-        
-        # Get all POST params
-        params = dict(request.form)
-        
-        # Verify signature (skip for sandbox - for production, fix the verification logic)
-        # TODO: Fix proper Twilio signature verification for production
-        # Current logic has a bug - skip for now to test features
-        if signature:
-            current_app.logger.info(f"Signature received but skipping verification (sandbox mode)")
-            # Uncomment below for production after fixing verification:
-            # if not twilio_service.verify_twilio_signature(url, params, signature):
-            #     current_app.logger.warning(f"Invalid Twilio signature from {request.form.get('From', 'unknown')}")
-            #     return "Forbidden", 403
+        if not twilio_service.verify_twilio_signature(request.url, request.form.to_dict(), signature):
+            current_app.logger.warning(f"Invalid Twilio signature from {request.remote_addr}")
+            return "Forbidden", 403
+
+        # Per-sender limit, only now that `From` is known to come from Twilio.
+        # Over-limit senders get a silent 200 so Twilio doesn't retry the message
+        sender_key = key_by_phone()
+        if sender_key and check_rate_limit('whatsapp', sender_key, limit=20, period=60):
+            return "OK", 200
         
         # Get message details from Twilio
         from_number = request.form.get('From', '')
@@ -515,185 +80,33 @@ def whatsapp_webhook():
         if not from_number or not message_body:
             return "OK", 200
         
-        # Extract WhatsApp number early for logging
-        whatsapp_number = from_number.replace('whatsapp:', '')
-        
-        # Issue #7: Validate message length
-        if len(message_body) > 1000:
-            current_app.logger.warning(f"Message too long from {whatsapp_number}: {len(message_body)} chars")
-            reply = "❌ Message too long. Please keep your message under 1000 characters."
-            twilio_service.send_whatsapp_message(from_number, reply)
-            return "OK", 200
-        
         if len(message_body) < 2:
             return "OK", 200  # Ignore very short messages
         
-        # Find user by WhatsApp
-        user = get_user_by_whatsapp(whatsapp_number)
-        
-        if not user:
-            current_app.logger.info(f"WhatsApp message from unknown number: {whatsapp_number}")
-            # User not linked
-            reply = "👋 Welcome to FinSight AI!\n\n"
-            reply += "Your WhatsApp is not linked to your account.\n"
-            reply += "Please open the FinSight app, go to Profile, and link your WhatsApp number."
-            
-            twilio_service.send_whatsapp_message(from_number, reply)
+        # Deduplicate Twilio retries before any parsing or queueing
+        if message_sid and not claim_message_sid(message_sid):
+            current_app.logger.info(f"Duplicate message ignored: {message_sid}")
             return "OK", 200
         
-        user_id = str(user['_id'])
-        message_lower = message_body.lower()
-        
-        # Log incoming command
-        current_app.logger.info(f"WhatsApp command from user {user_id}: {message_body}")
-        
-        # Command handling
-        if message_lower == '/start' or message_lower == '/guide':
-            reply = """Welcome to FinSight AI!
-
-Here's how to use WhatsApp bot:
-
-ADD EXPENSES:
-"coffee 50" - Quick add
-"lunch at cafe 200 rupees" - Natural language
-"uber ride 150" - Works great
-
-VIEW DATA:
-/transactions - Recent 5 expenses
-/budget - Budget status
-/summary - This month spending
-/compare - vs last month
-
-MANAGE:
-/delete <ID> - Remove expense
-/edit <ID> amount 500 - Edit
-
-SETTINGS:
-/weekly on - Enable weekly summary
-/weekly off - Disable
-/alert on - Budget alerts (80% warning)
-/alert off - Disable
-
-Need help? Type /help for all commands"""
-            
-        elif message_lower == '/help':
-            reply = """FinSight Commands Guide
-
-ADD EXPENSES:
-"500 coffee" - Add Rs.500
-"lunch 200 rupees" - Natural language
-"uber for 150" - Transportation
-
-VIEW DATA:
-/transactions - Last 5 expenses
-/budget - Budget status
-/summary - Monthly spending
-/compare - vs last month
-
-MANAGE:
-/delete <ID> - Delete transaction
-/edit <ID> amount 500 - Edit amount
-/edit <ID> category Food - Edit category
-
-SETTINGS:
-/weekly on - Enable weekly summary
-/weekly off - Disable
-/alert on - Budget alerts
-/alert off - Disable alerts
-
-/start - Show quick start guide"""
-            
-        elif message_lower == '/transactions':
-            transactions = list(mongo.db.transactions.find(
-                {"user_id": ObjectId(user_id)}
-            ).sort("date", -1).limit(5))
-            reply = format_transactions_list(transactions)
-            
-        elif message_lower == '/budget' or message_lower == '/budgets':
-            reply = format_budget_status(user_id)
-            
-        elif message_lower == '/summary':
-            reply = format_summary(user_id)
-            
-        elif message_lower.startswith('/delete'):
-            reply = handle_delete_command(user_id, message_body)
-            
-        elif message_lower.startswith('/edit'):
-            reply = handle_edit_command(user_id, message_body)
-            
-        elif message_lower.startswith('/weekly'):
-            reply = handle_weekly_command(user_id, message_body)
-            
-        elif message_lower.startswith('/alert'):
-            reply = handle_alert_command(user_id, message_body)
-            
-        elif message_lower == '/compare':
-            reply = handle_compare_command(user_id)
-            
-        else:
-            # Try to parse as expense
-            expense = parse_expense_message(message_body)
-            
-            # Issue #8: Handle parsing errors properly
-            if expense and "error" in expense:
-                reply = f"❌ {expense.get('message', 'Could not understand. Try: 500 coffee')}"
-                twilio_service.send_whatsapp_message(from_number, reply)
-                return "OK", 200
-            
-            if expense:
-                # Check for duplicate messages using MessageSid (idempotency)
-                existing = mongo.db.whatsapp_messages.find_one({"message_sid": message_sid})
-                if existing:
-                    current_app.logger.info(f"Duplicate message ignored: {message_sid}")
-                    return "OK", 200
-                
-                # Add transaction to database
-                transaction_doc = {
-                    "user_id": ObjectId(user_id),
-                    "amount": expense['amount'],
-                    "category": expense['category'],
-                    "description": expense['description'],
-                    "date": datetime.utcnow(),
-                    "status": "completed",
-                    "source": "whatsapp",
-                    "raw_text": message_body,
-                    "message_sid": message_sid  # For idempotency
-                }
-                
-                mongo.db.transactions.insert_one(transaction_doc)
-                
-                # Log the transaction add
-                current_app.logger.info(f"WhatsApp transaction added for user {user_id}: ₹{expense['amount']} - {expense['description']}")
-                
-                # Store message SID for deduplication
-                mongo.db.whatsapp_messages.insert_one({
-                    "message_sid": message_sid,
-                    "user_id": ObjectId(user_id),
-                    "created_at": datetime.utcnow()
-                })
-                
-                # Check budget alerts
-                alert_reply = check_budget_alerts(user_id, expense['category'])
-                if alert_reply:
-                    # Send alert after a short delay
-                    twilio_service.send_whatsapp_message(from_number, alert_reply)
-                
-                reply = "Expense Added!\n\n"
-                reply += f"Amount: Rs.{expense['amount']:.2f}\n"
-                reply += f"Category: {expense['category']}\n"
-                reply += f"Description: {expense['description']}\n\n"
-                reply += f"(via {expense['source']})\n\n"
-                reply += "---Quick Tips---\n"
-                reply += "/transactions - View expenses\n"
-                reply += "/budget - Check budgets\n"
-                reply += "/start - Full guide"
-            else:
-                reply = "Sorry, couldn't understand.\n\n"
-                reply += "Try: '500 coffee'\n"
-                reply += "Type /help for all commands"
-        
-        # Send reply
-        twilio_service.send_whatsapp_message(from_number, reply)
+        # Queue per sender: one worker drains each sender's inbox, so messages
+        # from the same number are processed in the order they arrived
+        sender = from_number.replace('whatsapp:', '')
+        item = json.dumps({
+            "from_number": from_number,
+            "message_body": message_body,
+            "message_sid": message_sid
+        })
+        try:
+            redis_conn = get_redis()
+            pipe = redis_conn.pipeline()
+            pipe.rpush(INBOX_KEY.format(sender=sender), item)
+            pipe.expire(INBOX_KEY.format(sender=sender), INBOX_TTL)
+            pipe.execute()
+            process_whatsapp_inbox.delay(sender)
+        except Exception as e:
+            # Redis is also the Celery broker, so if it is down handle the message inline
+            current_app.logger.error(f"Could not queue WhatsApp message {message_sid}, processing inline: {e}")
+            handle_incoming_message(from_number, message_body, message_sid)
         
         return "OK", 200
         
@@ -707,12 +120,40 @@ SETTINGS:
 def whatsapp_status():
     """
     Twilio status callback - track message delivery status.
+    Signed like the message webhook: a forged 'failed' callback would
+    otherwise trigger a resend, and fake SIDs would skew delivery stats.
     """
+    signature = request.headers.get('X-Twilio-Signature', '')
+    if not twilio_service.verify_twilio_signature(request.url, request.form.to_dict(), signature):
+        current_app.logger.warning(f"Invalid Twilio signature on status callback from {request.remote_addr}")
+        return "Forbidden", 403
+
     message_sid = request.form.get('MessageSid', '')
     message_status = request.form.get('MessageStatus', '')
+    error_code = request.form.get('ErrorCode')
     
     current_app.logger.info(f"WhatsApp message {message_sid} status: {message_status}")
     
+    if not message_sid or message_status not in STATUS_RANK:
+        return "OK", 200
+    
+    try:
+        record_status_callback(message_sid, message_status, error_code)
+        
+        # Automatically re-send transient failures (each message is retried once per attempt)
+        if message_status in FAILED_STATUSES and error_code:
+            failed_message = claim_failed_message_for_retry(message_sid, error_code)
+            if failed_message:
+                attempt = failed_message.get("attempt", 1) + 1
+                send_whatsapp_task.apply_async(
+                    args=[failed_message["to"], failed_message["body"]],
+                    kwargs={"attempt": attempt},
+                    countdown=60 * 2 ** (attempt - 1)
+                )
+                current_app.logger.info(f"Retrying failed WhatsApp message {message_sid} (attempt {attempt})")
+    except Exception as e:
+        current_app.logger.error(f"Failed to record WhatsApp status for {message_sid}: {e}")
+    
     return "OK", 200
 
 
@@ -743,110 +184,85 @@ def whatsapp_status_check():
 def whatsapp_recent_transactions():
     """
     Get recent transactions added via WhatsApp.
+    Optional `fields=` selects the returned fields (default: amount, category, description, date).
     """
     current_user_id = get_jwt_identity()
     
+    projection, unknown = transaction_projection(request.args.get('fields'), WHATSAPP_RECENT_FIELDS)
+    if unknown:
+        return {"error": f"Unknown fields: {', '.join(unknown)}"}, 400
+    
     # Get source=whatsapp transactions
     transactions = list(mongo.db.transactions.find(
-        {"user_id": ObjectId(current_user_id), "source": "whatsapp"}
+        {"user_id": ObjectId(current_user_id), "source": "whatsapp"},
+        projection
     ).sort("date", -1).limit(10))
     
-    result = []
     for t in transactions:
-        result.append({
-            "_id": str(t["_id"]),
-            "amount": t.get("amount"),
-            "category": t.get("category"),
-            "description": t.get("description"),
-            "date": t.get("date").isoformat() if t.get("date") else None,
-            "created_via": "whatsapp"
-        })
+        t["created_via"] = "whatsapp"
+        # This endpoint has always sent naive ISO dates (no "+00:00"); keep its wire format
+        if t.get("date"):
+            t["date"] = t["date"].isoformat()
     
-    return {"whatsapp_transactions": result}, 200
+    return {"whatsapp_transactions": transactions}, 200
 
 
 @whatsapp_bp.route('/cron/weekly-summary', methods=['POST'])
+@cron_secret_required
 def send_weekly_summaries():
     """
     Cron endpoint to send weekly summaries to all users with weekly enabled.
     Should be triggered by a cron job (e.g., every Sunday at 6 PM).
+    Only queues the run; poll /cron/weekly-summary/<job_id> for progress.
     """
-    # Verify cron secret (to prevent unauthorized calls)
-    cron_secret = request.headers.get('X-Cron-Secret', '')
-    expected_secret = current_app.config.get('CRON_SECRET', '')
-    
-    if expected_secret and cron_secret != expected_secret:
-        return {"error": "Unauthorized"}, 401
-    
-    # Get all users with weekly summary enabled
-    users = list(mongo.db.users.find({
-        "whatsapp_weekly": True,
-        "whatsapp_verified": True,
-        "whatsapp_number": {"$exists": True, "$ne": ""}
-    }))
-    
-    sent_count = 0
-    failed_count = 0
+    job_id = uuid.uuid4().hex
+    job_key = WEEKLY_JOB_KEY.format(job_id=job_id)
+    
+    redis_conn = get_redis()
+    redis_conn.hset(job_key, mapping={
+        "status": "queued",
+        "started_at": datetime.utcnow().isoformat(),
+        "sent": 0,
+        "failed": 0,
+        "chunks_done": 0,
+        "chunks_failed": 0
+    })
+    redis_conn.expire(job_key, WEEKLY_JOB_TTL)
     
-    for user in users:
-        try:
-            user_id = str(user['_id'])
-            whatsapp_number = user.get('whatsapp_number')
-            
-            # Generate weekly summary
-            summary = generate_weekly_summary(user_id)
-            
-            if summary:
-                formatted_number = twilio_service.format_whatsapp_number(whatsapp_number)
-                if formatted_number:
-                    twilio_service.send_whatsapp_message(formatted_number, summary)
-                    sent_count += 1
-        except Exception as e:
-            current_app.logger.error(f"Failed to send weekly summary: {e}")
-            failed_count += 1
+    send_weekly_summaries_task.delay(job_id)
     
     return {
-        "message": f"Weekly summaries sent: {sent_count} success, {failed_count} failed",
-        "sent": sent_count,
-        "failed": failed_count
-    }, 200
+        "message": "Weekly summaries queued",
+        "job_id": job_id,
+        "status_url": f"/cron/weekly-summary/{job_id}"
+    }, 202
 
 
-def generate_weekly_summary(user_id):
-    """Generate weekly summary message for a user."""
-    from datetime import timedelta
-    
-    now = datetime.utcnow()
-    week_ago = now - timedelta(days=7)
-    
-    # Get transactions from last 7 days
-    transactions = list(mongo.db.transactions.find({
-        "user_id": ObjectId(user_id),
-        "date": {"$gte": week_ago}
-    }))
-    
-    if not transactions:
-        return None
-    
-    total = sum(t.get('amount', 0) for t in transactions)
-    
-    # Category breakdown
-    categories = {}
-    for t in transactions:
-        cat = t.get('category', 'Other')
-        categories[cat] = categories.get(cat, 0) + t.get('amount', 0)
-    
-    lines = ["📊 *Your Weekly Summary*\n"]
-    lines.append(f"💰 Total spent: ₹{total:.2f}")
-    lines.append(f"📝 Transactions: {len(transactions)}\n")
-    
-    # Top categories
-    sorted_cats = sorted(categories.items(), key=lambda x: x[1], reverse=True)[:3]
-    lines.append("🏆 Top categories:")
-    for cat, amt in sorted_cats:
-        pct = (amt / total * 100) if total > 0 else 0
-        lines.append(f"   • {cat}: ₹{amt:.2f} ({pct:.0f}%)")
+@whatsapp_bp.route('/cron/weekly-summary/<string:job_id>', methods=['GET'])
+@cron_secret_required
+def weekly_summary_progress(job_id):
+    """
+    Progress of a weekly summary run.
+    """
+    job = get_redis().hgetall(WEEKLY_JOB_KEY.format(job_id=job_id))
+    if not job:
+        return {"error": "Job not found"}, 404
     
-    lines.append("\n💡 Use /summary for full month details")
+    progress = {key.decode(): value.decode() for key, value in job.items()}
+    for field in ("opted_in_users", "messages_total", "chunks_total", "chunks_done", "chunks_failed", "sent", "failed"):
+        if field in progress:
+            progress[field] = int(progress[field])
     
-    return "\n".join(lines)
+    return progress, 200
+
+
+@whatsapp_bp.route('/cron/recurring-reminders', methods=['POST'])
+@cron_secret_required
+def send_recurring_reminders():
+    """
+    Cron endpoint reminding users of recurring charges expected tomorrow.
+    Should be triggered once a day (e.g., at 8 AM). Only queues the run.
+    """
+    task = send_recurring_reminders_task.delay()
+    return {"message": "Recurring reminders queued", "task_id": task.id}, 202
+
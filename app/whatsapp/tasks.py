@@ -0,0 +1,258 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from celery.exceptions import Retry
+from flask import current_app
+from app import celery, mongo
+from app.utils import get_redis
+from app.services.twilio_service import twilio_service
+from app.tasks.whatsapp_tasks import acquire_send_slot, send_whatsapp_task
+from app.services.single_flight import release_lock
+from .handlers import handle_incoming_message, format_weekly_summary, format_recurring_reminder
+
+# Per-sender inbox (Redis list) and the lock held by the worker draining it
+INBOX_KEY = "wa:inbox:{sender}"
+INBOX_LOCK_KEY = "wa:inbox_lock:{sender}"
+INBOX_TTL = 86400
+INBOX_LOCK_TTL = 120
+
+# Progress of a weekly summary run (Redis hash)
+WEEKLY_JOB_KEY = "wa:weekly_job:{job_id}"
+WEEKLY_JOB_TTL = 7 * 86400
+WEEKLY_CHUNK_SIZE = 500
+
+
+@celery.task
+def process_whatsapp_inbox(sender: str):
+    """
+    Drain the inbox of one WhatsApp sender in arrival order.
+    Only one worker at a time holds a sender's lock, so messages from the same
+    number are never processed concurrently or out of order. Other tasks
+    queued for the same sender simply exit; the lock holder picks up their messages.
+    """
+    logger = current_app.logger
+    redis_conn = get_redis()
+    inbox_key = INBOX_KEY.format(sender=sender)
+    lock_key = INBOX_LOCK_KEY.format(sender=sender)
+    token = uuid.uuid4().hex
+
+    if not redis_conn.set(lock_key, token, nx=True, ex=INBOX_LOCK_TTL):
+        return
+
+    try:
+        while True:
+            raw_item = redis_conn.lpop(inbox_key)
+            if raw_item is None:
+                break
+
+            item = json.loads(raw_item)
+            try:
+                handle_incoming_message(item["from_number"], item["message_body"], item["message_sid"])
+            except Exception as e:
+                logger.error(f"WA_INBOX_FAIL: Message {item.get('message_sid')} from {sender} failed: {e}", exc_info=True)
+
+            # Keep the lock while we are still making progress
+            redis_conn.expire(lock_key, INBOX_LOCK_TTL)
+    finally:
+        release_lock(redis_conn, lock_key, token)
+
+    # A message may have been pushed after our last LPOP but before the lock was released
+    if redis_conn.llen(inbox_key):
+        process_whatsapp_inbox.delay(sender)
+
+
+def weekly_totals_pipeline(user_ids, since):
+    """Weekly totals of the given users in one pass: grouped by (user, category), then by user."""
+    return [
+        # Opted-in users first, so the (user_id, date) index bounds the scan
+        {"$match": {"user_id": {"$in": user_ids}, "date": {"$gte": since}, "status": "completed"}},
+        {
+            "$group": {
+                "_id": {"user_id": "$user_id", "category": "$category"},
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.user_id",
+                "total": {"$sum": "$total"},
+                "count": {"$sum": "$count"},
+                "categories": {"$push": {"category": "$_id.category", "total": "$total"}}
+            }
+        }
+    ]
+
+
+@celery.task
+def send_weekly_summaries_task(job_id: str):
+    """
+    Coordinator of a weekly summary run.
+    Computes the weekly totals of opted-in users, WEEKLY_CHUNK_SIZE users per
+    aggregation, formats the messages and fans them out to
+    send_weekly_summary_chunk tasks so the sending is spread across workers.
+    """
+    logger = current_app.logger
+    redis_conn = get_redis()
+    job_key = WEEKLY_JOB_KEY.format(job_id=job_id)
+    redis_conn.hset(job_key, "status", "running")
+
+    try:
+        # Opted-in users, projected down to the number
+        recipients = {}
+        for user in mongo.db.users.find(
+            {
+                "whatsapp_weekly": True,
+                "whatsapp_verified": True,
+                "whatsapp_e164": {"$exists": True}
+            },
+            {"whatsapp_e164": 1}
+        ):
+            recipients[user['_id']] = f"whatsapp:{user['whatsapp_e164']}"
+
+        since = datetime.utcnow() - timedelta(days=7)
+        user_ids = list(recipients)
+        chunks_total = 0
+        messages_total = 0
+
+        for start in range(0, len(user_ids), WEEKLY_CHUNK_SIZE):
+            pipeline = weekly_totals_pipeline(user_ids[start:start + WEEKLY_CHUNK_SIZE], since)
+            chunk = []
+            for week in mongo.db.transactions.aggregate(pipeline, allowDiskUse=True):
+                summary = format_weekly_summary(week)
+                if summary:
+                    chunk.append([recipients[week['_id']], summary])
+
+            if chunk:
+                send_weekly_summary_chunk.delay(job_id, chunk)
+                chunks_total += 1
+                messages_total += len(chunk)
+
+        redis_conn.hset(job_key, mapping={
+            "status": "sending",
+            "opted_in_users": len(recipients),
+            "messages_total": messages_total,
+            "chunks_total": chunks_total
+        })
+        logger.info(f"WEEKLY_SUMMARY_DISPATCHED: Job {job_id} queued {messages_total} messages in {chunks_total} chunks.")
+
+        # Chunks may all have finished before chunks_total was known
+        if int(redis_conn.hget(job_key, "chunks_done") or 0) >= chunks_total:
+            _finish_weekly_job(redis_conn, job_key)
+
+    except Exception as e:
+        logger.error(f"WEEKLY_SUMMARY_FAIL: Job {job_id} failed: {e}", exc_info=True)
+        redis_conn.hset(job_key, mapping={"status": "failed", "error": str(e)[:500]})
+        raise
+
+
+@celery.task(bind=True, max_retries=None)
+def send_weekly_summary_chunk(self, job_id: str, messages: list):
+    """
+    Send one chunk of weekly summaries, paced by the shared Twilio send limiter,
+    and record progress on the job.
+    When the limiter is out of slots the rest of the chunk is re-queued for as
+    long as it asks, instead of sleeping in the worker. A chunk that fails
+    part way counts its unsent messages as failed and still finishes, so the
+    job always reaches completed.
+    """
+    logger = current_app.logger
+    redis_conn = get_redis()
+    job_key = WEEKLY_JOB_KEY.format(job_id=job_id)
+    sent_count = 0
+    failed_count = 0
+
+    try:
+        for index, (to_number, summary) in enumerate(messages):
+            allowed, retry_after = acquire_send_slot()
+            if not allowed:
+                _record_weekly_progress(redis_conn, job_key, sent_count, failed_count)
+                raise self.retry(args=(job_id, messages[index:]), countdown=retry_after)
+
+            try:
+                if twilio_service.send_whatsapp_message(to_number, summary):
+                    sent_count += 1
+                else:
+                    failed_count += 1
+            except Exception as e:
+                logger.error(f"Failed to send weekly summary: {e}")
+                failed_count += 1
+    except Retry:
+        raise
+    except Exception as e:
+        logger.error(f"WEEKLY_SUMMARY_CHUNK_FAIL: Job {job_id} chunk failed: {e}", exc_info=True)
+        failed_count = len(messages) - sent_count
+        _record_weekly_progress(redis_conn, job_key, sent_count, failed_count, chunk_done=True, chunk_failed=True)
+        return
+
+    _record_weekly_progress(redis_conn, job_key, sent_count, failed_count, chunk_done=True)
+
+
+def _record_weekly_progress(redis_conn, job_key, sent_count, failed_count, chunk_done=False, chunk_failed=False):
+    """Add a chunk's sends to the job, and complete the job once its last chunk is done."""
+    pipe = redis_conn.pipeline()
+    pipe.hincrby(job_key, "sent", sent_count)
+    pipe.hincrby(job_key, "failed", failed_count)
+    if not chunk_done:
+        pipe.execute()
+        return
+    pipe.hincrby(job_key, "chunks_failed", int(chunk_failed))
+    pipe.hincrby(job_key, "chunks_done", 1)
+    pipe.hget(job_key, "chunks_total")
+    *_, chunks_done, chunks_total = pipe.execute()
+
+    if chunks_total is not None and chunks_done >= int(chunks_total):
+        _finish_weekly_job(redis_conn, job_key)
+
+
+def _finish_weekly_job(redis_conn, job_key):
+    redis_conn.hset(job_key, mapping={"status": "completed", "finished_at": datetime.utcnow().isoformat()})
+
+
+@celery.task
+def send_recurring_reminders_task():
+    """
+    Remind users with budget alerts on about recurring charges expected
+    tomorrow. Only series due tomorrow are read (active, next_expected index),
+    and each is reminded once per expected date.
+    """
+    logger = current_app.logger
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+
+    due = list(mongo.db.recurring_items.find(
+        {
+            "active": True,
+            "next_expected": {"$gte": tomorrow, "$lt": tomorrow + timedelta(days=1)},
+            "$expr": {"$ne": ["$reminded_for", "$next_expected"]}
+        },
+        {"user_id": 1, "description": 1, "amount": 1, "period": 1}
+    ))
+    if not due:
+        return {"users": 0, "items": 0}
+
+    by_user = {}
+    for item in due:
+        by_user.setdefault(item["user_id"], []).append(item)
+
+    recipients = mongo.db.users.find(
+        {
+            "_id": {"$in": list(by_user)},
+            "whatsapp_alerts": True,
+            "whatsapp_verified": True,
+            "whatsapp_e164": {"$exists": True}
+        },
+        {"whatsapp_e164": 1}
+    )
+    sent = 0
+    for user in recipients:
+        send_whatsapp_task.delay(f"whatsapp:{user['whatsapp_e164']}", format_recurring_reminder(by_user[user['_id']]))
+        sent += 1
+
+    mongo.db.recurring_items.update_many(
+        {"_id": {"$in": [item["_id"] for item in due]}},
+        [{"$set": {"reminded_for": "$next_expected"}}]
+    )
+    logger.info(f"RECURRING_REMINDERS: {len(due)} charges due tomorrow, reminders queued for {sent} users.")
+    return {"users": sent, "items": len(due)}
+
@@ -0,0 +1,116 @@
+"""
+Microbenchmark: response serialization of transaction pages and history.
+
+Compares the previous path (per-document str(_id) / isoformat() conversion in
+the route, then Flask's default `jsonify` encoder) with the shared orjson
+serializer used by success_response (app/serialization.py).
+
+Usage:
+    python -m benchmarks.serialization_bench [--rows 100] [--days 30] [--number 2000]
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from flask import Flask
+from app.serialization import dumps_bytes
+
+CATEGORIES = ["Food & Dining", "Transportation", "Shopping", "Groceries", "Bills & Fees", "Entertainment"]
+
+
+def make_transactions(count, user_id, start):
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "amount": round(random.uniform(10, 5000), 2),
+            "category": random.choice(CATEGORIES),
+            "description": random.choice(["Coffee", "Uber to office", "Groceries at DMart", "Electricity bill", "Movie night"]),
+            "date": start - timedelta(minutes=37 * i, microseconds=random.randint(0, 999) * 1000),
+            "status": "completed",
+            "short_ref": i + 1
+        }
+        for i in range(count)
+    ]
+
+
+def make_history(days, per_day, user_id, start):
+    history = []
+    for day in range(days):
+        transactions = make_transactions(per_day, user_id, start - timedelta(days=day))
+        history.append({
+            "date": (start - timedelta(days=day)).strftime("%Y-%m-%d"),
+            "total_spend": sum(t["amount"] for t in transactions),
+            "transaction_count": per_day,
+            "transactions": [
+                {k: (str(v) if k == "_id" else v) for k, v in t.items() if k in ("_id", "amount", "category", "description", "date")}
+                for t in transactions
+            ]
+        })
+    return history
+
+
+def old_page(transactions, provider):
+    # What get_transactions did: convert each document, then jsonify
+    result = []
+    for transaction in transactions:
+        transaction = dict(transaction)
+        transaction['_id'] = str(transaction['_id'])
+        transaction['user_id'] = str(transaction['user_id'])
+        transaction['date'] = transaction['date'].replace(tzinfo=timezone.utc).isoformat()
+        result.append(transaction)
+    return provider.dumps({"status": "success", "data": {"transactions": result}}).encode()
+
+
+def new_page(transactions):
+    return dumps_bytes({"status": "success", "data": {"transactions": transactions}})
+
+
+def old_history(history, provider):
+    result = []
+    for day_group in history:
+        day_group = dict(day_group, transactions=[dict(t) for t in day_group["transactions"]])
+        for transaction in day_group["transactions"]:
+            transaction["date"] = transaction["date"].replace(tzinfo=timezone.utc).isoformat()
+        result.append(day_group)
+    return provider.dumps({"status": "success", "data": result}).encode()
+
+
+def new_history(history):
+    return dumps_bytes({"status": "success", "data": history})
+
+
+def bench(label, old, new, number):
+    # Same JSON either way
+    assert json.loads(old()) == json.loads(new()), f"{label}: outputs differ"
+
+    old_s = min(timeit.repeat(old, number=number, repeat=5)) / number
+    new_s = min(timeit.repeat(new, number=number, repeat=5)) / number
+    print(f"{label:<28}{old_s * 1e6:>12.1f}{new_s * 1e6:>12.1f}{old_s / new_s:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="Transactions per page")
+    parser.add_argument("--days", type=int, default=30, help="Days in the history response")
+    parser.add_argument("--per-day", type=int, default=5, help="Transactions per history day")
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    random.seed(42)
+    # Flask's default provider, as used by jsonify before
+    provider = Flask(__name__).json
+    user_id = ObjectId()
+    start = datetime.now(timezone.utc).replace(tzinfo=None)
+    page = make_transactions(args.rows, user_id, start)
+    history = make_history(args.days, args.per_day, user_id, start)
+
+    print(f"{'payload':<28}{'before (us)':>12}{'after (us)':>12}{'speedup':>10}")
+    bench(f"transactions page ({args.rows})", lambda: old_page(page, provider), lambda: new_page(page), args.number)
+    bench(f"history ({args.days}x{args.per_day})", lambda: old_history(history, provider), lambda: new_history(history), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,11 @@ class Config:
     BROKER_URL = os.environ.get('BROKER_URL')
     RESULT_BACKEND = os.environ.get('RESULT_BACKEND')
     BROKER_CONNECTION_RETRY_ON_STARTUP = True
+
+    # Rate limiting (Redis GCRA, see app/services/rate_limiter.py)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    # Number of reverse proxies in front of the app (for the real client IP)
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
     
     # SendGrid Email (HTTP API)
     SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
@@ -28,7 +33,31 @@ class Config:
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
+    # Base URL of the Twilio REST API (point at loadtest/fake_twilio.py for load tests)
+    TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+    # Public URL of /webhook/status, so Twilio reports delivery status of our messages
+    TWILIO_STATUS_CALLBACK_URL = os.environ.get('TWILIO_STATUS_CALLBACK_URL')
+    # (connect, read) timeout for Twilio API calls, in seconds
+    TWILIO_TIMEOUT = (3.05, 10)
+    # Outbound throughput allowed for our sender number (messages per second)
+    TWILIO_MESSAGES_PER_SECOND = int(os.environ.get('TWILIO_MESSAGES_PER_SECOND', 20))
     
+    # Per-user read cache (Redis). Entries are keyed by the user's data generation,
+    # so writes invalidate them; TTL and entry size bound memory use.
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true'
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_CACHE_MAX_ENTRY_BYTES = 256 * 1024
+    # Single-flight: concurrent identical cache misses wait for one computation
+    SINGLE_FLIGHT_LOCK_TTL = 30
+    SINGLE_FLIGHT_WAIT_TIMEOUT = 10
+    SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+    SINGLE_FLIGHT_RESULT_TTL = 5
+
+    # Near-duplicate transactions (same amount and description logged again
+    # within the window): 'mark' them silently, 'warn' the user, or 'reject' them
+    DUPLICATE_WINDOW_SECONDS = int(os.environ.get('DUPLICATE_WINDOW_SECONDS', 30 * 60))
+    DUPLICATE_POLICY = os.environ.get('DUPLICATE_POLICY', 'warn').lower()
+
     # Cron secret for scheduled tasks
     CRON_SECRET = os.environ.get('CRON_SECRET', 'your-secret-key')
 
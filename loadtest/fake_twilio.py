@@ -0,0 +1,129 @@
+"""
+Local stand-in for the Twilio Messages API, for load testing the WhatsApp flow
+without real Twilio traffic.
+
+Point the backend and Celery worker at it with
+TWILIO_API_BASE_URL=http://localhost:8900. Every outbound message is recorded
+in memory (GET /messages) and the server can simulate API latency, 5xx errors
+and 429 throttling.
+
+Usage:
+    python -m loadtest.fake_twilio --port 8900 --latency-ms 150 --jitter-ms 50 --error-rate 0.01
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify
+
+
+class MessageStore:
+    """Thread-safe, in-memory log of the messages sent through the fake API."""
+
+    def __init__(self, on_message=None):
+        self._lock = threading.Lock()
+        self._messages = []
+        self.on_message = on_message
+
+    def add(self, message):
+        with self._lock:
+            message["index"] = len(self._messages)
+            self._messages.append(message)
+        if self.on_message:
+            self.on_message(message)
+
+    def since(self, index=0, to_number=None):
+        with self._lock:
+            messages = self._messages[index:]
+        if to_number:
+            messages = [m for m in messages if m["to"] == to_number]
+        return messages
+
+    def clear(self):
+        with self._lock:
+            self._messages = []
+
+
+def create_fake_twilio_app(latency_ms=100, jitter_ms=50, error_rate=0.0, throttle_rate=0.0, store=None):
+    """
+    Build the fake Twilio API.
+
+    Args:
+        latency_ms: Mean simulated API latency
+        jitter_ms: Uniform +/- jitter on the latency
+        error_rate: Fraction of sends answered with a 500
+        throttle_rate: Fraction of sends answered with a 429 (Retry-After: 1)
+        store: MessageStore to record into (e.g. one shared with the replay tool)
+    """
+    app = Flask(__name__)
+    app.config["store"] = store or MessageStore()
+    stats = {"accepted": 0, "errors": 0, "throttled": 0}
+    stats_lock = threading.Lock()
+
+    def _count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    @app.route("/2010-04-01/Accounts/<account_sid>/Messages.json", methods=["POST"])
+    def create_message(account_sid):
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        time.sleep(delay)
+
+        roll = random.random()
+        if roll < error_rate:
+            _count("errors")
+            return jsonify({"code": 20500, "message": "Internal Server Error (simulated)", "status": 500}), 500
+        if roll < error_rate + throttle_rate:
+            _count("throttled")
+            response = jsonify({"code": 20429, "message": "Too Many Requests (simulated)", "status": 429})
+            response.headers["Retry-After"] = "1"
+            return response, 429
+
+        sid = "SM" + uuid.uuid4().hex
+        message = {
+            "sid": sid,
+            "account_sid": account_sid,
+            "from": request.form.get("From"),
+            "to": request.form.get("To"),
+            "body": request.form.get("Body", ""),
+            "status": "queued",
+            "received_at": time.time(),
+            "date_created": datetime.now(timezone.utc).isoformat()
+        }
+        app.config["store"].add(message)
+        _count("accepted")
+
+        return jsonify({k: v for k, v in message.items() if k != "received_at"}), 201
+
+    @app.route("/messages", methods=["GET"])
+    def list_messages():
+        """Recorded messages, optionally ?since=<index>&to=whatsapp:+91..."""
+        messages = app.config["store"].since(request.args.get("since", 0, type=int), request.args.get("to"))
+        return jsonify({"messages": messages, "stats": stats}), 200
+
+    @app.route("/messages", methods=["DELETE"])
+    def clear_messages():
+        app.config["store"].clear()
+        return "", 204
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Twilio Messages API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_fake_twilio_app(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Replay realistic inbound WhatsApp traffic against /webhook/whatsapp and
+measure end-to-end reply latency.
+
+Each message is posted as a signed Twilio form post. Replies are captured by
+the fake Twilio API (loadtest/fake_twilio.py), which runs embedded in this
+process unless --fake-twilio-url points at a standalone one. The backend and
+Celery worker must be started with TWILIO_API_BASE_URL pointing at it and
+TWILIO_AUTH_TOKEN matching --auth-token.
+
+The sender numbers must belong to users with a verified WhatsApp number
+(whatsapp_e164 set, whatsapp_verified true). Only one message per sender is
+in flight at a time, so every reply can be matched to the message that caused it.
+
+Usage:
+    python -m loadtest.replay --target http://localhost:5000 --rate 20 --duration 60 \\
+        --senders +917000000001,+917000000002 --auth-token $TWILIO_AUTH_TOKEN
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.serving import make_server
+from .fake_twilio import MessageStore, create_fake_twilio_app
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus.txt")
+
+
+def load_corpus(path):
+    """One message per line; blank lines and '#' comments are skipped. Repeat a line to weight it."""
+    with open(path, encoding="utf-8") as f:
+        messages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not messages:
+        raise SystemExit(f"Corpus {path} is empty")
+    return messages
+
+
+def load_senders(value):
+    """Comma separated numbers, or @file with one number per line."""
+    if value.startswith("@"):
+        with open(value[1:], encoding="utf-8") as f:
+            numbers = [line.strip() for line in f if line.strip()]
+    else:
+        numbers = [n.strip() for n in value.split(",") if n.strip()]
+    return [n if n.startswith("whatsapp:") else f"whatsapp:{n}" for n in numbers]
+
+
+def command_type(body):
+    """'/summary', '/budget', ... for commands, 'expense' for free text."""
+    if body.startswith("/"):
+        return body.split()[0].lower()
+    return "expense"
+
+
+def twilio_signature(auth_token, url, params):
+    """X-Twilio-Signature: base64(HMAC-SHA1(url + sorted key/value pairs))."""
+    data = url + "".join(f"{k}{v}" for k, v in sorted(params.items()))
+    return base64.b64encode(hmac.new(auth_token.encode(), data.encode(), hashlib.sha1).digest()).decode()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class ReplyTracker:
+    """Matches replies recorded by the fake Twilio API to the inbound message that caused them."""
+
+    def __init__(self, cooldown):
+        self._lock = threading.Lock()
+        self._pending = {}            # sender -> (command, sent_at)
+        self._busy_until = {}         # sender -> time it may be reused
+        self.cooldown = cooldown
+        self.reply_latency = defaultdict(list)
+        self.unmatched = 0
+
+    def try_acquire(self, sender, now):
+        with self._lock:
+            if sender in self._pending or self._busy_until.get(sender, 0) > now:
+                return False
+            self._pending[sender] = None
+            return True
+
+    def sent(self, sender, command, sent_at):
+        with self._lock:
+            self._pending[sender] = (command, sent_at)
+
+    def release(self, sender):
+        """Free a sender whose message was rejected, so no reply is expected."""
+        with self._lock:
+            self._pending.pop(sender, None)
+
+    def on_message(self, message):
+        with self._lock:
+            pending = self._pending.get(message["to"])
+            if not pending:
+                # e.g. the budget alert sent after an expense reply
+                self.unmatched += 1
+                return
+            command, sent_at = pending
+            del self._pending[message["to"]]
+            self._busy_until[message["to"]] = message["received_at"] + self.cooldown
+            self.reply_latency[command].append(message["received_at"] - sent_at)
+
+    def expire(self, timeout, now):
+        """Drop messages that got no reply within `timeout`; returns them per command."""
+        expired = defaultdict(int)
+        with self._lock:
+            for sender, pending in list(self._pending.items()):
+                if pending and now - pending[1] > timeout:
+                    expired[pending[0]] += 1
+                    del self._pending[sender]
+        return expired
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def start_embedded_fake_twilio(host, port, args, tracker):
+    store = MessageStore(on_message=tracker.on_message)
+    app = create_fake_twilio_app(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, store)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def poll_external_fake_twilio(url, tracker, stop):
+    """Feed replies from a standalone fake Twilio server into the tracker."""
+    requests.delete(f"{url}/messages", timeout=5)
+    cursor = 0
+    while not stop.is_set():
+        try:
+            messages = requests.get(f"{url}/messages", params={"since": cursor}, timeout=5).json()["messages"]
+            for message in messages:
+                tracker.on_message(message)
+            cursor += len(messages)
+        except requests.RequestException:
+            pass
+        stop.wait(0.05)
+
+
+def run(args):
+    corpus = load_corpus(args.corpus)
+    senders = load_senders(args.senders)
+    webhook_url = args.target.rstrip("/") + "/webhook/whatsapp"
+    tracker = ReplyTracker(args.sender_cooldown_ms / 1000)
+
+    stop = threading.Event()
+    server = None
+    if args.fake_twilio_url:
+        threading.Thread(target=poll_external_fake_twilio, args=(args.fake_twilio_url.rstrip("/"), tracker, stop), daemon=True).start()
+    else:
+        server = start_embedded_fake_twilio(args.fake_twilio_host, args.fake_twilio_port, args, tracker)
+        print(f"Fake Twilio API listening on http://{args.fake_twilio_host}:{args.fake_twilio_port}")
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=args.concurrency))
+    session.mount("https://", HTTPAdapter(pool_maxsize=args.concurrency))
+
+    sent = defaultdict(int)
+    rejected = defaultdict(int)
+    timeouts = defaultdict(int)
+    ack_latency = defaultdict(list)
+    stats_lock = threading.Lock()
+    waited_for_sender = 0
+
+    def post(sender, body):
+        command = command_type(body)
+        params = {
+            "AccountSid": args.account_sid,
+            "MessageSid": "SM" + uuid.uuid4().hex,
+            "From": sender,
+            "To": f"whatsapp:{args.twilio_number}",
+            "Body": body,
+            "NumMedia": "0",
+            "ProfileName": "Load Test"
+        }
+        headers = {"X-Twilio-Signature": twilio_signature(args.auth_token, webhook_url, params)}
+
+        started = time.time()
+        tracker.sent(sender, command, started)
+        try:
+            response = session.post(webhook_url, data=params, headers=headers, timeout=10)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.time() - started
+
+        with stats_lock:
+            sent[command] += 1
+            ack_latency[command].append(elapsed)
+            if not ok:
+                rejected[command] += 1
+        if not ok:
+            tracker.release(sender)
+
+    interval = 1 / args.rate
+    started = time.time()
+    deadline = started + args.duration
+    next_send = started
+    sender_index = 0
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        while time.time() < deadline:
+            now = time.time()
+            if now < next_send:
+                time.sleep(next_send - now)
+                continue
+
+            for command, count in tracker.expire(args.reply_timeout, now).items():
+                timeouts[command] += count
+
+            # Next sender without a reply outstanding
+            for _ in range(len(senders)):
+                sender = senders[sender_index % len(senders)]
+                sender_index += 1
+                if tracker.try_acquire(sender, now):
+                    break
+            else:
+                waited_for_sender += 1
+                time.sleep(0.005)
+                continue
+
+            pool.submit(post, sender, random.choice(corpus))
+            next_send += interval
+
+    # Wait for outstanding replies
+    drain_deadline = time.time() + args.reply_timeout
+    while tracker.in_flight() and time.time() < drain_deadline:
+        time.sleep(0.1)
+    for command, count in tracker.expire(0, time.time() + args.reply_timeout + 1).items():
+        timeouts[command] += count
+
+    elapsed = time.time() - started
+    stop.set()
+    if server:
+        server.shutdown()
+
+    return build_report(sent, rejected, timeouts, ack_latency, tracker, elapsed, waited_for_sender)
+
+
+def build_report(sent, rejected, timeouts, ack_latency, tracker, elapsed, waited_for_sender):
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    commands = {}
+    for command in sorted(sent):
+        replies = tracker.reply_latency.get(command, [])
+        commands[command] = {
+            "sent": sent[command],
+            "rejected": rejected[command],
+            "replied": len(replies),
+            "timed_out": timeouts[command],
+            "throughput_per_s": round(len(replies) / elapsed, 2),
+            "ack_ms": {"p50": ms(percentile(ack_latency[command], 50)), "p95": ms(percentile(ack_latency[command], 95))},
+            "reply_ms": {
+                "p50": ms(percentile(replies, 50)),
+                "p95": ms(percentile(replies, 95)),
+                "p99": ms(percentile(replies, 99)),
+                "max": ms(max(replies)) if replies else None
+            }
+        }
+
+    all_replies = [latency for values in tracker.reply_latency.values() for latency in values]
+    return {
+        "duration_s": round(elapsed, 1),
+        "sent": sum(sent.values()),
+        "replied": len(all_replies),
+        "throughput_per_s": round(len(all_replies) / elapsed, 2),
+        "reply_ms": {
+            "p50": ms(percentile(all_replies, 50)),
+            "p95": ms(percentile(all_replies, 95)),
+            "p99": ms(percentile(all_replies, 99))
+        },
+        "unmatched_replies": tracker.unmatched,
+        # How often every sender still had a reply outstanding (add senders if high)
+        "sender_waits": waited_for_sender,
+        "commands": commands
+    }
+
+
+def print_report(report):
+    print(f"\n{report['sent']} sent, {report['replied']} replied in {report['duration_s']}s "
+          f"({report['throughput_per_s']} replies/s), {report['unmatched_replies']} unmatched replies, "
+          f"{report['sender_waits']} sender waits")
+    print(f"Reply latency ms: p50={report['reply_ms']['p50']} p95={report['reply_ms']['p95']} p99={report['reply_ms']['p99']}\n")
+
+    header = f"{'command':<14}{'sent':>7}{'rej':>6}{'reply':>7}{'t/o':>6}{'rps':>8}{'ack p50':>9}{'ack p95':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for command, row in report["commands"].items():
+        print(f"{command:<14}{row['sent']:>7}{row['rejected']:>6}{row['replied']:>7}{row['timed_out']:>6}"
+              f"{row['throughput_per_s']:>8}{str(row['ack_ms']['p50']):>9}{str(row['ack_ms']['p95']):>9}"
+              f"{str(row['reply_ms']['p50']):>9}{str(row['reply_ms']['p95']):>9}"
+              f"{str(row['reply_ms']['p99']):>9}{str(row['reply_ms']['max']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WhatsApp webhook traffic and measure reply latency")
+    parser.add_argument("--target", default="http://localhost:5000", help="Backend base URL")
+    parser.add_argument("--senders", required=True, help="Comma separated sender numbers, or @file")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rate", type=float, default=10, help="Inbound messages per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send for")
+    parser.add_argument("--concurrency", type=int, default=32, help="Parallel webhook posts")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="Seconds to wait for a reply")
+    parser.add_argument("--sender-cooldown-ms", type=float, default=200,
+                        help="Pause before reusing a sender, so follow-up messages (alerts) aren't mismatched")
+    parser.add_argument("--auth-token", default=os.environ.get("TWILIO_AUTH_TOKEN", "test-auth-token"))
+    parser.add_argument("--account-sid", default=os.environ.get("TWILIO_ACCOUNT_SID", "ACloadtest"))
+    parser.add_argument("--twilio-number", default=os.environ.get("TWILIO_PHONE_NUMBER", "+14155238886"))
+    parser.add_argument("--fake-twilio-url", help="Use a standalone fake Twilio server instead of the embedded one")
+    parser.add_argument("--fake-twilio-host", default="127.0.0.1")
+    parser.add_argument("--fake-twilio-port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=100, help="Embedded fake Twilio API latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
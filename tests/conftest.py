@@ -1,17 +1,27 @@
 import json
+from datetime import datetime
 import pytest
+from flask_jwt_extended import create_access_token
 from app import create_app, mongo
+from app.utils import get_redis
 
-@pytest.fixture(scope='module')
-def test_client():
-    # Create a Flask app configured for testing
-    flask_app = create_app()
+# One Flask app for the whole run: create_app() attaches CORS to the
+# module-level blueprints, which Flask allows only once per process. It is
+# created on import so test modules can import Celery tasks at module level.
+application = create_app()
+
+@pytest.fixture(scope='session')
+def flask_app():
+    flask_app = application
     flask_app.config.update({
         "TESTING": True,
         # Use a separate database for testing
         "MONGO_URI": "mongodb://localhost:27017/finsight_test_db"
     })
+    return flask_app
 
+@pytest.fixture(scope='module')
+def test_client(flask_app):
     # Create a test client using the Flask application configured for testing
     with flask_app.test_client() as testing_client:
         # Establish an application context
@@ -41,4 +51,29 @@ def auth_token(test_client):
                                      content_type='application/json')
     
     token = json.loads(login_response.data)['access_token']
-    yield token
\ No newline at end of file
+    yield token
+
+@pytest.fixture(scope='module')
+def test_user(test_client):
+    """A user inserted directly (registration is covered by test_auth), with WhatsApp linked and opted in."""
+    user_id = mongo.db.users.insert_one({
+        "email": "test-user@example.com",
+        "created_at": datetime.utcnow(),
+        "whatsapp_e164": "+917058099532",
+        "whatsapp_verified": True,
+        "whatsapp_weekly": True,
+        "whatsapp_alerts": True
+    }).inserted_id
+    yield user_id
+    for collection in (mongo.db.transactions, mongo.db.budgets, mongo.db.category_spend, mongo.db.category_stats):
+        collection.delete_many({"user_id": user_id})
+
+@pytest.fixture(scope='module')
+def auth_headers(test_user):
+    """Authorization header for test_user."""
+    return {'Authorization': f'Bearer {create_access_token(identity=str(test_user))}'}
+
+@pytest.fixture
+def redis_conn(test_client):
+    """The app's Redis client. Tests use keys unique to the test, so nothing is flushed."""
+    return get_redis()
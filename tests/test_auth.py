@@ -1,5 +1,7 @@
 # tests/test_auth.py
 import json
+import uuid
+from app.services.rate_limiter import rate_limiter
 
 def test_registration(test_client):
     """
@@ -62,4 +64,40 @@ def test_login(test_client):
     
     assert response.status_code == 200
     response_data = json.loads(response.data)
-    assert "access_token" in response_data
\ No newline at end of file
+    assert "access_token" in response_data
+
+def test_rate_limiter_gcra(redis_conn):
+    """
+    GIVEN a limit of 2 requests per minute
+    WHEN a caller sends 3 requests at once
+    THEN check the burst of 2 is allowed and the third waits one emission interval (30s)
+    """
+    key = f"rl:test:{uuid.uuid4().hex}"
+
+    assert rate_limiter.hit(key, limit=2, period=60) == (True, 0)
+    assert rate_limiter.hit(key, limit=2, period=60) == (True, 0)
+    allowed, retry_after = rate_limiter.hit(key, limit=2, period=60)
+    assert not allowed
+    assert 29 < retry_after <= 30
+
+    redis_conn.delete(key)
+
+def test_login_rate_limit(test_client):
+    """
+    GIVEN an email that keeps failing to log in
+    WHEN the '/api/auth/login' endpoint is posted to more than 5 times
+    THEN check the 6th attempt gets '429 Too Many Requests' with a Retry-After header
+    """
+    credentials = json.dumps({"email": f"{uuid.uuid4().hex}@example.com", "password": "wrong-password"})
+    # A fresh client IP each run, so only the per-email limit applies
+    environ = {"REMOTE_ADDR": "10.0.%d.%d" % tuple(uuid.uuid4().bytes[:2])}
+
+    for _ in range(5):
+        response = test_client.post('/api/auth/login', data=credentials,
+                                    content_type='application/json', environ_base=environ)
+        assert response.status_code == 401
+
+    response = test_client.post('/api/auth/login', data=credentials,
+                                content_type='application/json', environ_base=environ)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
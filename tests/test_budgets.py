@@ -0,0 +1,68 @@
+# tests/test_budgets.py
+import json
+from datetime import datetime
+from app import mongo
+from app.services.budget_service import recent_months, budget_overview_pipeline
+from app.services.forecast_service import project_month_end, remaining_weekday_counts
+
+
+def test_budget_overview_months():
+    """
+    GIVEN the current date
+    WHEN the months of a budget overview are listed
+    THEN check they end with the current month and wrap across years
+    """
+    months = recent_months(datetime(2025, 2, 10), 4)
+    assert months == [(2024, 11), (2024, 12), (2025, 1), (2025, 2)]
+
+    date_range = budget_overview_pipeline("user", months)[0]["$match"]["date"]
+    assert date_range == {"$gte": datetime(2024, 11, 1), "$lt": datetime(2025, 3, 1)}
+
+
+def test_project_month_end():
+    """
+    GIVEN a category's weekday spend rates and a monthly recurring charge still expected
+    WHEN month-end spend is projected
+    THEN check it adds the rates over the days left and the pending charge to the spend so far
+    """
+    # 2025-03-28 is a Friday: Saturday 29, Sunday 30 and Monday 31 are left
+    now = datetime(2025, 3, 28, 15)
+    assert remaining_weekday_counts(now).tolist() == [1, 0, 0, 0, 0, 1, 1]
+
+    categories = {"Food & Dining": {"dow_rates": [100, 100, 100, 100, 100, 400, 300]}}
+    recurring = [
+        {"category": "Entertainment", "amount": 499, "next_expected": datetime(2025, 3, 30), "interval_days": 30.4},
+        {"category": "Food & Dining", "amount": 50, "next_expected": datetime(2025, 3, 29), "interval_days": 7},
+    ]
+    projections = project_month_end(categories, {"Food & Dining": 5000, "Shopping": 250}, now, recurring)
+
+    assert projections["Food & Dining"]["projected"] == 5850
+    assert projections["Entertainment"] == {"spent": 0, "projected": 499, "recurring_pending": 499}
+    assert projections["Shopping"]["projected"] == 250
+
+
+def test_create_budget_conflict(test_client, test_user, auth_headers):
+    """
+    GIVEN a budget for a category this month
+    WHEN the same budget is created again, alone or in a bulk request
+    THEN check a single create gets '409 Conflict' and the bulk create skips it but creates the rest
+    """
+    now = datetime.utcnow()
+    budget = {"category": "Food & Dining", "limit": 5000, "month": now.month, "year": now.year}
+
+    response = test_client.post('/api/budgets/', headers=auth_headers,
+                                data=json.dumps(budget), content_type='application/json')
+    assert response.status_code == 201
+
+    response = test_client.post('/api/budgets/', headers=auth_headers,
+                                data=json.dumps({**budget, "limit": 6000}), content_type='application/json')
+    assert response.status_code == 409
+
+    response = test_client.post('/api/budgets/bulk', headers=auth_headers,
+                                data=json.dumps({"budgets": [budget, {**budget, "category": "Travel"}]}),
+                                content_type='application/json')
+    assert response.status_code == 201
+    assert [r["status"] for r in json.loads(response.data)["data"]["results"]] == ["exists", "created"]
+
+    assert mongo.db.budgets.count_documents({"user_id": test_user}) == 2
+    assert mongo.db.budgets.find_one({"user_id": test_user, "category": "Food & Dining"})["limit"] == 5000
@@ -0,0 +1,111 @@
+# tests/test_dashboard.py
+import uuid
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from app import mongo
+from app.dashboard.routes import build_dashboard, RECENT_TRANSACTIONS_LIMIT
+from app.services.cache_service import invalidate_user_cache, USER_GENERATION_KEY
+from app.services.single_flight import single_flight, SINGLE_FLIGHT_LOCK_KEY
+
+
+def test_build_dashboard(test_client):
+    """
+    GIVEN a user with spend this month, older spend, a pending transaction and a budget
+    WHEN the dashboard is built
+    THEN check the month totals count only this month's completed spend and recent shows the newest overall
+    """
+    user_id = ObjectId()
+    transaction = {"user_id": user_id, "status": "completed", "description": "dashboard test"}
+    mongo.db.transactions.insert_many(
+        [{**transaction, "amount": 100, "category": "Food & Dining", "date": datetime(2025, 3, day)} for day in (2, 4, 6)]
+        + [{**transaction, "amount": 400, "category": "Travel", "date": datetime(2025, 3, 8)},
+           {**transaction, "amount": 999, "category": "Travel", "date": datetime(2025, 2, 27)},
+           {**transaction, "amount": 50, "category": "Travel", "date": datetime(2025, 3, 10), "status": "processing"}]
+    )
+    mongo.db.budgets.insert_one({"user_id": user_id, "category": "Food & Dining", "year": 2025, "month": 3, "limit": 1000})
+
+    dashboard = build_dashboard(user_id, datetime(2025, 3, 15))
+
+    assert dashboard["current_month_spend"] == 700
+    assert dashboard["transaction_count"] == 4
+    assert dashboard["spend_by_category"] == [
+        {"category": "Travel", "total": 400, "count": 1},
+        {"category": "Food & Dining", "total": 300, "count": 3},
+    ]
+    assert [budget["current_spend"] for budget in dashboard["budgets"]] == [300]
+    assert len(dashboard["recent_transactions"]) == RECENT_TRANSACTIONS_LIMIT
+    assert [t["date"].day for t in dashboard["recent_transactions"]] == [10, 8, 6, 4, 2]
+
+    mongo.db.transactions.delete_many({"user_id": user_id})
+    mongo.db.budgets.delete_many({"user_id": user_id})
+
+
+def test_dashboard_cache_generation(test_client, test_user, auth_headers, redis_conn):
+    """
+    GIVEN a cached dashboard
+    WHEN the user's data changes and their cache generation is bumped
+    THEN check the next request misses the cache and returns the new data
+    """
+    response = test_client.get('/api/dashboard/', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'MISS'
+    assert test_client.get('/api/dashboard/', headers=auth_headers).headers['X-Cache'] == 'HIT'
+
+    mongo.db.transactions.insert_one({"user_id": test_user, "amount": 120, "category": "Travel",
+                                      "status": "completed", "date": datetime.utcnow()})
+    assert test_client.get('/api/dashboard/', headers=auth_headers).headers['X-Cache'] == 'HIT'
+
+    invalidate_user_cache(test_user)
+    assert redis_conn.get(USER_GENERATION_KEY.format(user_id=str(test_user))) == b"1"
+
+    response = test_client.get('/api/dashboard/', headers=auth_headers)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()["data"]["current_month_spend"] == 120
+
+
+def test_dashboard_etag(test_client, test_user, auth_headers):
+    """
+    GIVEN a dashboard response and its ETag
+    WHEN it is requested again with If-None-Match, before and after the user's data changes
+    THEN check an unchanged dashboard is a bodiless '304 Not Modified' and a changed one a full 200
+    """
+    response = test_client.get('/api/dashboard/', headers=auth_headers)
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    response = test_client.get('/api/dashboard/', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    invalidate_user_cache(test_user)
+    response = test_client.get('/api/dashboard/', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_single_flight_releases_lock_on_error(test_client, redis_conn):
+    """
+    GIVEN a single-flight leader whose computation fails
+    WHEN the next caller asks for the same result, and then a caller finds it shared
+    THEN check the lock was released so the next caller computes, and later callers reuse its result
+    """
+    result_key = f"sf:result:test:{uuid.uuid4().hex}"
+    coalesced = []
+
+    def failing():
+        raise ValueError("query failed")
+
+    with pytest.raises(ValueError):
+        single_flight(result_key, failing, 5, redis_conn)
+    assert not redis_conn.exists(SINGLE_FLIGHT_LOCK_KEY.format(key=result_key))
+
+    assert single_flight(result_key, lambda: b"result", 5, redis_conn) == b"result"
+
+    # A follower while another worker holds the lock: it takes the shared result instead of computing
+    redis_conn.set(SINGLE_FLIGHT_LOCK_KEY.format(key=result_key), "other-worker")
+    assert single_flight(result_key, failing, 5, redis_conn, on_coalesced=lambda: coalesced.append(1)) == b"result"
+    assert coalesced == [1]
+
+    redis_conn.delete(result_key, SINGLE_FLIGHT_LOCK_KEY.format(key=result_key))
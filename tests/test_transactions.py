@@ -1,5 +1,25 @@
 # tests/test_transactions.py
 import json
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from bson import ObjectId, Decimal128
+from pydantic import ValidationError
+from app import mongo
+from app.serialization import dumps_bytes
+from app.services.sync_service import (
+    encode_sync_token, decode_sync_token, get_changes, InvalidSyncToken, ExpiredSyncToken, SYNC_COLLECTIONS,
+    ZERO_ID, TOMBSTONE_TTL_DAYS, to_ms
+)
+from app.services.anomaly_service import robust_z_scores, rolling_scores, is_anomaly, ANOMALY_Z_THRESHOLD
+from app.services.recurring_service import series_key, classify_interval
+from app.models.transaction import Transaction
+from app.services.transaction_service import (
+    duplicate_hash, insert_transaction, parse_transaction_refs, transaction_projection, LIST_DEFAULT_FIELDS
+)
+from app.transactions import tasks as transaction_tasks
+from app.transactions.tasks import process_ai_transaction
+from app.transactions.schemas import BatchUpdateSchema, MAX_BATCH_SIZE
 
 def test_add_manual_transaction(test_client, auth_token):
     """
@@ -32,4 +52,241 @@ def test_get_transactions_unauthorized(test_client):
     THEN check for a '401 Unauthorized' status code
     """
     response = test_client.get('/api/transactions/')
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+
+def test_sync_token_round_trip():
+    """
+    GIVEN delta sync positions
+    WHEN they are encoded to a token and decoded again
+    THEN check they survive unchanged and bad or too old tokens are rejected
+    """
+    now_ms = to_ms(datetime.utcnow())
+    positions = {key: [now_ms, "65a1b2c3d4e5f60718293a4b"] for key in SYNC_COLLECTIONS}
+    assert decode_sync_token(encode_sync_token(positions)) == positions
+    assert decode_sync_token(None) == {key: [0, ZERO_ID] for key in SYNC_COLLECTIONS}
+
+    with pytest.raises(InvalidSyncToken):
+        decode_sync_token("not-a-token")
+
+    old_ms = to_ms(datetime.utcnow() - timedelta(days=TOMBSTONE_TTL_DAYS + 1))
+    with pytest.raises(ExpiredSyncToken):
+        decode_sync_token(encode_sync_token({**positions, "del": [old_ms, ZERO_ID]}))
+
+    # Only forgotten deletions expire a token, and never a has_more continuation
+    old_transactions = {**positions, "tx": [old_ms, ZERO_ID]}
+    assert decode_sync_token(encode_sync_token(old_transactions)) == old_transactions
+    old_deletions = {**positions, "del": [old_ms, ZERO_ID]}
+    assert decode_sync_token(encode_sync_token(old_deletions, has_more=True)) == old_deletions
+
+
+def test_first_sync_pages_through_old_transactions(test_client):
+    """
+    GIVEN a user whose transactions were last updated long before the deletion history
+    WHEN a first sync pages through them
+    THEN check every page is served and the last one ends with has_more false
+    """
+    user_id = ObjectId()
+    old = datetime.utcnow() - timedelta(days=TOMBSTONE_TTL_DAYS * 3)
+    mongo.db.transactions.insert_many([
+        {"user_id": user_id, "amount": 100 + day, "category": "Other", "status": "completed",
+         "date": old + timedelta(days=day), "updated_at": old + timedelta(days=day)}
+        for day in range(5)
+    ])
+
+    amounts, token, has_more = [], None, True
+    while has_more:
+        page = get_changes(user_id, token, limit=2)
+        amounts += [t["amount"] for t in page["transactions"]]
+        token, has_more = page["next_token"], page["has_more"]
+
+    assert amounts == [100, 101, 102, 103, 104]
+    assert get_changes(user_id, token, limit=2)["transactions"] == []
+
+    mongo.db.transactions.delete_many({"user_id": user_id})
+
+
+def test_batch_update_schema():
+    """
+    GIVEN a batch update request body
+    WHEN it is validated
+    THEN check amounts are rounded and empty, invalid or repeated items are rejected
+    """
+    data = BatchUpdateSchema(updates=[{"id": "a", "amount": 10.555}, {"id": "b", "category": "Travel"}])
+    assert data.updates[0].amount == 10.55
+
+    for updates in (
+        [{"id": "a"}],
+        [{"id": "a", "category": "Not a category"}],
+        [{"id": "a", "amount": 1}, {"id": "a", "amount": 2}],
+        [{"id": str(i), "amount": 1} for i in range(MAX_BATCH_SIZE + 1)],
+    ):
+        with pytest.raises(ValidationError):
+            BatchUpdateSchema(updates=updates)
+
+
+def test_robust_z_scores():
+    """
+    GIVEN a category's earlier amounts
+    WHEN new amounts are scored against them
+    THEN check a usual amount scores low, a big outlier scores high and identical history stays finite
+    """
+    history = np.array([
+        [150, 180, 200, 220, 170, 190, 210, 160, np.nan, np.nan],
+        [499] * 10,
+    ], dtype=float)
+    scores, medians = robust_z_scores(history, np.array([[210, 2000], [499, 999]], dtype=float))
+
+    assert medians.tolist() == [185, 499]
+    assert scores[0, 0] < ANOMALY_Z_THRESHOLD < scores[0, 1]
+    assert scores[1, 0] == 0
+    assert np.isfinite(scores[1, 1]) and scores[1, 1] > ANOMALY_Z_THRESHOLD
+
+
+def test_rolling_scores_replay():
+    """
+    GIVEN a category's amounts in date order with the same outlier early and late
+    WHEN they are replayed for the anomaly backfill
+    THEN check each is scored against the amounts before it and only the one with enough history is flagged
+    """
+    amounts = [150, 180, 200, 220, 170, 190, 2000, 210, 160, 2000, 185]
+    scores, medians, lengths = rolling_scores(amounts)
+
+    assert lengths.tolist() == list(range(len(amounts)))
+    assert np.isnan(scores[0]) and medians[1] == 150
+    assert is_anomaly(scores, lengths).tolist() == [False] * 9 + [True, False]
+
+
+def test_recurring_series_detection():
+    """
+    GIVEN charges with the same merchant on a monthly schedule and irregular ones
+    WHEN their descriptions are normalized and their intervals classified
+    THEN check the monthly series is detected and month names or small price changes don't split it
+    """
+    assert series_key("Netflix - Oct 2024", 499) == series_key("netflix NOV", 509)
+    assert series_key("Netflix", 499) != series_key("Netflix", 799)
+    assert series_key("499", 499) is None
+
+    monthly = [datetime(2025, 1, 5), datetime(2025, 2, 4), datetime(2025, 3, 6), datetime(2025, 4, 5)]
+    assert classify_interval(monthly) == ("monthly", 30.0)
+    assert classify_interval(monthly[:2]) is None
+    assert classify_interval([datetime(2025, 1, 1), datetime(2025, 1, 3), datetime(2025, 2, 20)]) is None
+
+
+def test_duplicate_hash():
+    """
+    GIVEN transactions logged twice with small differences in the description
+    WHEN their duplicate hashes are computed
+    THEN check casing and punctuation don't matter but the user, amount and words do
+    """
+    user_id, other_user = ObjectId(), ObjectId()
+    coffee = {"user_id": user_id, "amount": 500, "description": "Coffee!", "status": "completed"}
+
+    assert duplicate_hash(coffee) == duplicate_hash({**coffee, "amount": 500.0, "description": " coffee "})
+    assert duplicate_hash(coffee) != duplicate_hash({**coffee, "amount": 50})
+    assert duplicate_hash(coffee) != duplicate_hash({**coffee, "description": "coffee again"})
+    assert duplicate_hash(coffee) != duplicate_hash({**coffee, "user_id": other_user})
+
+    tap = {"user_id": user_id, "raw_text": "500 on coffee", "status": "processing"}
+    assert duplicate_hash(tap) == duplicate_hash({**tap, "raw_text": "500  on Coffee"})
+    assert duplicate_hash(tap) != duplicate_hash({**tap, "raw_text": "50 on coffee"})
+
+
+def test_orjson_encodes_mongo_documents():
+    """
+    GIVEN a transaction document as MongoDB returns it
+    WHEN it is serialized for an API response
+    THEN check ObjectIds become strings, naive dates are marked UTC and decimals become numbers
+    """
+    transaction_id = ObjectId("65a1b2c3d4e5f60718293a4b")
+    document = {
+        "_id": transaction_id,
+        "amount": Decimal128("550.75"),
+        "date": datetime(2024, 1, 31, 10, 0),
+        "tags": {"work"}
+    }
+
+    assert json.loads(dumps_bytes(document)) == {
+        "_id": "65a1b2c3d4e5f60718293a4b",
+        "amount": 550.75,
+        "date": "2024-01-31T10:00:00+00:00",
+        "tags": ["work"]
+    }
+    with pytest.raises(TypeError):
+        dumps_bytes({"error": ValueError("not serializable")})
+
+
+def test_ai_duplicate_override_survives_parsing(flask_app, test_user, monkeypatch):
+    """
+    GIVEN the 'reject' duplicate policy and a coffee already recorded
+    WHEN the same coffee is sent as AI text, once plainly and once resent with allow_duplicate
+    THEN check parsing rejects the plain one but completes the allowed one, still marking what it duplicates
+    """
+    monkeypatch.setitem(flask_app.config, 'DUPLICATE_POLICY', 'reject')
+    monkeypatch.setattr(transaction_tasks, "parse_expense_test",
+                        lambda text: {"amount": 180, "category": "Food & Dining", "description": "Coffee"})
+    monkeypatch.setattr(transaction_tasks, "schedule_recurring_detection", lambda user_id: None)
+    first_id = insert_transaction({"user_id": test_user, "amount": 180, "category": "Food & Dining",
+                                   "description": "Coffee", "status": "completed", "date": datetime.utcnow()}).inserted_id
+
+    plain_id = insert_transaction(Transaction.create_ai_transaction(test_user, "180 coffee")).inserted_id
+    allowed_id = insert_transaction(Transaction.create_ai_transaction(test_user, "coffee 180"),
+                                    allow_duplicate=True).inserted_id
+    process_ai_transaction(str(plain_id))
+    process_ai_transaction(str(allowed_id))
+
+    assert mongo.db.transactions.find_one({"_id": plain_id})["status"] == "failed"
+    allowed = mongo.db.transactions.find_one({"_id": allowed_id})
+    assert allowed["status"] == "completed"
+    assert allowed["duplicate_of"] == first_id
+
+    mongo.db.transactions.delete_many({"_id": {"$in": [first_id, plain_id, allowed_id]}})
+
+
+def test_ai_double_tap_flags_only_the_later(test_user, monkeypatch):
+    """
+    GIVEN the same AI text sent twice in a row under the 'warn' policy
+    WHEN both are parsed, the later one first
+    THEN check only the later one is marked a duplicate, of the earlier one
+    """
+    monkeypatch.setattr(transaction_tasks, "parse_expense_test",
+                        lambda text: {"amount": 320, "category": "Travel", "description": "Cab home"})
+    monkeypatch.setattr(transaction_tasks, "schedule_recurring_detection", lambda user_id: None)
+    first_id = insert_transaction(Transaction.create_ai_transaction(test_user, "320 cab home")).inserted_id
+    second_id = insert_transaction(Transaction.create_ai_transaction(test_user, "320 cab home")).inserted_id
+
+    process_ai_transaction(str(second_id))
+    process_ai_transaction(str(first_id))
+
+    first = mongo.db.transactions.find_one({"_id": first_id})
+    second = mongo.db.transactions.find_one({"_id": second_id})
+    assert first["status"] == second["status"] == "completed"
+    assert "duplicate_of" not in first
+    assert second["duplicate_of"] == first_id
+
+    mongo.db.transactions.delete_many({"_id": {"$in": [first_id, second_id]}})
+
+
+def test_transaction_projection():
+    """
+    GIVEN a fields= query parameter
+    WHEN it is turned into a MongoDB projection
+    THEN check that defaults apply when it is empty and unknown fields are reported
+    """
+    assert transaction_projection(None, LIST_DEFAULT_FIELDS) == ({f: 1 for f in LIST_DEFAULT_FIELDS}, [])
+    assert transaction_projection("amount, date,", LIST_DEFAULT_FIELDS) == ({"amount": 1, "date": 1}, [])
+    assert transaction_projection("amount,password", LIST_DEFAULT_FIELDS) == ({"amount": 1}, ["password"])
+
+
+def test_parse_transaction_refs():
+    """
+    GIVEN the arguments of a WhatsApp /delete command
+    WHEN they are parsed
+    THEN check that short refs, ObjectIds and invalid tokens are separated
+    """
+    object_id = "65a1b2c3d4e5f60718293a4b"
+    short_refs, object_ids, invalid = parse_transaction_refs(["12,#15", object_id, "abc"])
+
+    assert short_refs == [12, 15]
+    assert object_ids == [ObjectId(object_id)]
+    assert invalid == ["abc"]
@@ -0,0 +1,340 @@
+# tests/test_whatsapp.py
+import base64
+import hashlib
+import hmac
+import json
+import uuid
+from datetime import datetime
+import pytest
+from celery.exceptions import Retry
+from bson import ObjectId
+from app import create_indexes, mongo
+from loadtest.fake_twilio import create_fake_twilio_app
+from app.services.twilio_service import twilio_service
+from app.whatsapp.handlers import get_month_spending
+from app.services.whatsapp_delivery_service import (
+    record_outbound_message, record_status_callback, claim_failed_message_for_retry
+)
+from app.whatsapp import routes as whatsapp_routes, tasks as whatsapp_tasks
+from app.whatsapp.routes import claim_message_sid
+from app.whatsapp.tasks import (
+    process_whatsapp_inbox, send_weekly_summaries_task, send_weekly_summary_chunk,
+    INBOX_KEY, INBOX_LOCK_KEY, WEEKLY_JOB_KEY
+)
+
+
+def test_normalize_phone_number_formats():
+    """
+    GIVEN the same Indian mobile number in the formats we store and receive
+    WHEN it is normalized
+    THEN check that every format maps to the same E.164 number
+    """
+    for number in ["7058099532", "+917058099532", "917058099532", "whatsapp:+917058099532", "70580 99532"]:
+        assert twilio_service.normalize_phone_number(number) == "+917058099532"
+
+
+def test_normalize_phone_number_invalid():
+    """
+    GIVEN numbers that are not valid Indian mobiles
+    WHEN they are normalized
+    THEN check that None is returned
+    """
+    for number in [None, "", "12345", "5058099532", "+447058099532"]:
+        assert twilio_service.normalize_phone_number(number) is None
+
+
+def test_budget_alert_threshold_crossing():
+    """
+    GIVEN a budget of 1000
+    WHEN a transaction moves the month's spend across (or within) thresholds
+    THEN check that only the highest newly crossed threshold is reported
+    """
+    from app.services.budget_alert_service import crossed_threshold
+
+    assert crossed_threshold(700, 850, 1000) == 80
+    assert crossed_threshold(850, 900, 1000) is None  # 80% already passed
+    assert crossed_threshold(900, 1000, 1000) == 100
+    assert crossed_threshold(500, 1200, 1000) == 100  # jumps over both
+    assert crossed_threshold(1100, 1200, 1000) is None
+    assert crossed_threshold(0, 100, 0) is None
+
+
+def test_startup_survives_duplicate_message_sids(flask_app, test_client):
+    """
+    GIVEN older transactions recorded twice from one WhatsApp message
+    WHEN the app starts and creates its indexes
+    THEN check only the unique message_sid index is skipped and every other index is still built
+    """
+    mongo.db.transactions.drop_indexes()
+    mongo.db.budgets.drop_indexes()
+    duplicate = {"user_id": ObjectId(), "amount": 100, "category": "Other", "status": "completed",
+                 "date": datetime.utcnow(), "message_sid": "SMduplicate"}
+    mongo.db.transactions.insert_many([{**duplicate, "short_ref": 1}, {**duplicate, "short_ref": 2}])
+
+    create_indexes(flask_app)
+
+    transaction_indexes = mongo.db.transactions.index_information()
+    assert "message_sid_1" not in transaction_indexes
+    assert "user_id_1_date_-1" in transaction_indexes
+    assert "dup_hash_1_date_1" in transaction_indexes
+    assert "user_id_1_year_1_month_1_category_1" in mongo.db.budgets.index_information()
+    assert "user_id_1_category_1" in mongo.db.category_stats.index_information()
+
+    mongo.db.transactions.delete_many({"message_sid": "SMduplicate"})
+
+
+def test_dedupe_message_sids_lets_unique_index_build(flask_app, test_client):
+    """
+    GIVEN a WhatsApp message recorded as two transactions
+    WHEN the dedupe-message-sids command runs and the indexes are created again
+    THEN check only the first transaction is kept and the unique message_sid index is built
+    """
+    duplicate = {"user_id": ObjectId(), "amount": 100, "category": "Other", "status": "completed",
+                 "date": datetime.utcnow(), "message_sid": "SMdedupe"}
+    first_id = mongo.db.transactions.insert_one({**duplicate, "short_ref": 1}).inserted_id
+    mongo.db.transactions.insert_one({**duplicate, "short_ref": 2})
+
+    result = flask_app.test_cli_runner().invoke(args=["dedupe-message-sids"])
+    create_indexes(flask_app)
+
+    assert "Removed 1 duplicate" in result.output
+    assert [t["_id"] for t in mongo.db.transactions.find({"message_sid": "SMdedupe"})] == [first_id]
+    assert mongo.db.transactions.index_information()["message_sid_1"]["unique"]
+
+    mongo.db.transactions.delete_many({"message_sid": "SMdedupe"})
+
+
+def test_claim_message_sid(test_client, monkeypatch):
+    """
+    GIVEN an inbound MessageSid that Twilio delivers twice
+    WHEN it is claimed, with Redis up and with Redis down
+    THEN check only the first claim succeeds either way
+    """
+    message_sid = f"SM{uuid.uuid4().hex}"
+    assert claim_message_sid(message_sid)
+    assert not claim_message_sid(message_sid)
+
+    def redis_down():
+        raise ConnectionError("Redis unavailable")
+
+    monkeypatch.setattr(whatsapp_routes, "get_redis", redis_down)
+    assert claim_message_sid(message_sid)  # Not yet seen by the MongoDB fallback
+    assert not claim_message_sid(message_sid)
+
+    mongo.db.whatsapp_messages.delete_one({"message_sid": message_sid})
+
+
+def test_webhook_rejects_unsigned_before_rate_limit(test_client, redis_conn):
+    """
+    GIVEN webhook requests without a valid X-Twilio-Signature
+    WHEN they are posted with someone's number in `From`
+    THEN check each gets '403 Forbidden' and none counts against that number's rate limit
+    """
+    form = {"From": "whatsapp:+917058099532", "Body": "100 on coffee", "MessageSid": "SMunsigned"}
+
+    for _ in range(25):
+        response = test_client.post('/webhook/whatsapp', data=form, headers={'X-Twilio-Signature': 'forged'})
+        assert response.status_code == 403
+
+    assert not redis_conn.exists("rl:whatsapp:phone:+917058099532")
+
+
+def test_inbox_processed_in_arrival_order(test_client, redis_conn, monkeypatch):
+    """
+    GIVEN a sender's inbox holding three messages, one of which fails
+    WHEN the inbox task drains it
+    THEN check they are handled in arrival order, a failure doesn't stop the rest, and the lock is released
+    """
+    sender = f"+91{uuid.uuid4().int % 10**10:010d}"
+    handled = []
+
+    def handle(from_number, message_body, message_sid):
+        handled.append(message_sid)
+        if message_sid == "SM2":
+            raise ValueError("parse failed")
+
+    monkeypatch.setattr(whatsapp_tasks, "handle_incoming_message", handle)
+    for sid in ("SM1", "SM2", "SM3"):
+        redis_conn.rpush(INBOX_KEY.format(sender=sender),
+                         json.dumps({"from_number": f"whatsapp:{sender}", "message_body": sid, "message_sid": sid}))
+
+    # Another worker holding the lock drains the inbox instead
+    redis_conn.set(INBOX_LOCK_KEY.format(sender=sender), "other-worker")
+    process_whatsapp_inbox(sender)
+    assert handled == []
+
+    redis_conn.delete(INBOX_LOCK_KEY.format(sender=sender))
+    process_whatsapp_inbox(sender)
+    assert handled == ["SM1", "SM2", "SM3"]
+    assert not redis_conn.exists(INBOX_KEY.format(sender=sender))
+    assert not redis_conn.exists(INBOX_LOCK_KEY.format(sender=sender))
+
+
+def test_delivery_status_only_moves_forward(test_client):
+    """
+    GIVEN an outbound message whose status callbacks arrive out of order
+    WHEN 'read' is recorded before 'delivered'
+    THEN check the status stays 'read' and the time of each status is still kept
+    """
+    sid = f"SM{uuid.uuid4().hex}"
+    record_outbound_message(sid, "+917058099532", "Weekly summary", "queued")
+
+    record_status_callback(sid, "read")
+    record_status_callback(sid, "delivered")
+
+    message = mongo.db.whatsapp_outbound.find_one({"_id": sid})
+    assert message["status"] == "read"
+    assert message["read_at"] and message["delivered_at"]
+    assert message["body"] == "Weekly summary"
+
+    mongo.db.whatsapp_outbound.delete_one({"_id": sid})
+
+
+def test_failed_message_claimed_for_one_retry(test_client):
+    """
+    GIVEN an outbound message that failed
+    WHEN it is claimed for a retry
+    THEN check a transient error is claimed exactly once and a permanent one never
+    """
+    sid, permanent_sid = f"SM{uuid.uuid4().hex}", f"SM{uuid.uuid4().hex}"
+    for message_sid in (sid, permanent_sid):
+        record_outbound_message(message_sid, "+917058099532", "Weekly summary", "queued")
+        record_status_callback(message_sid, "failed")
+
+    assert claim_failed_message_for_retry(sid, "30003")["attempt"] == 1
+    assert claim_failed_message_for_retry(sid, "30003") is None
+    assert claim_failed_message_for_retry(permanent_sid, "63016") is None
+
+    mongo.db.whatsapp_outbound.delete_many({"_id": {"$in": [sid, permanent_sid]}})
+
+
+def test_weekly_summary_job_completes(test_user, redis_conn, monkeypatch):
+    """
+    GIVEN a user opted in to weekly summaries who spent this week
+    WHEN a weekly summary run is started and its chunks are sent
+    THEN check the user gets one summary and the job ends 'completed'
+    """
+    sent = []
+    monkeypatch.setattr(whatsapp_tasks, "acquire_send_slot", lambda: (True, 0))
+    monkeypatch.setattr(twilio_service, "send_whatsapp_message", lambda to, body: sent.append(to) or True)
+    # Run chunks inline instead of through the broker
+    monkeypatch.setattr(send_weekly_summary_chunk, "delay", lambda *args: send_weekly_summary_chunk(*args))
+    mongo.db.transactions.insert_one({"user_id": test_user, "amount": 250, "category": "Food & Dining",
+                                      "status": "completed", "date": datetime.utcnow()})
+
+    job_id = uuid.uuid4().hex
+    send_weekly_summaries_task(job_id)
+
+    job = redis_conn.hgetall(WEEKLY_JOB_KEY.format(job_id=job_id))
+    assert sent == ["whatsapp:+917058099532"]
+    assert job[b"status"] == b"completed"
+    assert job[b"sent"] == b"1" and job[b"chunks_done"] == job[b"chunks_total"] == b"1"
+
+    redis_conn.delete(WEEKLY_JOB_KEY.format(job_id=job_id))
+
+
+def test_weekly_summary_chunk_retries_and_fails(test_client, redis_conn, monkeypatch):
+    """
+    GIVEN a weekly summary job of one chunk
+    WHEN the send limiter runs out part way, and later the chunk breaks
+    THEN check the rest is re-queued instead of waiting, and the failed chunk still completes the job
+    """
+    slots = iter([(True, 0), (False, 2)])
+    monkeypatch.setattr(whatsapp_tasks, "acquire_send_slot", lambda: next(slots))
+    monkeypatch.setattr(twilio_service, "send_whatsapp_message", lambda to, body: True)
+    job_id = uuid.uuid4().hex
+    job_key = WEEKLY_JOB_KEY.format(job_id=job_id)
+    redis_conn.hset(job_key, mapping={"status": "sending", "chunks_total": 1})
+    messages = [["whatsapp:+917058099532", "summary"], ["whatsapp:+917058099533", "summary"]]
+
+    with pytest.raises(Retry):
+        send_weekly_summary_chunk(job_id, messages)
+    assert redis_conn.hget(job_key, "sent") == b"1"
+
+    # The retried rest of the chunk: next(slots) now raises StopIteration
+    send_weekly_summary_chunk(job_id, messages[1:])
+
+    job = redis_conn.hgetall(job_key)
+    assert job[b"failed"] == b"1" and job[b"chunks_failed"] == b"1"
+    assert job[b"status"] == b"completed"
+
+    redis_conn.delete(job_key)
+
+
+def test_month_spending_facets(test_client):
+    """
+    GIVEN completed transactions this month and last month, and some that don't count
+    WHEN the /summary and /compare spend is aggregated
+    THEN check this month is grouped by category, largest first, next to last month's total
+    """
+    user_id = ObjectId()
+    transaction = {"user_id": user_id, "status": "completed"}
+    mongo.db.transactions.insert_many([
+        {**transaction, "amount": 300, "category": "Food & Dining", "date": datetime(2025, 3, 2)},
+        {**transaction, "amount": 200, "category": "Food & Dining", "date": datetime(2025, 3, 14)},
+        {**transaction, "amount": 1000, "category": "Travel", "date": datetime(2025, 3, 10)},
+        {**transaction, "amount": 700, "category": "Shopping", "date": datetime(2025, 2, 28)},
+        {**transaction, "amount": 999, "category": "Shopping", "date": datetime(2025, 1, 31)},
+        {**transaction, "amount": 50, "category": "Travel", "date": datetime(2025, 3, 5), "status": "processing"},
+    ])
+
+    spending = get_month_spending(user_id, datetime(2025, 3, 15))
+
+    assert spending["categories"] == [
+        {"_id": "Travel", "total": 1000, "count": 1},
+        {"_id": "Food & Dining", "total": 500, "count": 2},
+    ]
+    assert (spending["current_total"], spending["current_count"], spending["last_total"]) == (1500, 3, 700)
+
+    mongo.db.transactions.delete_many({"user_id": user_id})
+
+
+def test_fake_twilio_records_and_throttles():
+    """
+    GIVEN the fake Twilio Messages API used for load tests
+    WHEN messages are sent through it, with and without simulated throttling
+    THEN check accepted messages are recorded per recipient and throttled ones get a 429 with Retry-After
+    """
+    client = create_fake_twilio_app(latency_ms=0, jitter_ms=0).test_client()
+    send_url = '/2010-04-01/Accounts/AC123/Messages.json'
+
+    for to_number in ("whatsapp:+917058099532", "whatsapp:+917058099533"):
+        response = client.post(send_url, data={"From": "whatsapp:+14155238886", "To": to_number, "Body": "Hi"})
+        assert response.status_code == 201
+        assert response.get_json()["sid"].startswith("SM")
+
+    messages = client.get('/messages', query_string={"to": "whatsapp:+917058099532"}).get_json()["messages"]
+    assert [(m["to"], m["body"], m["index"]) for m in messages] == [("whatsapp:+917058099532", "Hi", 0)]
+
+    assert client.delete('/messages').status_code == 204
+    assert client.get('/messages').get_json()["messages"] == []
+
+    throttled = create_fake_twilio_app(latency_ms=0, jitter_ms=0, throttle_rate=1).test_client()
+    response = throttled.post(send_url, data={"To": "whatsapp:+917058099532", "Body": "Hi"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_status_callback_requires_signature(test_client, monkeypatch):
+    """
+    GIVEN an outbound message Twilio reported as sent
+    WHEN a status callback claims it failed, unsigned and then signed by Twilio
+    THEN check the unsigned one gets '403 Forbidden' and changes nothing, and the signed one is recorded
+    """
+    monkeypatch.setattr(twilio_service, "_loaded", True)
+    monkeypatch.setattr(twilio_service, "auth_token", "test-twilio-auth-token")
+    sid = f"SM{uuid.uuid4().hex}"
+    record_outbound_message(sid, "+917058099532", "Weekly summary", "sent")
+    form = {"MessageSid": sid, "MessageStatus": "failed", "ErrorCode": "63016"}
+
+    response = test_client.post('/webhook/status', data=form, headers={'X-Twilio-Signature': 'forged'})
+    assert response.status_code == 403
+    assert mongo.db.whatsapp_outbound.find_one({"_id": sid})["status"] == "sent"
+
+    signed = "http://localhost/webhook/status" + "".join(f"{k}{v}" for k, v in sorted(form.items()))
+    signature = base64.b64encode(hmac.new(b"test-twilio-auth-token", signed.encode(), hashlib.sha1).digest()).decode()
+    response = test_client.post('/webhook/status', data=form, headers={'X-Twilio-Signature': signature})
+    assert response.status_code == 200
+    assert mongo.db.whatsapp_outbound.find_one({"_id": sid})["status"] == "failed"
+
+    mongo.db.whatsapp_outbound.delete_one({"_id": sid})